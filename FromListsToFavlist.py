@@ -1,18 +1,130 @@
-import requests
-
-
+import asyncio
+import os
+import queue
 import re
+import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import parse_qs, urlparse
 
+from folder_index import FOLDER_INDEX_TTL, FolderIndex
+from folder_plan import FAV_CAPACITY, OVERFLOW_MODE, OVERFLOW_SPLIT, FolderPlan
+from listing_cache import CACHE_TTL
+from metrics import Metrics, PrintProgress
+from profiler import PhaseProfiler
+from rate_limiter import AdaptiveRateLimiter, RateLimitedSession
+from retry_queue import DEAD_LETTER_FILE, RETRY_DEADLINE, RetryQueue, append_dead_letters, load_dead_letters
+from transfer_journal import JOURNAL_DIR, TransferJournal
+from video_ids import ID_LIST_UID, id_source_key, is_id_source, iter_id_pages
+from video_record import KEEP_PIC, VideoRecord, video_from_archive
+
+
+API_BASE = "https://api.bilibili.com"
+
+# 单次batch-deal请求中包含的视频数量
+BATCH_DEAL_SIZE = 50
+
+# 合集列表每页视频数量，接口允许的最大值为SEASON_MAX_PAGE_SIZE
+SEASON_PAGE_SIZE = 30
+SEASON_MAX_PAGE_SIZE = 100
+
+# 视频列表每页视频数量和默认排序
+SERIES_PAGE_SIZE = 30
+SERIES_MAX_PAGE_SIZE = 100
+SERIES_SORT = 'desc'
+
+# 备用方法中个人空间合集列表每页数量
+SEASONS_SERIES_PAGE_SIZE = 20
+
+# 获取列表的接口及其对应的缓存类型
+ENDPOINT_KINDS = {
+    'season': 'season',
+    'season_backup': 'season',
+    'series': 'series',
+}
+ENDPOINT_NAMES = {
+    'season': '合集API',
+    'season_backup': '合集备用方法',
+    'series': '视频列表API',
+}
+
+# 并发获取列表页面时的线程数
+LIST_WORKERS = 4
+
+# 流式转移时列表获取和写入之间的队列长度（页）
+PIPELINE_QUEUE_PAGES = 8
+
+# 启动阶段并发执行的步骤数：登录验证和每个目标收藏夹各占一个
+STARTUP_WORKERS = 8
+
 
 class FromListsToFavlist:
-    def __init__(self, cookies):
+    def __init__(self, cookies, api_base=API_BASE, batch_size=BATCH_DEAL_SIZE,
+                 list_workers=LIST_WORKERS, rate_limiter=None,
+                 listing_cache=None, cache_ttl=CACHE_TTL, journal_dir=JOURNAL_DIR,
+                 series_sort=SERIES_SORT, metrics=None, progress=None,
+                 keep_pic=KEEP_PIC, fav_capacity=FAV_CAPACITY, overflow=OVERFLOW_MODE,
+                 transport=None, session_state=None, folder_index_ttl=FOLDER_INDEX_TTL,
+                 retry_deadline=RETRY_DEADLINE, dead_letter_file=DEAD_LETTER_FILE, profile=False,
+                 page_size=None, create_folders=False):
         """
         初始化
         :param cookies: B站登录后的cookies字符串
+        :param api_base: API根地址，可指向本地模拟服务器
+        :param batch_size: 批量添加收藏时每个请求包含的视频数量，<=1时逐个添加
+        :param list_workers: 并发获取列表页面时的线程数
+        :param rate_limiter: 共享的AdaptiveRateLimiter，默认为每个实例单独创建
+        :param listing_cache: ListingCache实例，为None时不缓存列表
+        :param cache_ttl: 列表缓存有效期（秒）
+        :param journal_dir: 转移日志目录，用于中断后继续
+        :param series_sort: 视频列表(series)的排序，'desc'最新在前，'asc'最早在前
+        :param metrics: Metrics实例，记录每个请求和转移各阶段的耗时，默认为每个实例单独创建
+        :param progress: 逐个视频的进度输出，默认为PrintProgress，可换成QuietProgress
+        :param keep_pic: 列表中是否保留封面地址，不保留时可用fetch_pic按需获取
+        :param fav_capacity: 每个收藏夹最多容纳的视频数
+        :param overflow: 收藏夹放不下时的处理，'stop'不写入超出的视频，'split'写入自动创建的续建收藏夹
+        :param transport: 配置连接池、超时、GET重试和压缩的Transport，默认使用transport.py中的设置
+        :param session_state: SessionState，保存轮换后的cookies和登录验证结果，为None时不保存
+        :param folder_index_ttl: 收藏夹名称索引的有效期（秒），索引同时缓存在listing_cache中
+        :param retry_deadline: 写入结束后重试暂时失败的视频的总时限（秒）
+        :param dead_letter_file: 最终仍然失败的视频追加到该文件，可以重放
+        :param profile: 是否对转移的每个阶段进行性能剖析，结果在self.profiler中
+        :param page_size: 获取列表时每页的视频数量，默认合集为SEASON_PAGE_SIZE、视频列表为SERIES_PAGE_SIZE，
+                          最大为SEASON_MAX_PAGE_SIZE/SERIES_MAX_PAGE_SIZE；服务器限制为更小的值时按服务器返回的数量分页
+        :param create_folders: 按名称指定的收藏夹不存在时是否创建，为False时报错
         """
-        self.session = requests.Session()
+        self.api_base = api_base.rstrip('/')
+        self.batch_size = batch_size
+        self.list_workers = list_workers
+        self.listing_cache = listing_cache
+        self.cache_ttl = cache_ttl
+        self.journal_dir = journal_dir
+        self.series_sort = series_sort
+        self.season_page_size = min(page_size or SEASON_PAGE_SIZE, SEASON_MAX_PAGE_SIZE)
+        self.series_page_size = min(page_size or SERIES_PAGE_SIZE, SERIES_MAX_PAGE_SIZE)
+        self.keep_pic = keep_pic
+        self.fav_capacity = fav_capacity
+        self.overflow = overflow
+        self.retry_deadline = retry_deadline
+        self.dead_letter_file = dead_letter_file
+        self.create_folders = create_folders
+        # 收藏夹ID -> 为它创建的续建收藏夹ID列表
+        self._continuations = {}
+        # (uid, 来源ID) -> 成功获取过列表的接口
+        self._source_endpoints = {}
+        # 按名称查找收藏夹的索引，_folder_index_listed表示本次运行中是否获取过完整列表
+        self.folder_index_ttl = folder_index_ttl
+        self._folder_index = None
+        self._folder_index_listed = False
+        self._folder_lock = threading.RLock()
+        self.metrics = metrics or Metrics()
+        self.profiler = None
+        if profile:
+            self.profiler = self.metrics.profiler = PhaseProfiler()
+        self.progress = progress or PrintProgress()
+        self.rate_limiter = rate_limiter or AdaptiveRateLimiter()
+        self.session = RateLimitedSession(self.rate_limiter, self.metrics, transport)
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
             'Referer': 'https://www.bilibili.com',
@@ -27,6 +139,33 @@ class FromListsToFavlist:
                     cookie_dict[key] = value
             self.session.cookies.update(cookie_dict)
 
+        # 服务器轮换的cookies覆盖上次保存的状态
+        self.session_state = session_state
+        if session_state is not None and session_state.load(cookies):
+            session_state.restore(self.session)
+        self._csrf = None
+        self.session.hooks['response'].append(self._on_response)
+
+    def _on_response(self, response, *args, **kwargs):
+        """
+        服务器设置新cookie时，去掉jar中同名但domain/path不同的旧cookie，避免同名cookie冲突
+        bili_jct轮换后重新读取csrf
+        """
+        for cookie in response.cookies:
+            for old in list(self.session.cookies):
+                if old.name == cookie.name and (old.domain, old.path) != (cookie.domain, cookie.path):
+                    self.session.cookies.clear(old.domain, old.path, old.name)
+            if cookie.name == 'bili_jct':
+                self._csrf = None
+        return response
+
+    def save_session_state(self):
+        """
+        cookies有变化时写回会话状态文件
+        """
+        if self.session_state is not None and self.session_state.changed(self.session):
+            self.session_state.save(self.session)
+
     def extract_season_info(self, collection_url):
         """
         从合集URL中提取用户ID和合集ID
@@ -74,115 +213,234 @@ class FromListsToFavlist:
                         "1. https://space.bilibili.com/用户ID/lists/合集ID?type=season\n"
                         "2. https://space.bilibili.com/用户ID/channel/seriesdetail?sid=合集ID")
 
+    @staticmethod
+    def fav_id_from_url(fav_url):
+        """
+        :return: 收藏夹URL中的收藏夹ID，不是带fid的URL时返回None
+        """
+        # 解析URL: https://space.bilibili.com/309874814/favlist?fid=3125287314&ftype=create
+        query_params = parse_qs(urlparse(fav_url).query)
+        return query_params['fid'][0] if 'fid' in query_params else None
+
     def extract_fav_info(self, fav_url):
         """
         从收藏夹URL中提取收藏夹ID
+        不是URL时作为收藏夹名称，在账号的收藏夹索引中查找，找不到时按create_folders决定是否创建
         """
-        # 解析URL: https://space.bilibili.com/309874814/favlist?fid=3125287314&ftype=create
-        parsed = urlparse(fav_url)
-        query_params = parse_qs(parsed.query)
-        if 'fid' in query_params:
-            return query_params['fid'][0]
-        else:
+        fav_id = self.fav_id_from_url(fav_url)
+        if fav_id is not None:
+            return fav_id
+        elif urlparse(fav_url).scheme or 'bilibili.com' in fav_url or not fav_url.strip():
             raise ValueError("无法解析收藏夹URL，请检查URL格式")
+        else:
+            return self.resolve_folder(fav_url.strip())
 
-    def get_season_videos(self, uid, season_id):
+    def get_season_videos(self, uid, season_id, page_size=None, status=None):
         """
         获取合集中的所有视频
+        :param page_size: 每页视频数量，最大为SEASON_MAX_PAGE_SIZE，默认使用初始化时的设置
+        :param status: 见iter_season_pages
         """
         videos = []
-        page = 1
-        page_size = 30
+        for page_videos in self.iter_season_pages(uid, season_id, page_size, status=status):
+            videos.extend(page_videos)
 
-        print(f"正在获取合集 {season_id} 中的视频...")
-
-        while True:
-            # 使用新的API端点
-            url = "https://api.bilibili.com/x/polymer/web-space/seasons_archives_list"
-            params = {
-                'mid': uid,
-                'season_id': season_id,
-                'sort_reverse': False,
-                'page_num': page,
-                'page_size': page_size
-            }
+        print(f"总共找到 {len(videos)} 个视频")
+        return videos
 
-            # 添加必要的headers
-            headers = {
-                'Referer': f'https://space.bilibili.com/{uid}/channel/seriesdetail?sid={season_id}',
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
+    def iter_season_pages(self, uid, season_id, page_size=None, use_backup=True, status=None):
+        """
+        逐页获取合集中的视频，每次yield一页的视频列表
+        根据第一页返回的总数和每页数量计算剩余页数，剩余页在线程池中预取并按合集顺序返回
+        :param page_size: 每页视频数量，最大为SEASON_MAX_PAGE_SIZE，默认使用初始化时的设置
+        :param use_backup: 第一页失败时是否尝试备用方法
+        :param status: 传入dict时写入 'total'（接口返回的总数）和 'complete'（是否获取到了全部视频）
+        """
+        page_size = min(page_size or self.season_page_size, SEASON_MAX_PAGE_SIZE)
+        status = {} if status is None else status
+        status.update(total=None, complete=False)
 
-            try:
-                response = self.session.get(url, params=params, headers=headers)
-                response.raise_for_status()
-                data = response.json()
+        print(f"正在获取合集 {season_id} 中的视频...")
 
-                if data['code'] != 0:
-                    print(f"获取合集视频失败: {data.get('message', '未知错误')}")
-                    # 如果新API失败，尝试备用方法
-                    return self.get_season_videos_backup(uid, season_id)
+        try:
+            data = self._fetch_season_page(uid, season_id, 1, page_size)
 
-                # 检查数据结构
-                if 'data' not in data or 'archives' not in data['data']:
-                    print("返回数据格式异常，尝试备用方法...")
-                    return self.get_season_videos_backup(uid, season_id)
+            if data['code'] != 0:
+                print(f"获取合集视频失败: {data.get('message', '未知错误')}")
+                # 如果新API失败，尝试备用方法
+                data = None
 
-                archives = data['data']['archives']
-                if not archives:
-                    break
+            # 检查数据结构
+            elif 'data' not in data or 'archives' not in data['data']:
+                print("返回数据格式异常，尝试备用方法...")
+                data = None
 
-                for video in archives:
-                    videos.append({
-                        'bvid': video['bvid'],
-                        'aid': video['aid'],
-                        'title': video['title'],
-                        'pic': video['pic'],
-                        'duration': video['duration']
-                    })
-                    print(f"找到视频: {video['title']} (BV{video['bvid']})")
-
-                # 如果返回的视频数量少于请求的数量，说明已经到最后一页
-                if len(archives) < page_size:
+        except Exception as e:
+            print(f"获取第1页视频时出错: {str(e)}")
+            # 如果第一页就失败，尝试备用方法
+            print("尝试备用方法...")
+            data = None
+
+        if data is None:
+            if use_backup:
+                videos = self.get_season_videos_backup(uid, season_id, status)
+                if videos:
+                    yield videos
+            return
+
+        archives = data['data']['archives'] or []
+        yield self._page_videos(archives)
+        page_info = data['data'].get('page') or {}
+        total = page_info.get('total')
+        served = self._served_page_size(page_info.get('page_size'), total, archives, page_size)
+        status.update(total=total, complete=True)
+        count = len(archives)
+
+        if total is None:
+            # 没有返回总数时逐页获取，直到返回的视频数量少于每页数量
+            page = 2
+            while archives and len(archives) == served:
+                try:
+                    archives = self._season_page_archives(uid, season_id, page, page_size)
+                except Exception as e:
+                    print(f"获取第{page}页视频时出错: {str(e)}")
+                    status['complete'] = False
                     break
-
+                if archives:
+                    count += len(archives)
+                    yield self._page_videos(archives)
                 page += 1
-                time.sleep(0.5)  # 避免请求过快
+        else:
+            page_count = -(-total // served)
+            if page_count > 1 and len(archives) == served:
+                for archives in self._iter_pages_concurrently(
+                        lambda page: self._season_page_archives(uid, season_id, page, page_size),
+                        page_count, status):
+                    count += len(archives)
+                    yield self._page_videos(archives)
+            if count < total:
+                status['complete'] = False
+
+    def _page_videos(self, archives):
+        """
+        将一页archive转换为视频列表
+        """
+        videos = []
+        for video in archives:
+            videos.append(video_from_archive(video, self.keep_pic))
+            self.progress.found(video)
+        return videos
 
-            except Exception as e:
-                print(f"获取第{page}页视频时出错: {str(e)}")
-                if page == 1:  # 如果第一页就失败，尝试备用方法
-                    print("尝试备用方法...")
-                    return self.get_season_videos_backup(uid, season_id)
-                break
+    @staticmethod
+    def _served_page_size(reported, total, archives, page_size):
+        """
+        服务器实际使用的每页数量
+        服务器可能把请求的每页数量限制为更小的值，此时按它返回的每页数量分页；
+        没有返回每页数量时，第一页少于请求的数量但总数更多说明被限制，按第一页的数量分页
+        :param reported: 接口返回的每页数量，没有时为None
+        """
+        if reported:
+            return int(reported)
+        if archives and total is not None and len(archives) < min(total, page_size):
+            return len(archives)
+        return page_size
 
-        print(f"总共找到 {len(videos)} 个视频")
-        return videos
+    def _fetch_season_page(self, uid, season_id, page, page_size, reverse=False):
+        """
+        请求合集的某一页，返回原始JSON
+        :param reverse: 为True时按倒序返回，最新的视频在前
+        """
+        url = f"{self.api_base}/x/polymer/web-space/seasons_archives_list"
+        params = {
+            'mid': uid,
+            'season_id': season_id,
+            'sort_reverse': reverse,
+            'page_num': page,
+            'page_size': page_size
+        }
+
+        # 添加必要的headers
+        headers = {
+            'Referer': f'https://space.bilibili.com/{uid}/channel/seriesdetail?sid={season_id}',
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+        }
+
+        response = self.session.get(url, params=params, headers=headers)
+        response.raise_for_status()
+        return response.json()
+
+    def _season_page_archives(self, uid, season_id, page, page_size):
+        """
+        获取合集某一页的视频列表，接口返回错误时抛出异常
+        """
+        data = self._fetch_season_page(uid, season_id, page, page_size)
+        if data['code'] != 0:
+            raise RuntimeError(data.get('message', '未知错误'))
+        return data['data']['archives'] or []
 
-    def get_season_videos_backup(self, uid, season_id):
+    def _iter_pages_concurrently(self, fetch_page, page_count, status=None):
+        """
+        在有限大小的线程池中并发获取第2页到第page_count页，按页码顺序逐页返回
+        最多预取list_workers*2页，某一页失败时停止，与逐页获取的行为一致
+        :param status: 某一页失败时把其中的 'complete' 设为False
+        """
+        pending = deque()
+        next_page = 2
+        if self.profiler is not None:
+            fetch_page = self.profiler.wrap('list', fetch_page)
+        with ThreadPoolExecutor(max_workers=self.list_workers) as executor:
+            try:
+                while pending or next_page <= page_count:
+                    while next_page <= page_count and len(pending) < self.list_workers * 2:
+                        pending.append((next_page, executor.submit(fetch_page, next_page)))
+                        next_page += 1
+
+                    page, future = pending.popleft()
+                    try:
+                        archives = future.result()
+                    except Exception as e:
+                        print(f"获取第{page}页视频时出错: {str(e)}")
+                        if status is not None:
+                            status['complete'] = False
+                        return
+                    yield archives
+            finally:
+                for _, future in pending:
+                    future.cancel()
+
+    def get_season_videos_backup(self, uid, season_id, status=None):
         """
         备用的获取合集视频方法
+        逐页查找个人空间的合集列表，直到找到目标合集或翻完所有页
+        :param status: 传入dict时写入 'total' 和 'complete'，见iter_season_pages
         """
+        status = {} if status is None else status
+        status.update(total=None, complete=False)
         videos = []
         print(f"使用备用方法获取合集 {season_id} 中的视频...")
 
         try:
             # 尝试通过个人空间页面获取合集信息
-            url = "https://api.bilibili.com/x/polymer/web-space/home/seasons_series"
-            params = {
-                'mid': uid,
-                'page_num': 1,
-                'page_size': 10
-            }
+            url = f"{self.api_base}/x/polymer/web-space/home/seasons_series"
+            page = 1
+
+            while True:
+                params = {
+                    'mid': uid,
+                    'page_num': page,
+                    'page_size': SEASONS_SERIES_PAGE_SIZE
+                }
 
-            response = self.session.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
+                response = self.session.get(url, params=params)
+                response.raise_for_status()
+                data = response.json()
+
+                if data['code'] != 0 or not data.get('data'):
+                    break
 
-            if data['code'] == 0 and 'data' in data:
                 # 寻找目标合集
-                items_lists = data['data'].get('items_lists', {})
-                seasons_list = items_lists.get('seasons_list', [])
+                items_lists = data['data'].get('items_lists') or {}
+                seasons_list = items_lists.get('seasons_list') or []
 
                 target_season = None
                 for season in seasons_list:
@@ -193,111 +451,855 @@ class FromListsToFavlist:
                 if target_season:
                     archives = target_season.get('archives', [])
                     for video in archives:
-                        videos.append({
-                            'bvid': video['bvid'],
-                            'aid': video['aid'],
-                            'title': video['title'],
-                            'pic': video['pic'],
-                            'duration': video['duration']
-                        })
-                        print(f"找到视频: {video['title']} (BV{video['bvid']})")
+                        videos.append(video_from_archive(video, self.keep_pic))
+                        self.progress.found(video)
+                    total = (target_season.get('meta') or {}).get('total')
+                    status.update(total=total, complete=total is not None and len(videos) >= total)
+                    break
+
+                # 合集和视频列表都翻完时停止
+                total = (items_lists.get('page') or {}).get('total', 0)
+                if not seasons_list or page * SEASONS_SERIES_PAGE_SIZE >= total:
+                    break
+                page += 1
 
         except Exception as e:
             print(f"备用方法也失败了: {str(e)}")
 
-    def get_series_videos(self, uid, series_id):
+        return videos
+
+    def get_series_videos(self, uid, series_id, sort=None, page_size=None, status=None):
         """
         获取视频列表(series)中的所有视频
+        :param sort: 'desc'为最新的视频在前，'asc'为最早的视频在前，默认使用初始化时的设置
+        :param page_size: 每页视频数量，最大为SERIES_MAX_PAGE_SIZE，默认使用初始化时的设置
+        :param status: 见iter_season_pages
         """
         videos = []
+        for page_videos in self.iter_series_pages(uid, series_id, sort, page_size, status):
+            videos.extend(page_videos)
+
+        print(f"视频列表方法找到 {len(videos)} 个视频")
+        return videos
+
+    def iter_series_pages(self, uid, series_id, sort=None, page_size=None, status=None):
+        """
+        逐页获取视频列表(series)中的视频，每次yield一页的视频列表
+        根据第一页返回的总数和每页数量计算剩余页数，剩余页在线程池中预取并按顺序返回
+        :param status: 见iter_season_pages
+        """
+        sort = sort or self.series_sort
+        page_size = min(page_size or self.series_page_size, SERIES_MAX_PAGE_SIZE)
+        status = {} if status is None else status
+        status.update(total=None, complete=False)
+
         print(f"尝试作为视频列表获取 {series_id} 中的视频...")
 
         try:
-            url = "https://api.bilibili.com/x/series/archives"
+            data = self._fetch_series_page(uid, series_id, 1, page_size, sort)
+        except Exception as e:
+            print(f"获取视频列表失败: {str(e)}")
+            return
+
+        if data['code'] != 0 or not data.get('data'):
+            return
+
+        archives = data['data'].get('archives') or []
+        if not archives:
+            return
+        yield self._page_videos(archives)
+
+        page_info = data['data'].get('page') or {}
+        total = page_info.get('total')
+        served = self._served_page_size(page_info.get('size'), total, archives, page_size)
+        status.update(total=total, complete=True)
+        count = len(archives)
+        if total is None:
+            # 没有返回总数时逐页获取，直到返回的视频数量少于每页数量
+            page = 2
+            while len(archives) == served:
+                try:
+                    archives = self._series_page_archives(uid, series_id, page, page_size, sort)
+                except Exception as e:
+                    print(f"获取第{page}页视频时出错: {str(e)}")
+                    status['complete'] = False
+                    break
+                if not archives:
+                    break
+                count += len(archives)
+                yield self._page_videos(archives)
+                page += 1
+        else:
+            page_count = -(-total // served)
+            if page_count > 1 and len(archives) == served:
+                for archives in self._iter_pages_concurrently(
+                        lambda page: self._series_page_archives(uid, series_id, page, page_size, sort),
+                        page_count, status):
+                    count += len(archives)
+                    yield self._page_videos(archives)
+            if count < total:
+                status['complete'] = False
+
+    def _fetch_series_page(self, uid, series_id, page, page_size, sort='desc'):
+        """
+        请求视频列表的某一页，返回原始JSON
+        :param sort: 'desc'为最新的视频在前，'asc'为最早的视频在前
+        """
+        url = f"{self.api_base}/x/series/archives"
+        params = {
+            'mid': uid,
+            'series_id': series_id,
+            'only_normal': True,
+            'sort': sort,
+            'pn': page,
+            'ps': page_size
+        }
+
+        response = self.session.get(url, params=params)
+        response.raise_for_status()
+        return response.json()
+
+    def _series_page_archives(self, uid, series_id, page, page_size, sort):
+        """
+        获取视频列表某一页的视频，接口返回错误时抛出异常
+        """
+        data = self._fetch_series_page(uid, series_id, page, page_size, sort)
+        if data['code'] != 0:
+            raise RuntimeError(data.get('message', '未知错误'))
+        return data['data'].get('archives') or []
+
+    def get_collection_videos(self, uid, source_id, force_refresh=False, url_kind=None, status=None):
+        """
+        获取合集或视频列表中的视频，启用缓存时优先使用本地缓存
+        缓存未过期时不发送请求，过期后只获取最新的几页直到遇到已知视频
+        :param force_refresh: 忽略缓存，重新获取完整列表
+        :param url_kind: 从URL判断出的类型，见classify_source_url
+        :param status: 见iter_collection_pages
+        """
+        videos = []
+        for page_videos in self.iter_collection_pages(uid, source_id, force_refresh, url_kind, status):
+            videos.extend(page_videos)
+        return videos
+
+    def iter_collection_pages(self, uid, source_id, force_refresh=False, url_kind=None, status=None):
+        """
+        逐页获取合集或视频列表中的视频
+        使用缓存时整个列表作为一页返回；否则按source_endpoints的顺序尝试各个接口，
+        边获取边写入缓存，获取到接口返回的全部视频后才完成缓存并记住成功的接口
+        :param status: 传入dict时写入 'total' 和 'complete'，列表不完整时调用方不应把转移标记为完成
+        """
+        status = {} if status is None else status
+        status.update(total=None, complete=False)
+        if self.listing_cache is not None and not force_refresh:
+            for kind in ('season', 'series'):
+                cached = self.listing_cache.load(uid, kind, source_id)
+                if cached is not None:
+                    videos = self._refresh_cached_listing(uid, source_id, kind, cached, status)
+                    if videos:
+                        yield videos
+                    return
+
+        for endpoint in self.source_endpoints(uid, source_id, url_kind, use_remembered=not force_refresh):
+            kind = ENDPOINT_KINDS[endpoint]
+            count = 0
+            if endpoint == 'season':
+                pages = self.iter_season_pages(uid, source_id, use_backup=False, status=status)
+            elif endpoint == 'season_backup':
+                pages = iter([self.get_season_videos_backup(uid, source_id, status)])
+            else:
+                pages = self.iter_series_pages(uid, source_id, status=status)
+
+            for page_videos in pages:
+                if not page_videos:
+                    continue
+                count = self._cache_page(uid, kind, source_id, page_videos, count)
+                yield page_videos
+
+            if count:
+                if not status['complete']:
+                    # 中途失败时不完成缓存，下次运行重新获取
+                    print(f"{ENDPOINT_NAMES[endpoint]}只获取到 {count}/{status['total'] or '?'} 个视频，"
+                          f"列表不完整，不写入缓存")
+                    return
+                self.remember_source_endpoint(uid, source_id, endpoint)
+                if self.listing_cache is not None:
+                    self.listing_cache.finish(uid, kind, source_id, status['total'])
+                return
+
+            print(f"{ENDPOINT_NAMES[endpoint]}获取失败，尝试下一个接口...")
+
+    def classify_source_url(self, collection_url):
+        """
+        根据URL判断来源类型
+        :return: 'season'(合集)、'series'(视频列表)，无法判断时返回None
+        """
+        parsed = urlparse(collection_url)
+        query_params = parse_qs(parsed.query)
+        source_type = query_params.get('type', [''])[0]
+
+        if '/lists/' in parsed.path and source_type in ('season', 'series'):
+            return source_type
+        if 'seriesdetail' in parsed.path:
+            return 'series'
+        if 'collectiondetail' in parsed.path:
+            return 'season'
+        return None
+
+    def source_endpoints(self, uid, source_id, url_kind=None, use_remembered=True):
+        """
+        获取列表时依次尝试的接口
+        优先使用之前成功过的接口，其次按URL类型排序，其余接口作为后备
+        备用方法只返回合集的前几个视频，只作为后备，不会被优先使用
+        :param use_remembered: 为False时不使用之前记住的接口，例如强制刷新时
+        """
+        remembered = None
+        if use_remembered:
+            remembered = self._source_endpoints.get((str(uid), str(source_id)))
+            if remembered is None and self.listing_cache is not None:
+                remembered = self.listing_cache.get_endpoint(uid, source_id)
+                if remembered is not None:
+                    self._source_endpoints[(str(uid), str(source_id))] = remembered
+
+        if url_kind == 'series':
+            order = ['series', 'season', 'season_backup']
+        else:
+            order = ['season', 'season_backup', 'series']
+
+        if remembered in order and remembered != 'season_backup':
+            order.remove(remembered)
+            order.insert(0, remembered)
+        return order
+
+    def remember_source_endpoint(self, uid, source_id, endpoint):
+        """
+        记住某个来源成功使用的接口，启用缓存时同时写入磁盘
+        备用方法不记录：它成功通常只是合集API暂时失败
+        """
+        if endpoint == 'season_backup':
+            return
+        key = (str(uid), str(source_id))
+        if self._source_endpoints.get(key) == endpoint:
+            return
+        self._source_endpoints[key] = endpoint
+        if self.listing_cache is not None:
+            self.listing_cache.set_endpoint(uid, source_id, endpoint)
+
+    def _cache_page(self, uid, kind, source_id, videos, count):
+        """
+        将一页视频追加到缓存
+        :param count: 之前已缓存的视频数量
+        :return: 追加后的视频数量
+        """
+        if self.listing_cache is not None:
+            if not count:
+                self.listing_cache.begin(uid, kind, source_id)
+            self.listing_cache.append(uid, kind, source_id, count, videos)
+        return count + len(videos)
+
+    def _refresh_cached_listing(self, uid, source_id, kind, cached, status=None):
+        """
+        根据缓存增量刷新列表，无法增量刷新时重新获取完整列表
+        :param status: 见iter_collection_pages
+        """
+        status = {} if status is None else status
+        age = time.time() - cached.fetched_at
+        if age < self.cache_ttl:
+            print(f"使用缓存的视频列表 ({len(cached.videos)} 个视频, {int(age)} 秒前更新)")
+            status.update(total=cached.total, complete=True)
+            return cached.videos
+
+        print(f"增量刷新缓存的视频列表 {source_id}...")
+        known_aids = {video['aid'] for video in cached.videos}
+        new_videos, total = self._fetch_newest_videos(uid, source_id, kind, known_aids)
+
+        if new_videos is not None:
+            # 新视频按最新在前的顺序返回，正序的列表追加在末尾，倒序的视频列表插入在开头
+            if kind == 'season' or self.series_sort == 'asc':
+                videos = cached.videos + new_videos[::-1]
+            else:
+                videos = new_videos + cached.videos
+
+            # 总数对不上说明有视频被删除或调整，需要完整刷新
+            if total is None or total == len(videos):
+                print(f"新增 {len(new_videos)} 个视频，共 {len(videos)} 个视频")
+                self.listing_cache.save(uid, kind, source_id, videos, total)
+                status.update(total=total, complete=True)
+                return videos
+
+        print("无法增量刷新，重新获取完整列表...")
+        if kind == 'season':
+            videos = self.get_season_videos(uid, source_id, status=status)
+        else:
+            videos = self.get_series_videos(uid, source_id, status=status)
+        if videos and status['complete']:
+            self.listing_cache.save(uid, kind, source_id, videos, status['total'])
+        elif videos:
+            print(f"只获取到 {len(videos)}/{status['total'] or '?'} 个视频，列表不完整，不更新缓存")
+        return videos
+
+    def _fetch_newest_videos(self, uid, source_id, kind, known_aids):
+        """
+        按最新在前的顺序逐页获取，直到遇到已知的视频
+        :return: (新视频列表, 接口返回的总数)，失败时返回 (None, None)
+        """
+        new_videos = []
+        page = 1
+
+        try:
+            while True:
+                if kind == 'season':
+                    page_size = self.season_page_size
+                    data = self._fetch_season_page(uid, source_id, page, page_size, reverse=True)
+                else:
+                    page_size = self.series_page_size
+                    data = self._fetch_series_page(uid, source_id, page, page_size, sort='desc')
+
+                if data['code'] != 0:
+                    print(f"增量刷新失败: {data.get('message', '未知错误')}")
+                    return None, None
+
+                archives = data['data'].get('archives') or []
+                page_info = data['data'].get('page') or {}
+                total = page_info.get('total')
+                if page == 1:
+                    page_size = self._served_page_size(page_info.get('page_size') or page_info.get('size'),
+                                                       total, archives, page_size)
+
+                for video in archives:
+                    if video['aid'] in known_aids:
+                        return new_videos, total
+                    new_videos.append(video_from_archive(video, self.keep_pic))
+                    self.progress.found(video)
+
+                if len(archives) < page_size:
+                    return new_videos, total
+                page += 1
+
+        except Exception as e:
+            print(f"增量刷新失败: {str(e)}")
+            return None, None
+
+    def get_favorite_ids(self, fav_id):
+        """
+        一次性获取收藏夹中所有视频的aid
+        :return: aid集合，获取失败时返回None
+        """
+        try:
+            url = f"{self.api_base}/x/v3/fav/resource/ids"
             params = {
-                'mid': uid,
-                'series_id': series_id,
-                'only_normal': True,
-                'sort': 'desc',
-                'pn': 1,
-                'ps': 30
+                'media_id': fav_id,
+                'platform': 'web'
             }
 
             response = self.session.get(url, params=params)
             response.raise_for_status()
             data = response.json()
 
-            if data['code'] == 0 and 'data' in data:
-                archives = data['data'].get('archives', [])
-                for video in archives:
-                    videos.append({
-                        'bvid': video['bvid'],
-                        'aid': video['aid'],
-                        'title': video['title'],
-                        'pic': video['pic'],
-                        'duration': video['duration']
-                    })
-                    print(f"找到视频: {video['title']} (BV{video['bvid']})")
+            if data['code'] != 0:
+                print(f"获取收藏夹内容失败: {data.get('message', '未知错误')}")
+                return None
+
+            # type为2的资源是视频，id即aid
+            return {item['id'] for item in data['data'] or [] if item.get('type') == 2}
 
         except Exception as e:
-            print(f"获取视频列表失败: {str(e)}")
+            print(f"获取收藏夹内容失败: {str(e)}")
+            return None
 
-        print(f"视频列表方法找到 {len(videos)} 个视频")
-        return videos
+    def get_folder_info(self, fav_id):
+        """
+        获取收藏夹信息
+        :return: 包含title和media_count的dict，失败时返回None
+        """
+        try:
+            url = f"{self.api_base}/x/v3/fav/folder/info"
+            response = self.session.get(url, params={'media_id': fav_id})
+            response.raise_for_status()
+            data = response.json()
 
-    def add_to_favorites(self, fav_id, videos):
+            if data['code'] != 0 or not data.get('data'):
+                print(f"获取收藏夹信息失败: {data.get('message', '未知错误')}")
+                return None
+            return data['data']
+
+        except Exception as e:
+            print(f"获取收藏夹信息失败: {str(e)}")
+            return None
+
+    def create_folder(self, title, intro='', privacy=0):
+        """
+        创建收藏夹
+        :param privacy: 0为公开，1为私密
+        :return: 新收藏夹的ID，失败时返回None
+        """
+        try:
+            url = f"{self.api_base}/x/v3/fav/folder/add"
+            data = {
+                'title': title,
+                'intro': intro,
+                'privacy': privacy,
+                'cover': '',
+                'csrf': self.get_csrf_token()
+            }
+
+            response = self.session.post(url, data=data)
+            response.raise_for_status()
+            result = response.json()
+
+            if result['code'] != 0:
+                print(f"创建收藏夹失败: {result.get('message', '未知错误')}")
+                return None
+            folder_id = str(result['data']['id'])
+            self._index_folder(folder_id, title)
+            return folder_id
+
+        except Exception as e:
+            print(f"创建收藏夹失败: {str(e)}")
+            return None
+
+    def account_mid(self):
+        """
+        :return: 当前账号的UID，优先使用cookies中的DedeUserID，其次使用缓存的登录验证结果
+        """
+        mid = self.session.cookies.get('DedeUserID')
+        if not mid and self.session_state is not None and self.session_state.nav:
+            mid = self.session_state.nav.get('mid')
+        return str(mid) if mid else None
+
+    def fetch_folders(self, up_mid):
+        """
+        一次请求获取账号创建的所有收藏夹
+        :return: [(收藏夹ID, 名称, 视频数)]，失败时返回None
+        """
+        try:
+            url = f"{self.api_base}/x/v3/fav/folder/created/list-all"
+            response = self.session.get(url, params={'up_mid': up_mid, 'type': 2})
+            response.raise_for_status()
+            data = response.json()
+
+            if data['code'] != 0:
+                print(f"获取收藏夹列表失败: {data.get('message', '未知错误')}")
+                return None
+            return [(str(folder['id']), folder['title'], folder.get('media_count', 0))
+                    for folder in (data.get('data') or {}).get('list') or []]
+
+        except Exception as e:
+            print(f"获取收藏夹列表失败: {str(e)}")
+            return None
+
+    def folder_index(self, refresh=False):
+        """
+        当前账号的收藏夹索引：依次使用内存中的索引、磁盘缓存，都已过期时重新获取
+        :param refresh: 忽略缓存，重新获取收藏夹列表
+        :return: FolderIndex，获取失败时返回None
+        """
+        with self._folder_lock:
+            index = self._folder_index
+            if not refresh and index is not None and index.fresh():
+                return index
+
+            up_mid = self.account_mid()
+            if up_mid is None:
+                print("无法确定账号UID，不能按名称查找收藏夹")
+                return None
+
+            if not refresh and index is None and self.listing_cache is not None:
+                cached = self.listing_cache.load_folders(up_mid)
+                if cached is not None:
+                    index = FolderIndex(up_mid, cached[0], cached[1], self.folder_index_ttl)
+                    if index.fresh():
+                        self._folder_index = index
+                        return index
+
+            folders = self.fetch_folders(up_mid)
+            if folders is None:
+                return None
+            index = FolderIndex(up_mid, folders, ttl=self.folder_index_ttl)
+            if self.listing_cache is not None:
+                self.listing_cache.save_folders(up_mid, folders, index.fetched_at)
+            self._folder_index = index
+            self._folder_index_listed = True
+            return index
+
+    def _index_folder(self, folder_id, title):
+        """
+        把新创建的收藏夹加入已有的索引，不需要重新获取收藏夹列表
+        """
+        with self._folder_lock:
+            index = self._folder_index
+            if index is None:
+                return
+            index.add(folder_id, title)
+            if self.listing_cache is not None:
+                self.listing_cache.add_folder(index.up_mid, folder_id, title)
+
+    def resolve_folder(self, name, create=None):
+        """
+        按名称（或ID）查找收藏夹，找不到时可以创建
+        使用磁盘缓存的索引找不到时先重新获取一次列表，避免重复创建在其他地方新建的收藏夹
+        :param create: 找不到时是否创建，默认使用初始化时的create_folders
+        :return: 收藏夹ID
+        """
+        if create is None:
+            create = self.create_folders
+        with self._folder_lock:
+            index = self.folder_index()
+            folder = index.find(name) if index is not None else None
+            if folder is None and not self._folder_index_listed:
+                index = self.folder_index(refresh=True)
+                folder = index.find(name) if index is not None else None
+            if index is None:
+                raise ValueError(f"无法获取收藏夹列表，不能解析收藏夹名称: {name}")
+            if folder is not None:
+                return folder[0]
+            if not create:
+                raise ValueError(f"找不到收藏夹: {name}，确认名称无误后可以用 --create 创建")
+
+            print(f"收藏夹 {name} 不存在，正在创建...")
+            folder_id = self.create_folder(name)
+            if folder_id is None:
+                raise ValueError(f"创建收藏夹失败: {name}")
+            print(f"✅ 已创建收藏夹 {name} (ID: {folder_id})")
+            return folder_id
+
+    def continuation_folders(self, fav_id):
+        """
+        :return: 之前为该收藏夹创建的续建收藏夹ID列表
+        """
+        key = str(fav_id)
+        if key not in self._continuations:
+            self._continuations[key] = (self.listing_cache.get_continuations(fav_id)
+                                        if self.listing_cache is not None else [])
+        return self._continuations[key]
+
+    def _add_continuation(self, fav_id, folder_id):
+        """
+        记住新创建的续建收藏夹，启用缓存时同时写入磁盘，以后的运行继续使用它
+        """
+        self.continuation_folders(fav_id).append(folder_id)
+        if self.listing_cache is not None:
+            self.listing_cache.add_continuation(fav_id, folder_id)
+
+    def plan_folder(self, fav_id):
+        """
+        读取目标收藏夹及其续建收藏夹的现有数量，计算还能放下多少视频
+        :return: FolderPlan，无法获取收藏夹信息时返回None（不做容量规划）
+        """
+        info = self.get_folder_info(fav_id)
+        if info is None:
+            return None
+
+        title = info.get('title', str(fav_id))
+        continuations = []
+        for folder_id in self.continuation_folders(fav_id):
+            folder_info = self.get_folder_info(folder_id)
+            if folder_info is not None:
+                continuations.append((folder_id, folder_info.get('media_count', 0)))
+
+        def create(number):
+            folder_id = self.create_folder(f"{title}-{number}", f"收藏夹 {title} 的续建收藏夹")
+            if folder_id is not None:
+                print(f"收藏夹 {title} 已满，已创建续建收藏夹 {title}-{number} (ID={folder_id})")
+                self._add_continuation(fav_id, folder_id)
+            return folder_id
+
+        plan = FolderPlan(str(fav_id), title, info.get('media_count', 0), self.fav_capacity,
+                          self.overflow, continuations, create)
+        print(f"收藏夹 {title}: 现有 {info.get('media_count', 0)} 个视频，"
+              f"还可添加 {plan.free()} 个" + (f"（含 {len(continuations)} 个续建收藏夹）" if continuations else ""))
+        return plan
+
+    def assign_folders(self, fav_id, videos, plan=None):
+        """
+        按容量规划把视频分配到目标收藏夹和续建收藏夹，放不下的视频不写入
+        :param plan: FolderPlan，为None时把全部视频分配给fav_id
+        :return: [(收藏夹ID, 视频列表)]
+        """
+        if plan is None:
+            return [(fav_id, videos)] if videos else []
+
+        groups = {}
+        overflowed = 0
+        for video in videos:
+            folder_id = plan.assign()
+            if folder_id is None:
+                overflowed += 1
+            else:
+                groups.setdefault(folder_id, []).append(video)
+        if overflowed:
+            print(f"收藏夹 {plan.title} 已满，{overflowed} 个视频未添加")
+        return list(groups.items())
+
+    def _existing_ids(self, fav_id, plan=None, fetched=None):
+        """
+        读取目标收藏夹和它的续建收藏夹中已有视频的aid
+        :param fetched: {收藏夹ID: 已经获取的aid集合或None}，其中没有的收藏夹在这里获取
+        """
+        fetched = fetched or {}
+        existing = set()
+        for folder_id in (plan.folder_ids() if plan is not None else [fav_id]):
+            folder_id = str(folder_id)
+            folder_existing = fetched[folder_id] if folder_id in fetched else self.get_favorite_ids(folder_id)
+            if folder_existing is None:
+                print(f"无法获取收藏夹 {folder_id} 现有内容，将尝试添加全部视频")
+            else:
+                existing |= folder_existing
+        return existing
+
+    def add_to_favorites(self, fav_id, videos, batch_size=None, journal=None, plan=None):
         """
         将视频添加到收藏夹
+        暂时失败的视频在最后重试，最终仍然失败的视频追加到死信文件
+        :param fav_id: 收藏夹ID，为列表时每个请求同时写入其中所有收藏夹
+        :param batch_size: 每个批量请求包含的视频数量，默认使用初始化时的设置
+        :param journal: TransferJournal，每个视频最终的结果确定后立即记录
+        :param plan: 目标收藏夹的FolderPlan，超出容量的视频按plan的方式处理
         """
-        success_count = 0
-        failed_count = 0
+        if batch_size is None:
+            batch_size = self.batch_size
+        if isinstance(fav_id, (list, tuple)):
+            fav_id = ','.join(str(target) for target in fav_id)
+
+        counts = [0, 0]
+        record = self.make_recorder(counts, journal)
+        retries = self.retry_queue()
+        groups = self.assign_folders(fav_id, videos, plan)
+        total = sum(len(group) for _, group in groups)
+
+        offset = 0
+        for folder_id, group in groups:
+            print(f"开始将视频添加到收藏夹 {folder_id}...")
+
+            if batch_size <= 1:
+                self.write_chunk(folder_id, group, offset, total, record, batch=False, retries=retries)
+            else:
+                for start in range(0, len(group), batch_size):
+                    self.write_chunk(folder_id, group[start:start + batch_size], offset + start, total, record,
+                                      retries=retries)
+            offset += len(group)
 
-        print(f"开始将视频添加到收藏夹 {fav_id}...")
+        self.drain_retries(retries, batch_size > 1)
+        print(f"\n转移完成! 成功: {counts[0]}, 失败: {counts[1]}")
+        return counts[0], counts[1]
 
-        for i, video in enumerate(videos, 1):
-            try:
-                url = "https://api.bilibili.com/x/v3/fav/resource/deal"
-                data = {
-                    'rid': video['aid'],
-                    'type': 2,  # 视频类型
-                    'add_media_ids': fav_id,
-                    'del_media_ids': '',
-                    'csrf': self.get_csrf_token()
-                }
+    def make_recorder(self, counts, journal):
+        """
+        创建记录单个视频结果的回调，更新 counts=[成功数, 失败数] 并写入日志
+        回调可以在多个线程中调用，同一时间只有一个线程记录
+        """
+        lock = threading.Lock()
 
-                response = self.session.post(url, data=data)
-                response.raise_for_status()
-                result = response.json()
+        def record(video, ok):
+            with lock:
+                counts[0 if ok else 1] += 1
+                if journal is not None:
+                    journal.record(video['aid'], ok)
+        return record
 
-                if result['code'] == 0:
-                    print(f"[{i}/{len(videos)}] 成功添加: {video['title']}")
-                    success_count += 1
-                else:
-                    print(f"[{i}/{len(videos)}] 添加失败: {video['title']} - {result['message']}")
-                    failed_count += 1
+    def retry_queue(self):
+        """
+        :return: 使用本实例重试时限的RetryQueue，死信中记录当前账号的UID
+        """
+        return RetryQueue(deadline=self.retry_deadline, mid=self.account_mid(), progress=self.progress)
+
+    def drain_retries(self, retries, batch=True, path=None):
+        """
+        重试队列中暂时失败的视频，并把最终失败的视频追加到死信文件
+        :param path: 死信文件，默认为初始化时的设置
+        """
+        if len(retries):
+            with self.metrics.phase('retry'):
+                retries.drain(self, batch)
+        written = retries.write_dead_letters(path or self.dead_letter_file)
+        if written:
+            print(f"{written} 个失败的视频已写入 {path or self.dead_letter_file}，可以用 --replay 重新添加")
+
+    def replay_dead_letters(self, path=None):
+        """
+        重新添加死信文件中的视频，直接写入原来的收藏夹，不做容量规划
+        只重放当前账号的死信（没有记录账号的旧死信视为当前账号），其他账号的死信原样保留
+        仍然失败的视频写回死信文件，没有剩余的死信时删除该文件
+        :param path: 死信文件，默认为初始化时的设置
+        :return: (成功数, 失败数)
+        """
+        path = path or self.dead_letter_file
+        if not os.path.exists(path):
+            print(f"死信文件 {path} 不存在，没有需要重新添加的视频")
+            return 0, 0
+        mid = self.account_mid()
+        entries, others = [], []
+        for entry in load_dead_letters(path):
+            if mid and entry.get('mid') and str(entry['mid']) != mid:
+                others.append(entry)
+            else:
+                entries.append(entry)
+        print(f"从 {path} 读取到 {len(entries)} 个失败的视频")
+        if others:
+            print(f"跳过 {len(others)} 个其他账号的视频，需要使用对应账号的cookies重放")
+        if not entries:
+            if not others:
+                os.remove(path)
+            return 0, 0
+
+        print("正在验证登录状态...")
+        if not self.verify_login():
+            return 0, len(entries)
+
+        groups = {}
+        for entry in entries:
+            video = VideoRecord(entry['aid'], entry.get('bvid'), entry.get('title') or entry.get('bvid') or '')
+            groups.setdefault(str(entry['fav_id']), []).append(video)
+
+        counts = [0, 0]
+        record = self.make_recorder(counts, None)
+        retries = self.retry_queue()
+        chunk_size = self.batch_size if self.batch_size > 1 else 1
+        for fav_id, videos in groups.items():
+            print(f"重新添加 {len(videos)} 个视频到收藏夹 {fav_id}...")
+            for start in range(0, len(videos), chunk_size):
+                self.write_chunk(fav_id, videos[start:start + chunk_size], start, len(videos), record,
+                                  chunk_size > 1, retries)
+        if len(retries):
+            with self.metrics.phase('retry'):
+                retries.drain(self, chunk_size > 1)
+
+        # 仍然失败的视频先写入临时文件再替换原文件
+        temp_file = f"{path}.tmp"
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        append_dead_letters(others, temp_file)
+        if retries.write_dead_letters(temp_file):
+            print(f"仍有 {counts[1]} 个视频添加失败，已写回 {path}")
+        if os.path.exists(temp_file):
+            os.replace(temp_file, path)
+        else:
+            os.remove(path)
+        print(f"\n重新添加完成! 成功: {counts[0]}, 失败: {counts[1]}")
+        self.save_session_state()
+        return counts[0], counts[1]
 
-                # 添加延时避免请求过快
-                time.sleep(1)
+    def write_chunk(self, fav_id, chunk, offset, total, record, batch=True, retries=None):
+        """
+        写入一批视频
+        :param offset: chunk之前已处理的视频数量，用于显示进度
+        :param total: 视频总数，流式写入时总数未知
+        :param record: 每个视频完成后调用 record(video, 是否成功)
+        :param batch: 为True时使用batch-deal接口，被拒绝时逐个添加
+        :param retries: RetryQueue，添加失败的视频交给它分类和重试并在最终失败时显示，为None时直接记为失败
+        """
+        if batch:
+            ok, message = self._batch_add(fav_id, chunk)
+            if ok:
+                for i, video in enumerate(chunk, offset + 1):
+                    self.progress.added(i, total, video)
+                    record(video, True)
+                return
+
+            # 批量请求被拒绝时逐个添加，保证每个视频的成功/失败统计准确
+            print(f"批量添加第 {offset + 1}-{offset + len(chunk)} 个视频失败: {message}，改为逐个添加...")
+
+        for i, video in enumerate(chunk, offset + 1):
+            ok, code, message = self._add_single(fav_id, video, i, total)
+            if ok:
+                record(video, True)
+            elif retries is None:
+                self.progress.failed(i, total, video, message)
+                record(video, False)
+            else:
+                retries.fail(fav_id, video, code, message, record, (i, total))
 
-            except Exception as e:
-                print(f"[{i}/{len(videos)}] 添加失败: {video['title']} - {str(e)}")
-                failed_count += 1
+    def _batch_add(self, fav_id, videos):
+        """
+        通过batch-deal接口一次添加多个视频
+        :return: (是否成功, 失败信息)
+        """
+        try:
+            url = f"{self.api_base}/x/v3/fav/resource/batch-deal"
+            data = {
+                'resources': ','.join(f"{video['aid']}:2" for video in videos),
+                'media_ids': fav_id,
+                'platform': 'web',
+                'csrf': self.get_csrf_token()
+            }
 
-        print(f"\n转移完成! 成功: {success_count}, 失败: {failed_count}")
-        return success_count, failed_count
+            response = self.session.post(url, data=data)
+            response.raise_for_status()
+            result = response.json()
+
+            if result['code'] == 0:
+                return True, ''
+            return False, result.get('message', '未知错误')
+
+        except Exception as e:
+            return False, str(e)
+
+    def _add_single(self, fav_id, video, i, total):
+        """
+        通过deal接口添加单个视频，失败时不显示，由调用方在结果确定后显示
+        :return: (是否添加成功, 业务码或HTTP状态码, 失败信息)，网络错误时结果码为None
+        """
+        try:
+            url = f"{self.api_base}/x/v3/fav/resource/deal"
+            data = {
+                'rid': video['aid'],
+                'type': 2,  # 视频类型
+                'add_media_ids': fav_id,
+                'del_media_ids': '',
+                'csrf': self.get_csrf_token()
+            }
+
+            response = self.session.post(url, data=data)
+            response.raise_for_status()
+            result = response.json()
+
+            if result['code'] == 0:
+                self.progress.added(i, total, video)
+                return True, 0, ''
+
+            return False, result['code'], result['message']
+
+        except Exception as e:
+            response = getattr(e, 'response', None)
+            return False, getattr(response, 'status_code', None), str(e)
 
     def get_csrf_token(self):
         """
-        从cookies中获取csrf token
+        从cookies中获取csrf token，每个会话只读取一次，bili_jct轮换后重新读取
         """
-        return self.session.cookies.get('bili_jct', '')
+        if self._csrf is None:
+            self._csrf = self.session.cookies.get('bili_jct', '')
+        return self._csrf
+
+    def fetch_pic(self, video):
+        """
+        获取视频的封面地址，列表中未保留封面时才发起请求
+        :param video: VideoRecord
+        :return: 封面地址，获取失败时返回None
+        """
+        if video.pic is None:
+            try:
+                response = self.session.get(f"{self.api_base}/x/web-interface/view",
+                                            params={'aid': video.aid})
+                response.raise_for_status()
+                data = response.json()
+                if data['code'] == 0:
+                    video.pic = data['data'].get('pic')
+            except Exception as e:
+                print(f"获取封面失败: {video.title} - {str(e)}")
+        return video.pic
 
     def verify_login(self):
         """
-        验证登录状态
+        验证登录状态，会话状态中有未过期的验证结果时跳过请求
         """
+        if self.session_state is not None:
+            nav = self.session_state.cached_nav()
+            if nav is not None:
+                print(f"✅ 使用缓存的登录状态 (用户名: {nav.get('uname', '未知')}, UID: {nav.get('mid', '未知')})")
+                return True
+
         try:
-            url = "https://api.bilibili.com/x/web-interface/nav"
+            url = f"{self.api_base}/x/web-interface/nav"
             response = self.session.get(url)
             response.raise_for_status()
             data = response.json()
@@ -310,9 +1312,14 @@ class FromListsToFavlist:
                 print(f"✅ 登录验证成功!")
                 print(f"用户名: {user_info.get('uname', '未知')}")
                 print(f"UID: {user_info.get('mid', '未知')}")
+                if self.session_state is not None:
+                    self.session_state.record_nav({'uname': user_info.get('uname'), 'mid': user_info.get('mid')})
+                    self.session_state.save(self.session)
                 return True
             else:
                 print("❌ 登录验证失败")
+                if self.session_state is not None:
+                    self.session_state.invalidate_nav()
                 print("调试信息:")
                 print(f"  - 登录状态: {data.get('data', {}).get('isLogin', 'unknown')}")
                 print(f"  - 用户信息: {data.get('data', {})}")
@@ -334,45 +1341,347 @@ class FromListsToFavlist:
             print("这可能是网络问题或cookies格式错误")
             return False
 
-    def transfer_collection_to_favorites(self, collection_url, fav_url):
+    def transfer_collection_to_favorites(self, collection_url, fav_url, force_refresh=False, status=None):
         """
         主函数：将合集转移到收藏夹
+        列表获取和写入同时进行：后台线程逐页获取列表，当前线程收到每一页后立即写入
+        各阶段(verify/resolve/list/write)的耗时记录在self.metrics中，list和write是重叠的
+        :param force_refresh: 忽略列表缓存，重新获取完整列表
+        :param status: 见transfer_collection_to_many_favorites
+        :return: (成功数, 失败数)
+        """
+        results = self.transfer_collection_to_many_favorites(collection_url, [fav_url], force_refresh, status)
+        return next(iter(results.values()), (0, 0))
+
+    def transfer_collection_to_many_favorites(self, collection_url, fav_urls, force_refresh=False, status=None):
         """
+        将合集同时转移到多个收藏夹
+        合集只获取一次，每个视频在一个请求中写入所有还没有它的收藏夹
+        启动步骤并发执行：登录验证、后台获取列表和每个目标收藏夹的信息同时进行，在第一次写入前汇合，
+        登录失败时取消其余步骤
+        :param fav_urls: 收藏夹URL列表
+        :param status: 传入dict时写入 'complete'：是否获取到了完整的列表并把所有转移日志标记为完成
+        :return: {收藏夹ID: (成功数, 失败数)}，按fav_urls的顺序
+        """
+        status = {} if status is None else status
+        status['complete'] = False
+        started = time.perf_counter()
+        listing = None
+        cancelled = threading.Event()
         try:
-            # 首先验证登录状态
             print("正在验证登录状态...")
-            if not self.verify_login():
-                return 0, 0
+            with ThreadPoolExecutor(max_workers=STARTUP_WORKERS) as executor:
+                login = executor.submit(self._verify_login_phase)
+
+                with self.metrics.phase('resolve'):
+                    # 解析URL，来源也可以是BV号/av号列表文件或'-'(标准输入)
+                    if is_id_source(collection_url):
+                        uid, season_id = ID_LIST_UID, id_source_key(collection_url)
+                        url_kind = None
+                        pages = iter_id_pages(collection_url)
+                        print(f"ID列表: {'标准输入' if collection_url == '-' else collection_url}")
+                    else:
+                        uid, season_id = self.extract_season_info(collection_url)
+                        url_kind = self.classify_source_url(collection_url)
+                        pages = None
+                        print(f"合集信息: 用户ID={uid}, 合集ID={season_id}")
+
+                    # 列表不需要登录，验证登录的同时开始获取第一页
+                    listing = self._start_listing(uid, season_id, force_refresh, url_kind, pages)
+                    prepare = self._prepare_target
+                    if self.profiler is not None:
+                        prepare = self.profiler.wrap('resolve', prepare)
+                    futures = [executor.submit(prepare, fav_url, uid, season_id, login, cancelled)
+                               for fav_url in dict.fromkeys(fav_urls)]
+
+                    if not login.result():
+                        cancelled.set()
+                        self._stop_listing(listing)
+                        for future in futures:
+                            future.cancel()
+                        return {}
+
+                    # 不同写法指向同一收藏夹时只保留第一个
+                    targets = []
+                    for future in futures:
+                        target = future.result()
+                        if target is not None and all(target[0] != other[0] for other in targets):
+                            targets.append(target)
+                    fav_ids = [target[0] for target in targets]
 
             print("-" * 50)
+            print(f"收藏夹ID: {', '.join(fav_ids)}")
+            print("-" * 50)
 
-            # 解析URL
-            uid, season_id = self.extract_season_info(collection_url)
-            fav_id = self.extract_fav_info(fav_url)
+            # 所有收藏夹都已满且不创建续建收藏夹时，停止获取列表，不发送写入请求
+            if all(plan is not None and plan.overflow != OVERFLOW_SPLIT and plan.free() == 0
+                   for _, _, _, _, plan in targets):
+                print("目标收藏夹已满，没有可添加视频的空间")
+                for _, journal, _, _, _ in targets:
+                    journal.close()
+                return {fav_id: (0, 0) for fav_id in fav_ids}
+
+            # 从开始到可以写入的时间
+            self.metrics.add_phase('startup', time.perf_counter() - started)
+            for fav_id, journal, resume, existing, plan in targets:
+                journal.start(resume)
+            try:
+                # 暂时失败的视频在列表写完后重试，结果确定前不写入日志，中断后继续时会重新添加
+                retries = self.retry_queue()
+                listed, skipped = self._stream_transfer(
+                    uid, season_id, [(fav_id, journal, existing, plan)
+                                     for fav_id, journal, _, existing, plan in targets],
+                    force_refresh, url_kind, pages, retries, listing)
+                # 列表不完整时不标记完成，下次运行重新获取列表并跳过日志中已成功的视频
+                if listing[3]['complete']:
+                    for fav_id, journal, resume, existing, plan in targets:
+                        journal.finish()
+                    status['complete'] = bool(listed)
+                elif listed:
+                    print("列表获取不完整，转移日志保持未完成状态，下次运行会继续")
+            finally:
+                for fav_id, journal, resume, existing, plan in targets:
+                    journal.close()
+
+            if not listed:
+                print("未找到任何视频，请检查合集URL是否正确")
+                return {fav_id: (0, 0) for fav_id in fav_ids}
+
+            results = {}
+            for fav_id, journal, resume, existing, plan in targets:
+                if len(targets) > 1:
+                    print(f"收藏夹 {fav_id}:")
+                if skipped[fav_id]:
+                    print(f"已跳过 {skipped[fav_id]} 个已在收藏夹中的视频")
+                if plan is not None and plan.overflowed:
+                    print(f"收藏夹已满，{plan.overflowed} 个视频未添加")
+                if plan is not None and len(plan.folders) > 1:
+                    print(f"视频分布在收藏夹: {', '.join(plan.folder_ids())}")
+                results[fav_id] = self._journal_summary(journal, resume)
+                if len(targets) > 1:
+                    print(f"成功: {results[fav_id][0]}, 失败: {results[fav_id][1]}")
+
+            self.rate_limiter.report()
+            self.save_session_state()
+            return results
 
-            print(f"合集信息: 用户ID={uid}, 合集ID={season_id}")
-            print(f"收藏夹ID: {fav_id}")
-            print("-" * 50)
+        except Exception as e:
+            cancelled.set()
+            print(f"转移过程中出错: {str(e)}")
+            return {}
+        finally:
+            if listing is not None:
+                self._stop_listing(listing)
 
-            # 获取合集中的视频
-            videos = self.get_season_videos(uid, season_id)
+    def _verify_login_phase(self):
+        with self.metrics.phase('verify'):
+            return self.verify_login()
 
-            # 如果合集API获取失败，尝试作为视频列表获取
-            if not videos:
-                print("合集API获取失败，尝试作为视频列表获取...")
-                videos = self.get_series_videos(uid, season_id)
+    def _prepare_target(self, fav_url, uid, source_id, login, cancelled):
+        """
+        启动阶段的一个目标收藏夹任务：解析收藏夹ID、读取转移日志，并同时获取容量信息和已有视频
+        收藏夹名称可能需要创建收藏夹，先等待登录验证完成
+        :param login: 登录验证的Future
+        :param cancelled: 登录失败时被设置的Event
+        :return: (收藏夹ID, 日志, 是否继续上次的转移, 已有视频的aid集合, FolderPlan或None)，取消时返回None
+        """
+        if self.fav_id_from_url(fav_url) is None and not login.result():
+            return None
+        fav_id = self.extract_fav_info(fav_url)
+        if cancelled.is_set():
+            return None
+
+        # 上次运行中断时跳过日志中已成功的视频，之前失败的视频重新添加
+        journal, resume = self._load_journal(uid, source_id, fav_id)
+
+        # 写入前按收藏夹容量规划，放不下的视频不发送请求或写入续建收藏夹；
+        # 同时读取收藏夹（包括已知的续建收藏夹）中已有的视频
+        folder_ids = [str(fav_id)] + [str(folder_id) for folder_id in self.continuation_folders(fav_id)]
+        with ThreadPoolExecutor(max_workers=len(folder_ids) + 1) as executor:
+            plan_future = executor.submit(self.plan_folder, fav_id)
+            id_futures = [executor.submit(self.get_favorite_ids, folder_id) for folder_id in folder_ids]
+            plan = plan_future.result()
+            fetched = {folder_id: future.result() for folder_id, future in zip(folder_ids, id_futures)}
+        return fav_id, journal, resume, self._existing_ids(fav_id, plan, fetched), plan
+
+    def _start_listing(self, uid, source_id, force_refresh=False, url_kind=None, pages=None):
+        """
+        启动获取列表的后台线程，逐页放入有界队列
+        :return: (队列, 停止事件, 线程, 状态)，线程结束后状态中的 'complete' 表示是否获取到了完整的列表
+        """
+        status = {'total': None, 'complete': True}
+        if pages is None:
+            pages = self.iter_collection_pages(uid, source_id, force_refresh, url_kind, status)
+        buffer = queue.Queue(maxsize=PIPELINE_QUEUE_PAGES)
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    buffer.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
 
-            if not videos:
-                print("未找到任何视频，请检查合集URL是否正确")
-                return 0, 0
+        def produce():
+            try:
+                with self.metrics.phase('list'):
+                    for page_videos in pages:
+                        if not put(page_videos):
+                            status['complete'] = False
+                            return
+            except Exception as e:
+                status['complete'] = False
+                put(e)
+            finally:
+                put(None)
+
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+        return buffer, stop, producer, status
+
+    @staticmethod
+    def _stop_listing(listing):
+        _, stop, producer, _ = listing
+        stop.set()
+        producer.join()
+
+    def _stream_transfer(self, uid, source_id, targets, force_refresh=False, url_kind=None, pages=None,
+                         retries=None, listing=None):
+        """
+        生产者/消费者流水线：后台线程把每页视频放入有界队列，当前线程取出后过滤并写入
+        队列满时获取列表的线程等待，内存占用不随列表长度增长
+        需要写入相同收藏夹组合的视频合并为一个请求，add_media_ids/media_ids为逗号分隔的收藏夹ID
+        :param targets: [(收藏夹ID, 日志, 收藏夹中已有视频的aid集合, FolderPlan或None)]
+        :param url_kind: 从URL判断出的来源类型
+        :param pages: 代替合集列表的视频页迭代器，例如ID列表
+        :param retries: RetryQueue，暂时失败的视频放入其中，列表写完后重试，之后再显示汇总
+        :param listing: _start_listing已启动的列表获取，为None时在这里启动
+        :return: (获取到的视频数, {收藏夹ID: 因已在收藏夹中而跳过的视频数})
+        """
+        if listing is None:
+            listing = self._start_listing(uid, source_id, force_refresh, url_kind, pages)
+        buffer = listing[0]
+
+        counts = {fav_id: [0, 0] for fav_id, _, _, _ in targets}
+        recorders = {fav_id: self.make_recorder(counts[fav_id], journal) for fav_id, journal, _, _ in targets}
+        skipped = {fav_id: 0 for fav_id, _, _, _ in targets}
+        # 实际写入的收藏夹ID -> 它所属的目标收藏夹ID
+        owners = {fav_id: fav_id for fav_id, _, _, _ in targets}
+        batch = self.batch_size > 1
+        chunk_size = self.batch_size if batch else 1
+        listed = written = 0
+        # 目标收藏夹ID元组 -> 等待写入的视频
+        pending = {}
+        started = False
+
+        def write(fav_ids, chunk):
+            nonlocal written, started
+            if not started:
+                print(f"开始将视频添加到收藏夹 {', '.join(counts)}...")
+                started = True
+            group = [recorders[owners[fav_id]] for fav_id in fav_ids]
+
+            def record(video, ok):
+                for target_record in group:
+                    target_record(video, ok)
+
+            with self.metrics.phase('write'):
+                self.write_chunk(','.join(fav_ids), chunk, written, '?', record, batch, retries)
+            written += len(chunk)
 
-            print("-" * 50)
+        try:
+            while True:
+                item = buffer.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+
+                listed += len(item)
+                for video in item:
+                    fav_ids = []
+                    for fav_id, journal, existing, plan in targets:
+                        if video['aid'] in existing:
+                            skipped[fav_id] += 1
+                        elif not journal.succeeded(video['aid']):
+                            folder_id = plan.assign() if plan is not None else fav_id
+                            if folder_id is not None:
+                                owners.setdefault(folder_id, fav_id)
+                                fav_ids.append(folder_id)
+                    if fav_ids:
+                        pending.setdefault(tuple(fav_ids), []).append(video)
+
+                for fav_ids, group_videos in list(pending.items()):
+                    while len(group_videos) >= chunk_size:
+                        chunk, group_videos = group_videos[:chunk_size], group_videos[chunk_size:]
+                        write(fav_ids, chunk)
+                    pending[fav_ids] = group_videos
+
+            for fav_ids, group_videos in pending.items():
+                if group_videos:
+                    write(fav_ids, group_videos)
+
+            # 重试结束后结果才确定，之后再显示汇总
+            if retries is not None:
+                self.drain_retries(retries, batch)
+            if started:
+                success = sum(count[0] for count in counts.values())
+                failed = sum(count[1] for count in counts.values())
+                print(f"\n转移完成! 成功: {success}, 失败: {failed}")
+            elif listed:
+                print("所有视频都已在收藏夹中，无需添加")
+        finally:
+            self._stop_listing(listing)
+
+        return listed, skipped
+
+    def _load_journal(self, uid, source_id, fav_id):
+        """
+        读取转移日志
+        :return: (日志, 是否继续上次的转移)
+        """
+        journal = TransferJournal.for_transfer(uid, source_id, fav_id, self.journal_dir)
+        resume = journal.load()
+        if resume:
+            done_success, done_failed = journal.counts()
+            print(f"检测到未完成的转移 (已运行 {journal.attempts} 次)，"
+                  f"之前成功 {done_success} 个，失败 {done_failed} 个，失败的视频将重新添加")
+        return journal, resume
+
+    def _resume_journal(self, uid, source_id, fav_id, videos):
+        """
+        读取转移日志，上次运行中断时只保留日志中没有成功记录的视频
+        :return: (日志, 是否继续上次的转移, 待处理的视频列表)
+        """
+        journal, resume = self._load_journal(uid, source_id, fav_id)
+        if resume:
+            videos = [video for video in videos if not journal.succeeded(video['aid'])]
+            print(f"剩余 {len(videos)} 个视频")
+        return journal, resume, videos
 
-            # 添加到收藏夹
-            success_count, failed_count = self.add_to_favorites(fav_id, videos)
+    def _journal_summary(self, journal, resume):
+        """
+        汇总包括之前中断的运行在内的所有结果
+        :return: (成功数, 失败数)
+        """
+        success_count, failed_count = journal.counts()
+        if resume:
+            print(f"累计 {journal.attempts} 次运行: 成功 {success_count}, 失败 {failed_count}")
+        return success_count, failed_count
 
-            return success_count, failed_count
+    def transfer_many(self, jobs, concurrency=None):
+        """
+        在同一个事件循环中并发执行多个转移，委托给AsyncFromListsToFavlist
+        :param jobs: (合集URL, 收藏夹URL) 列表
+        :param concurrency: 同时进行的请求数，默认为ASYNC_CONCURRENCY
+        :return: 与jobs顺序对应的 (成功数, 失败数) 列表
+        """
+        from async_transfer import AsyncFromListsToFavlist
 
-        except Exception as e:
-            print(f"转移过程中出错: {str(e)}")
-            return 0, 0
\ No newline at end of file
+        engine = AsyncFromListsToFavlist(self, concurrency)
+        try:
+            return asyncio.run(engine.transfer_many(jobs))
+        finally:
+            engine.close()
\ No newline at end of file
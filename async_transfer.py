@@ -0,0 +1,140 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from FromListsToFavlist import FromListsToFavlist
+
+
+# 同时进行的调用数：add_to_favorites中为请求数，transfer_many中为转移数
+ASYNC_CONCURRENCY = 8
+
+
+class AsyncFromListsToFavlist:
+    """
+    FromListsToFavlist的asyncio版本，公开方法及其参数与同步版本相同
+    阻塞的调用在有限大小的线程池中执行，并与同步版本共用同一个session、缓存和限速器：
+    获取列表和转移在线程池中运行同步版本的实现（包括ID列表来源、多个目标收藏夹和流式写入），
+    add_to_favorites的每个批次作为一个并发任务，多个转移可以在同一个事件循环中并发运行，线程数只取决于concurrency
+    """
+
+    def __init__(self, client, concurrency=None):
+        """
+        :param client: 提供session、缓存和日志配置的FromListsToFavlist实例
+        :param concurrency: 同时进行的调用数（请求或转移）
+        """
+        self.client = client
+        self.concurrency = concurrency or ASYNC_CONCURRENCY
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        self._semaphore = None
+        self._loop = None
+
+    @classmethod
+    def from_cookies(cls, cookies, concurrency=None, **kwargs):
+        """
+        使用cookies字符串创建，其余参数传给FromListsToFavlist
+        """
+        return cls(FromListsToFavlist(cookies, **kwargs), concurrency)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+    async def _call(self, func, *args, **kwargs):
+        """
+        在线程池中执行阻塞调用，同时进行的调用数不超过concurrency
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            return await loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+
+    async def verify_login(self):
+        """
+        验证登录状态
+        """
+        return await self._call(self.client.verify_login)
+
+    async def get_season_videos(self, uid, season_id, page_size=None, status=None):
+        """
+        获取合集中的所有视频，见FromListsToFavlist.get_season_videos
+        """
+        return await self._call(self.client.get_season_videos, uid, season_id, page_size, status)
+
+    async def get_series_videos(self, uid, series_id, sort=None, page_size=None, status=None):
+        """
+        获取视频列表(series)中的所有视频，见FromListsToFavlist.get_series_videos
+        """
+        return await self._call(self.client.get_series_videos, uid, series_id, sort, page_size, status)
+
+    async def get_collection_videos(self, uid, source_id, force_refresh=False, url_kind=None, status=None):
+        """
+        获取合集或视频列表中的视频，启用缓存时优先使用本地缓存
+        与同步版本共用缓存、接口选择和完整性检查
+        :param status: 见FromListsToFavlist.iter_collection_pages
+        """
+        return await self._call(self.client.get_collection_videos, uid, source_id, force_refresh, url_kind, status)
+
+    async def add_to_favorites(self, fav_id, videos, batch_size=None, journal=None, plan=None):
+        """
+        将视频添加到收藏夹，每个批次作为一个并发任务，参数见FromListsToFavlist.add_to_favorites
+        暂时失败的视频在所有批次结束后重试，最终仍然失败的视频追加到死信文件
+        """
+        client = self.client
+        if batch_size is None:
+            batch_size = client.batch_size
+        if isinstance(fav_id, (list, tuple)):
+            fav_id = ','.join(str(target) for target in fav_id)
+
+        counts = [0, 0]
+        record = client.make_recorder(counts, journal)
+        retries = client.retry_queue()
+        batch = batch_size > 1
+        chunk_size = batch_size if batch else 1
+
+        # 续建收藏夹在线程池中创建，不阻塞事件循环
+        groups = await self._call(client.assign_folders, fav_id, videos, plan)
+        total = sum(len(group) for _, group in groups)
+
+        tasks = []
+        offset = 0
+        for folder_id, group in groups:
+            print(f"开始将视频添加到收藏夹 {folder_id}...")
+            tasks += [self._call(client.write_chunk, folder_id, group[start:start + chunk_size], offset + start,
+                                 total, record, batch, retries)
+                      for start in range(0, len(group), chunk_size)]
+            offset += len(group)
+        await asyncio.gather(*tasks)
+        await self._call(client.drain_retries, retries, batch)
+
+        print(f"\n转移完成! 成功: {counts[0]}, 失败: {counts[1]}")
+        return counts[0], counts[1]
+
+    async def transfer_collection_to_favorites(self, collection_url, fav_url, force_refresh=False, status=None):
+        """
+        将合集转移到收藏夹，见FromListsToFavlist.transfer_collection_to_favorites
+        :return: (成功数, 失败数)
+        """
+        return await self._call(self.client.transfer_collection_to_favorites, collection_url, fav_url,
+                                force_refresh, status)
+
+    async def transfer_collection_to_many_favorites(self, collection_url, fav_urls, force_refresh=False, status=None):
+        """
+        将一个合集（或BV号/av号列表）同时转移到多个收藏夹，见FromListsToFavlist.transfer_collection_to_many_favorites
+        :return: {收藏夹ID: (成功数, 失败数)}
+        """
+        return await self._call(self.client.transfer_collection_to_many_favorites, collection_url, fav_urls,
+                                force_refresh, status)
+
+    async def transfer_many(self, jobs):
+        """
+        并发执行多个转移
+        :param jobs: (合集URL, 收藏夹URL) 列表
+        :return: 与jobs顺序对应的 (成功数, 失败数) 列表
+        """
+        results = await asyncio.gather(
+            *(self.transfer_collection_to_favorites(collection_url, fav_url)
+              for collection_url, fav_url in jobs)
+        )
+        self.client.rate_limiter.report()
+        return list(results)
@@ -0,0 +1,240 @@
+import csv
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from video_ids import ID_LIST_UID, id_source_key, is_id_source, iter_id_pages
+
+
+# 同时执行的任务数，所有任务共享同一个账号的限速器
+BATCH_WORKERS = 4
+
+# 默认结果报告文件
+REPORT_FILE = "batch_report.json"
+
+
+def load_manifest(path):
+    """
+    读取任务清单，支持JSON和CSV
+    JSON: [{"collection_url": ..., "fav_url": ...}, ...] 或 [[合集URL, 收藏夹URL], ...]
+    CSV: 每行 合集URL,收藏夹URL，可以带 collection_url,fav_url 表头
+    合集URL也可以是BV号/av号列表文件的路径
+    :return: (合集URL, 收藏夹URL) 列表
+    """
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        if path.lower().endswith('.json'):
+            entries = json.load(f)
+        else:
+            entries = [row for row in csv.reader(f) if row and not row[0].startswith('#')]
+            if entries and entries[0][0].strip() == 'collection_url':
+                entries = entries[1:]
+
+    jobs = []
+    for entry in entries:
+        if isinstance(entry, dict):
+            collection_url, fav_url = entry['collection_url'], entry['fav_url']
+        else:
+            collection_url, fav_url = entry[0], entry[1]
+        jobs.append((collection_url.strip(), fav_url.strip()))
+    return jobs
+
+
+class BatchJob:
+    """
+    清单中的一个任务及其结果
+    """
+
+    def __init__(self, index, collection_url, fav_url):
+        self.index = index
+        self.collection_url = collection_url
+        self.fav_url = fav_url
+        self.uid = None
+        self.source_id = None
+        self.fav_id = None
+        self.videos = []
+        self.listed = 0
+        # 列表是否完整，不完整时转移日志不标记完成
+        self.complete = True
+        self.duplicates = 0
+        self.skipped = 0
+        self.success = 0
+        self.failed = 0
+        self.error = None
+        self.elapsed = 0.0
+        self.plan = None
+        # 与之前的任务是同一 (来源, 收藏夹) 时为那个任务的序号，这样的任务不再执行
+        self.duplicate_of = None
+
+    def to_dict(self):
+        return {
+            'index': self.index,
+            'collection_url': self.collection_url,
+            'fav_url': self.fav_url,
+            'uid': self.uid,
+            'source_id': self.source_id,
+            'fav_id': self.fav_id,
+            'listed': self.listed,
+            'complete': self.complete,
+            'duplicates': self.duplicates,
+            'duplicate_of': self.duplicate_of,
+            'skipped': self.skipped,
+            'success': self.success,
+            'failed': self.failed,
+            'error': self.error,
+            'elapsed': round(self.elapsed, 3),
+        }
+
+
+class BatchRunner:
+    """
+    非交互地执行一批合集转收藏夹任务
+    先解析全部任务并获取列表，对同一收藏夹去掉重复的视频，再用线程池执行写入
+    """
+
+    def __init__(self, client, workers=BATCH_WORKERS, force_refresh=False):
+        """
+        :param client: FromListsToFavlist实例，所有任务共享它的session和限速器
+        :param workers: 同时执行的任务数
+        :param force_refresh: 忽略列表缓存
+        """
+        self.client = client
+        self.workers = workers
+        self.force_refresh = force_refresh
+
+    def resolve(self, jobs):
+        """
+        解析URL、获取列表并去重
+        同一来源只获取一次，同一收藏夹只读取一次现有内容
+        来源和收藏夹都相同的重复任务会使用同一个转移日志，只保留第一个，其余标记为重复
+        """
+        listings = {}
+        targets = {}
+        transfers = {}
+
+        for job in jobs:
+            id_source = is_id_source(job.collection_url)
+            try:
+                if id_source:
+                    job.uid, job.source_id = ID_LIST_UID, id_source_key(job.collection_url)
+                else:
+                    job.uid, job.source_id = self.client.extract_season_info(job.collection_url)
+                job.fav_id = self.client.extract_fav_info(job.fav_url)
+            except ValueError as e:
+                job.error = str(e)
+                continue
+
+            source = (job.uid, job.source_id)
+            if source not in listings:
+                if id_source:
+                    listings[source] = ([video for page in iter_id_pages(job.collection_url) for video in page],
+                                        True)
+                else:
+                    status = {}
+                    videos = self.client.get_collection_videos(
+                        job.uid, job.source_id, self.force_refresh,
+                        self.client.classify_source_url(job.collection_url), status)
+                    listings[source] = (videos, status['complete'])
+            videos, job.complete = listings[source]
+            job.listed = len(videos)
+            if not videos:
+                job.error = "未找到任何视频"
+                continue
+
+            # 同一收藏夹的多个任务中重复出现的视频只保留第一次
+            if job.fav_id not in targets:
+                plan = self.client.plan_folder(job.fav_id)
+                targets[job.fav_id] = {
+                    'existing': self.client._existing_ids(job.fav_id, plan),
+                    'claimed': set(),
+                    'plan': plan,
+                }
+            target = targets[job.fav_id]
+            # 同一收藏夹的任务共享容量规划
+            job.plan = target['plan']
+            first = transfers.setdefault((job.uid, job.source_id, job.fav_id), job)
+            if first is not job:
+                job.duplicate_of = first.index
+
+            for video in videos:
+                aid = video['aid']
+                if aid in target['existing']:
+                    job.skipped += 1
+                elif aid in target['claimed']:
+                    job.duplicates += 1
+                else:
+                    target['claimed'].add(aid)
+                    job.videos.append(video)
+
+    def _run_job(self, job):
+        start = time.monotonic()
+        try:
+            journal, resume, videos = self.client._resume_journal(
+                job.uid, job.source_id, job.fav_id, job.videos)
+            journal.start(resume)
+            try:
+                if videos:
+                    self.client.add_to_favorites(job.fav_id, videos, journal=journal, plan=job.plan)
+                if job.complete:
+                    journal.finish()
+                else:
+                    print(f"任务 {job.index} 的列表获取不完整，转移日志保持未完成状态，下次运行会继续")
+            finally:
+                journal.close()
+            job.success, job.failed = self.client._journal_summary(journal, resume)
+        except Exception as e:
+            job.error = str(e)
+        job.elapsed = time.monotonic() - start
+
+    def run(self, jobs):
+        """
+        执行任务清单
+        :param jobs: (合集URL, 收藏夹URL) 列表
+        :return: BatchJob列表
+        """
+        batch = [BatchJob(i, collection_url, fav_url)
+                 for i, (collection_url, fav_url) in enumerate(jobs)]
+
+        print("正在验证登录状态...")
+        if not self.client.verify_login():
+            for job in batch:
+                job.error = "登录验证失败"
+            return batch
+
+        print(f"正在解析 {len(batch)} 个任务...")
+        self.resolve(batch)
+
+        runnable = [job for job in batch if job.error is None and job.duplicate_of is None]
+        repeated = sum(1 for job in batch if job.duplicate_of is not None)
+        if repeated:
+            print(f"{repeated} 个任务与之前的任务相同，已跳过")
+        print(f"开始执行 {len(runnable)} 个任务...")
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            list(executor.map(self._run_job, runnable))
+
+        self.client.rate_limiter.report()
+        self.client.save_session_state()
+        return batch
+
+    @staticmethod
+    def write_report(batch, path=REPORT_FILE):
+        """
+        写入JSON格式的结果报告
+        """
+        report = BatchRunner.summarize(batch)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        return report
+
+    @staticmethod
+    def summarize(batch):
+        """
+        :return: 可序列化为JSON的结果报告
+        """
+        return {
+            'jobs': [job.to_dict() for job in batch],
+            'success': sum(job.success for job in batch),
+            'failed': sum(job.failed for job in batch),
+            'skipped': sum(job.skipped for job in batch),
+            'duplicates': sum(job.duplicates for job in batch),
+            'errors': sum(1 for job in batch if job.error is not None),
+        }
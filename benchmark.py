@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+离线性能基准
+启动本地模拟服务器，把FromListsToFavlist指向它，测量不同规模合集的列表获取和收藏写入性能
+--memory 用tracemalloc比较每个视频记录占用的内存
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from FromListsToFavlist import FromListsToFavlist
+from mock_server import MockBilibiliServer, MockConfig, _archive
+from rate_limiter import AdaptiveRateLimiter
+from video_record import video_from_archive
+
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+
+
+def percentile(values, fraction):
+    """
+    :return: values的fraction分位数，values为空时返回0
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class RequestTimer:
+    """
+    记录session每个HTTP请求的耗时
+    在连接池适配器上计时：不包括限速器的等待，包括传输层（urllib3）对GET的重试，重试次数另外统计
+    """
+
+    def __init__(self, session):
+        self.latencies = []
+        self.transport_retries = 0
+        self.lock = threading.Lock()
+        adapters = {id(adapter): adapter for adapter in session.adapters.values()}
+        for adapter in adapters.values():
+            self._wrap(adapter)
+
+    def _wrap(self, adapter):
+        send = adapter.send
+
+        def timed_send(request, *args, **kwargs):
+            start = time.perf_counter()
+            response = None
+            try:
+                response = send(request, *args, **kwargs)
+                return response
+            finally:
+                elapsed = time.perf_counter() - start
+                retries = getattr(getattr(response, 'raw', None), 'retries', None)
+                with self.lock:
+                    self.latencies.append(elapsed)
+                    self.transport_retries += len(retries.history) if retries is not None else 0
+
+        adapter.send = timed_send
+
+    def take(self):
+        """
+        :return: (各请求的耗时列表, 传输层重试次数)，并清零
+        """
+        with self.lock:
+            latencies, self.latencies = self.latencies, []
+            retries, self.transport_retries = self.transport_retries, 0
+        return latencies, retries
+
+
+def phase_result(videos, elapsed, timing):
+    """
+    :param timing: RequestTimer.take()的结果
+    """
+    latencies, transport_retries = timing
+    return {
+        'videos': videos,
+        'seconds': round(elapsed, 4),
+        'videos_per_sec': round(videos / elapsed, 1) if elapsed > 0 else None,
+        'requests': len(latencies),
+        'requests_per_video': round(len(latencies) / videos, 4) if videos else None,
+        'transport_retries': transport_retries,
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+    }
+
+
+def run_case(kind, size, args):
+    """
+    测量一个规模的列表获取和收藏写入
+    """
+    config = MockConfig(
+        season_size=size, series_size=size, latency=args.latency, jitter=args.jitter,
+        max_page_size=args.max_page_size, error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate, throttle_code=args.throttle_code, seed=args.seed,
+    )
+    # 日志和注入错误时产生的死信都写入临时目录，结束后删除
+    work_dir = tempfile.mkdtemp(prefix='bench_')
+    try:
+        with MockBilibiliServer(config) as server:
+            client = FromListsToFavlist(
+                'bili_jct=benchmark', api_base=server.base_url, batch_size=args.batch_size,
+                list_workers=args.list_workers, journal_dir=os.path.join(work_dir, 'journals'),
+                dead_letter_file=os.path.join(work_dir, 'dead_letters.jsonl'),
+                rate_limiter=AdaptiveRateLimiter(read_rate=args.read_rate, write_rate=args.write_rate,
+                                                 read_burst=args.burst, write_burst=args.burst),
+            )
+            timer = RequestTimer(client.session)
+            source_id = config.season_id if kind == 'season' else config.series_id
+
+            # 模拟服务器的输出与结果无关，丢弃逐个视频的打印
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                if kind == 'season':
+                    videos = client.get_season_videos(config.uid, source_id, page_size=args.page_size)
+                else:
+                    videos = client.get_series_videos(config.uid, source_id, page_size=args.page_size)
+                listing = phase_result(len(videos), time.perf_counter() - start, timer.take())
+
+                start = time.perf_counter()
+                success, failed = client.add_to_favorites('1', videos)
+                transfer = phase_result(len(videos), time.perf_counter() - start, timer.take())
+
+            return {
+                'kind': kind,
+                'size': size,
+                'listed': len(videos),
+                'success': success,
+                'failed': failed,
+                'listing': listing,
+                'transfer': transfer,
+            }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def legacy_video_dict(video):
+    """
+    原来每个视频保存的dict，作为内存对比的基准
+    """
+    return {
+        'bvid': video['bvid'],
+        'aid': video['aid'],
+        'title': video['title'],
+        'pic': video['pic'],
+        'duration': video['duration']
+    }
+
+
+def measure_memory(size, convert, page_size=100):
+    """
+    模拟逐页解析接口返回并转换为视频记录，测量列表保留下来的内存
+    每页的JSON解析结果在转换后丢弃，与实际获取列表时相同
+    :return: 每个视频占用的字节数
+    """
+    pages = [json.dumps([_archive(aid) for aid in range(start, min(start + page_size, size + 1))])
+             for start in range(1, size + 1, page_size)]
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        videos = []
+        for payload in pages:
+            videos.extend(convert(archive) for archive in json.loads(payload))
+        retained = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    return retained / size if size else 0.0
+
+
+def run_memory(sizes):
+    converters = [
+        ('dict', legacy_video_dict),
+        ('VideoRecord', video_from_archive),
+        ('VideoRecord+pic', lambda archive: video_from_archive(archive, keep_pic=True)),
+    ]
+    results = []
+    for size in sizes:
+        result = {'size': size}
+        for name, convert in converters:
+            result[name] = round(measure_memory(size, convert), 1)
+        results.append(result)
+
+    header = f"{'规模':>8} | " + ''.join(f"{name:>17}" for name, _ in converters) + "   (字节/视频)"
+    print(header)
+    print('-' * len(header))
+    for result in results:
+        print(f"{result['size']:>10} | " + ''.join(f"{result[name]:>17}" for name, _ in converters))
+    return results
+
+
+def print_table(results):
+    header = (f"{'类型':<7}{'规模':>7} | {'列表 视频/秒':>11}{'请求/视频':>10}{'p50ms':>8}{'p95ms':>8}"
+              f" | {'写入 视频/秒':>11}{'请求/视频':>10}{'p50ms':>8}{'p95ms':>8}")
+    print(header)
+    print('-' * len(header))
+    for result in results:
+        listing, transfer = result['listing'], result['transfer']
+        print(f"{result['kind']:<8}{result['size']:>8} | "
+              f"{listing['videos_per_sec'] or 0:>13}{listing['requests_per_video'] or 0:>13}"
+              f"{listing['p50_ms']:>8}{listing['p95_ms']:>8} | "
+              f"{transfer['videos_per_sec'] or 0:>13}{transfer['requests_per_video'] or 0:>13}"
+              f"{transfer['p50_ms']:>8}{transfer['p95_ms']:>8}")
+    print("p50/p95为单个HTTP请求的耗时：不含限速等待，含传输层的GET重试"
+          f"（列表/写入共重试 {sum(r['listing']['transport_retries'] + r['transfer']['transport_retries'] for r in results)} 次）")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="基于本地模拟服务器的离线性能基准")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="合集规模")
+    parser.add_argument('--kinds', nargs='+', choices=['season', 'series'], default=['season', 'series'])
+    parser.add_argument('--latency', type=float, default=0.02, help="模拟服务器固定延迟（秒）")
+    parser.add_argument('--jitter', type=float, default=0.01, help="模拟服务器随机延迟（秒）")
+    parser.add_argument('--max-page-size', type=int, default=100, help="模拟服务器允许的最大每页数量")
+    parser.add_argument('--page-size', type=int, default=30, help="客户端请求的每页数量")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="HTTP 500的概率")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="限流响应的概率")
+    parser.add_argument('--throttle-code', type=int, default=-799, help="限流时的业务码，429表示HTTP 429")
+    parser.add_argument('--batch-size', type=int, default=50)
+    parser.add_argument('--list-workers', type=int, default=4)
+    parser.add_argument('--read-rate', type=float, default=100.0, help="读请求限速（每秒）")
+    parser.add_argument('--write-rate', type=float, default=100.0, help="写请求限速（每秒）")
+    parser.add_argument('--burst', type=int, default=10, help="限速器突发容量")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--memory', action='store_true', help="只比较每个视频记录占用的内存")
+    parser.add_argument('--json', help="将结果写入JSON文件")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.memory:
+        results = run_memory(args.sizes)
+    else:
+        results = []
+        for kind in args.kinds:
+            for size in args.sizes:
+                results.append(run_case(kind, size, args))
+        print_table(results)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import threading
+import time
+
+
+# 收藏夹索引的有效期（秒），过期后重新获取收藏夹列表
+FOLDER_INDEX_TTL = 60 * 60
+
+
+class FolderIndex:
+    """
+    一个账号创建的收藏夹的索引，可以按ID和按名称查找
+    同名的收藏夹按接口返回的顺序取第一个
+    """
+
+    def __init__(self, up_mid, folders=(), fetched_at=None, ttl=FOLDER_INDEX_TTL):
+        """
+        :param up_mid: 账号UID
+        :param folders: [(收藏夹ID, 名称, 视频数)]
+        :param fetched_at: 获取收藏夹列表的时间，默认为现在
+        """
+        self.up_mid = str(up_mid)
+        self.ttl = ttl
+        self.fetched_at = time.time() if fetched_at is None else fetched_at
+        self.by_id = {}
+        self.by_name = {}
+        self.lock = threading.Lock()
+        for folder_id, title, media_count in folders:
+            self._add(folder_id, title, media_count)
+
+    def _add(self, folder_id, title, media_count):
+        folder = (str(folder_id), title, media_count)
+        self.by_id[folder[0]] = folder
+        self.by_name.setdefault(title, folder)
+        return folder
+
+    def add(self, folder_id, title, media_count=0):
+        """
+        加入新创建的收藏夹
+        """
+        with self.lock:
+            return self._add(folder_id, title, media_count)
+
+    def find(self, name_or_id):
+        """
+        先按名称查找，再按ID查找
+        :return: (收藏夹ID, 名称, 视频数)，找不到时返回None
+        """
+        with self.lock:
+            return self.by_name.get(name_or_id) or self.by_id.get(str(name_or_id))
+
+    def folders(self):
+        with self.lock:
+            return list(self.by_id.values())
+
+    def fresh(self):
+        return time.time() - self.fetched_at < self.ttl
@@ -0,0 +1,75 @@
+import threading
+
+
+# 普通收藏夹最多容纳的视频数
+FAV_CAPACITY = 1000
+
+# 收藏夹放不下时的处理方式
+# 'stop': 超出容量的视频不发送请求；'split': 写入自动创建的续建收藏夹
+OVERFLOW_STOP = 'stop'
+OVERFLOW_SPLIT = 'split'
+OVERFLOW_MODE = OVERFLOW_STOP
+
+
+class FolderPlan:
+    """
+    一个目标收藏夹及其续建收藏夹的剩余容量
+    写入前为每个视频分配收藏夹，收藏夹放满时不再向它发送请求
+    """
+
+    def __init__(self, fav_id, title, media_count, capacity=FAV_CAPACITY, overflow=OVERFLOW_MODE,
+                 continuations=(), create=None):
+        """
+        :param media_count: 目标收藏夹中现有的视频数
+        :param continuations: 之前创建的续建收藏夹 [(收藏夹ID, 现有视频数)]
+        :param create: create(序号)创建第序号个收藏夹并返回其ID，失败时返回None
+        """
+        self.fav_id = fav_id
+        self.title = title
+        self.capacity = capacity
+        self.overflow = overflow
+        self.create = create
+        # [收藏夹ID, 剩余容量]，按写入顺序排列
+        self.folders = [[fav_id, max(0, capacity - media_count)]]
+        for folder_id, count in continuations:
+            self.folders.append([folder_id, max(0, capacity - count)])
+        self.created = []
+        self.overflowed = 0
+        self.lock = threading.Lock()
+        self._current = 0
+
+    def free(self):
+        """
+        :return: 现有收藏夹的剩余容量之和，不包括还未创建的续建收藏夹
+        """
+        with self.lock:
+            return sum(free for _, free in self.folders)
+
+    def folder_ids(self):
+        with self.lock:
+            return [folder_id for folder_id, _ in self.folders]
+
+    def assign(self):
+        """
+        为一个视频分配收藏夹
+        :return: 收藏夹ID，所有收藏夹都放不下时返回None
+        """
+        with self.lock:
+            while self._current < len(self.folders):
+                folder = self.folders[self._current]
+                if folder[1] > 0:
+                    folder[1] -= 1
+                    return folder[0]
+                self._current += 1
+
+            if self.overflow == OVERFLOW_SPLIT and self.create is not None:
+                folder_id = self.create(len(self.folders) + 1)
+                if folder_id is not None:
+                    self.folders.append([folder_id, self.capacity - 1])
+                    self.created.append(folder_id)
+                    return folder_id
+                # 创建失败后不再重试，剩余视频按stop处理
+                self.create = None
+
+            self.overflowed += 1
+            return None
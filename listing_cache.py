@@ -0,0 +1,261 @@
+import sqlite3
+import threading
+import time
+
+from video_record import VideoRecord
+
+
+# 默认缓存文件
+CACHE_FILE = "bilibili_cache.db"
+
+# 缓存有效期（秒），过期后增量刷新
+CACHE_TTL = 6 * 60 * 60
+
+
+class CachedListing:
+    """
+    缓存中的一个合集/视频列表
+    """
+    __slots__ = ('videos', 'total', 'fetched_at')
+
+    def __init__(self, videos, total, fetched_at):
+        self.videos = videos
+        self.total = total
+        self.fetched_at = fetched_at
+
+
+class ListingCache:
+    """
+    以 (uid, 类型, 合集ID) 为键的SQLite列表缓存
+    类型为'season'(合集)或'series'(视频列表)
+    使用WAL模式：多账号模式中多个进程共用同一个缓存文件时，读取不被写入阻塞，写入之间按顺序等待
+    """
+
+    def __init__(self, path=CACHE_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        conn = self._connect()
+        try:
+            # WAL模式记录在数据库文件中，只需设置一次
+            conn.execute("PRAGMA journal_mode=WAL")
+        finally:
+            conn.close()
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS listings (
+                    uid TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    source_id TEXT NOT NULL,
+                    total INTEGER,
+                    fetched_at REAL NOT NULL,
+                    PRIMARY KEY (uid, kind, source_id)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS listing_videos (
+                    uid TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    source_id TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    aid INTEGER NOT NULL,
+                    bvid TEXT,
+                    title TEXT,
+                    pic TEXT,
+                    duration INTEGER,
+                    PRIMARY KEY (uid, kind, source_id, position)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS source_endpoints (
+                    uid TEXT NOT NULL,
+                    source_id TEXT NOT NULL,
+                    endpoint TEXT NOT NULL,
+                    PRIMARY KEY (uid, source_id)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS continuation_folders (
+                    fav_id TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    folder_id TEXT NOT NULL,
+                    PRIMARY KEY (fav_id, position)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS folder_indexes (
+                    up_mid TEXT PRIMARY KEY,
+                    fetched_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS indexed_folders (
+                    up_mid TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    folder_id TEXT NOT NULL,
+                    title TEXT NOT NULL,
+                    media_count INTEGER,
+                    PRIMARY KEY (up_mid, position)
+                )
+            """)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def load(self, uid, kind, source_id):
+        """
+        读取缓存
+        :return: CachedListing，没有缓存时返回None
+        """
+        key = (str(uid), kind, str(source_id))
+        with self.lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT total, fetched_at FROM listings WHERE uid=? AND kind=? AND source_id=?",
+                key
+            ).fetchone()
+            if row is None:
+                return None
+            rows = conn.execute(
+                "SELECT bvid, aid, title, pic, duration FROM listing_videos "
+                "WHERE uid=? AND kind=? AND source_id=? ORDER BY position",
+                key
+            ).fetchall()
+
+        videos = [VideoRecord(aid, bvid, title, duration, pic)
+                  for bvid, aid, title, pic, duration in rows]
+        return CachedListing(videos, row[0], row[1])
+
+    def save(self, uid, kind, source_id, videos, total=None):
+        """
+        覆盖保存一个列表，视频按列表中的顺序存储
+        """
+        self.begin(uid, kind, source_id)
+        self.append(uid, kind, source_id, 0, videos)
+        self.finish(uid, kind, source_id, total)
+
+    def begin(self, uid, kind, source_id):
+        """
+        开始分页写入一个列表，清除旧缓存
+        finish之前该列表视为不存在，中途中断不会留下不完整的缓存
+        """
+        key = (str(uid), kind, str(source_id))
+        with self.lock, self._connect() as conn:
+            conn.execute("DELETE FROM listings WHERE uid=? AND kind=? AND source_id=?", key)
+            conn.execute("DELETE FROM listing_videos WHERE uid=? AND kind=? AND source_id=?", key)
+
+    def append(self, uid, kind, source_id, start, videos):
+        """
+        追加一页视频
+        :param start: 这一页第一个视频在列表中的位置
+        """
+        key = (str(uid), kind, str(source_id))
+        with self.lock, self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO listing_videos VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [key + (position, video['aid'], video['bvid'], video['title'],
+                        video.get('pic'), video.get('duration', 0))
+                 for position, video in enumerate(videos, start)]
+            )
+
+    def finish(self, uid, kind, source_id, total=None):
+        """
+        完成分页写入
+        :param total: 接口返回的总数，默认为已写入的视频数量
+        """
+        key = (str(uid), kind, str(source_id))
+        with self.lock, self._connect() as conn:
+            if total is None:
+                total = conn.execute(
+                    "SELECT COUNT(*) FROM listing_videos WHERE uid=? AND kind=? AND source_id=?", key
+                ).fetchone()[0]
+            conn.execute(
+                "INSERT OR REPLACE INTO listings VALUES (?, ?, ?, ?, ?)",
+                key + (total, time.time())
+            )
+
+    def get_endpoint(self, uid, source_id):
+        """
+        :return: 该来源上次成功使用的接口，没有记录时返回None
+        """
+        with self.lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT endpoint FROM source_endpoints WHERE uid=? AND source_id=?",
+                (str(uid), str(source_id))
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_endpoint(self, uid, source_id, endpoint):
+        """
+        记录该来源成功使用的接口
+        """
+        with self.lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO source_endpoints VALUES (?, ?, ?)",
+                (str(uid), str(source_id), endpoint)
+            )
+
+    def get_continuations(self, fav_id):
+        """
+        :return: 为该收藏夹创建过的续建收藏夹ID列表，按创建顺序
+        """
+        with self.lock, self._connect() as conn:
+            rows = conn.execute(
+                "SELECT folder_id FROM continuation_folders WHERE fav_id=? ORDER BY position",
+                (str(fav_id),)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def add_continuation(self, fav_id, folder_id):
+        """
+        记录为该收藏夹新创建的续建收藏夹
+        """
+        with self.lock, self._connect() as conn:
+            conn.execute(
+                "INSERT INTO continuation_folders VALUES (?, "
+                "(SELECT COUNT(*) FROM continuation_folders WHERE fav_id=?), ?)",
+                (str(fav_id), str(fav_id), str(folder_id))
+            )
+
+    def load_folders(self, up_mid):
+        """
+        读取账号的收藏夹索引
+        :return: ([(收藏夹ID, 名称, 视频数)], 获取时间)，没有缓存时返回None
+        """
+        with self.lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT fetched_at FROM folder_indexes WHERE up_mid=?", (str(up_mid),)
+            ).fetchone()
+            if row is None:
+                return None
+            folders = conn.execute(
+                "SELECT folder_id, title, media_count FROM indexed_folders WHERE up_mid=? ORDER BY position",
+                (str(up_mid),)
+            ).fetchall()
+        return folders, row[0]
+
+    def save_folders(self, up_mid, folders, fetched_at=None):
+        """
+        覆盖保存账号的收藏夹索引
+        :param folders: [(收藏夹ID, 名称, 视频数)]
+        """
+        with self.lock, self._connect() as conn:
+            conn.execute("DELETE FROM indexed_folders WHERE up_mid=?", (str(up_mid),))
+            conn.executemany(
+                "INSERT INTO indexed_folders VALUES (?, ?, ?, ?, ?)",
+                [(str(up_mid), position, str(folder_id), title, media_count)
+                 for position, (folder_id, title, media_count) in enumerate(folders)]
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO folder_indexes VALUES (?, ?)",
+                (str(up_mid), time.time() if fetched_at is None else fetched_at)
+            )
+
+    def add_folder(self, up_mid, folder_id, title, media_count=0):
+        """
+        把新创建的收藏夹追加到索引，不改变索引的获取时间
+        """
+        with self.lock, self._connect() as conn:
+            conn.execute(
+                "INSERT INTO indexed_folders VALUES (?, "
+                "(SELECT COUNT(*) FROM indexed_folders WHERE up_mid=?), ?, ?, ?)",
+                (str(up_mid), str(up_mid), str(folder_id), title, media_count)
+            )
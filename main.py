@@ -7,7 +7,17 @@ B站合集视频转收藏夹工具
 
 import os
 import json
-from FromListsToFavlist import FromListsToFavlist
+import argparse
+from FromListsToFavlist import SEASON_MAX_PAGE_SIZE, SEASON_PAGE_SIZE, FromListsToFavlist
+from batch_runner import BATCH_WORKERS, REPORT_FILE, BatchRunner, load_manifest
+from folder_plan import OVERFLOW_MODE, OVERFLOW_SPLIT, OVERFLOW_STOP
+from listing_cache import ListingCache
+from session_state import SessionState
+from watch_daemon import WATCH_STATE_FILE, WatchDaemon
+from metrics import METRICS_FILE, QuietProgress
+from profiler import PROFILE_REPORT_FILE, PROFILE_STATS_FILE
+from retry_queue import DEAD_LETTER_FILE
+from multi_account import ACCOUNT_PROCESSES, MULTI_REPORT_FILE, MultiAccountRunner, load_accounts
 
 # cookies文件路径
 COOKIES_FILE = "bilibili_cookies.txt"
@@ -74,15 +84,16 @@ def create_cookies_file():
         print(f"\n❌ 创建文件失败: {str(e)}")
         return False
 
-def read_cookies_from_file():
+def read_cookies_from_file(path=COOKIES_FILE):
     """
     从文件读取cookies
+    :param path: cookies文件路径，多账号时每个账号一个文件
     """
     try:
-        if not os.path.exists(COOKIES_FILE):
+        if not os.path.exists(path):
             return None
             
-        with open(COOKIES_FILE, 'r', encoding='utf-8') as f:
+        with open(path, 'r', encoding='utf-8') as f:
             content = f.read().strip()
         
         # 过滤掉注释行和空行
@@ -220,7 +231,7 @@ def test_cookies():
         return
     
     print("\n正在测试cookies...")
-    transfer = FromListsToFavlist(cookies)
+    transfer = FromListsToFavlist(cookies, session_state=SessionState())
     
     if transfer.verify_login():
         print("\n🎉 Cookies有效！你可以使用主程序进行转移操作了。")
@@ -306,33 +317,86 @@ def main():
         print("错误: 合集URL不能为空")
         return
     
-    fav_url = input("\n2. 请输入收藏夹URL: ").strip()
-    if not fav_url:
+    print("\n2. 请输入收藏夹URL或名称，每行一个，输入空行结束:")
+    fav_urls = read_fav_urls()
+    if not fav_urls:
         print("错误: 收藏夹URL不能为空")
         return
     
     # 确认操作
     print(f"\n即将执行操作:")
     print(f"源合集: {collection_url}")
-    print(f"目标收藏夹: {fav_url}")
+    for fav_url in fav_urls:
+        print(f"目标收藏夹: {fav_url}")
     
     confirm = input("\n确认执行吗? (y/N): ").strip().lower()
     if confirm != 'y':
         print("操作已取消")
         return
     
+    # 按名称指定的收藏夹不存在时，只有确认后才创建
+    create_folders = False
+    if any(FromListsToFavlist.fav_id_from_url(fav_url) is None for fav_url in fav_urls):
+        create_folders = input("按名称指定的收藏夹不存在时是否创建? (y/N): ").strip().lower() == 'y'
+    
     print("\n" + "=" * 60)
     
-    # 执行转移
-    transfer = FromListsToFavlist(cookies)
-    success_count, failed_count = transfer.transfer_collection_to_favorites(collection_url, fav_url)
+    # 执行转移，合集列表缓存在本地以便下次增量刷新
+    run_transfer(cookies, collection_url, fav_urls, create_folders=create_folders)
+
+def read_fav_urls():
+    """
+    逐行读取收藏夹URL或名称，名称中可以包含空格和逗号，遇到空行结束
+    """
+    fav_urls = []
+    while True:
+        line = input("   > ").strip()
+        if not line:
+            return fav_urls
+        fav_urls.append(line)
+
+def write_metrics(transfer, metrics_file=METRICS_FILE, prometheus_file=None):
+    """
+    写入请求统计的JSON汇总，指定prometheus_file时同时写入Prometheus文本格式
+    """
+    transfer.metrics.write_json(metrics_file, transfer.rate_limiter)
+    if prometheus_file:
+        transfer.metrics.write_prometheus(prometheus_file, transfer.rate_limiter)
+
+def run_transfer(cookies, collection_url, fav_urls, force_refresh=False, overflow=OVERFLOW_MODE, profile=False,
+                 page_size=None, create_folders=False, metrics_file=METRICS_FILE, prometheus_file=None, quiet=False):
+    """
+    将一个合集转移到一个或多个收藏夹，合集只获取一次
+    :param overflow: 收藏夹放不下时的处理，'stop'或'split'
+    :param profile: 对每个阶段进行性能剖析，写入剖析报告和pstats文件
+    :param page_size: 获取列表时每页的视频数量，默认使用FromListsToFavlist中的设置
+    :param create_folders: 按名称指定的收藏夹不存在时是否创建
+    :param metrics_file: 请求统计的JSON汇总文件
+    :param prometheus_file: 可选的Prometheus文本格式统计文件
+    :param quiet: 不逐个打印视频，只定期打印汇总
+    :return: 是否全部成功
+    """
+    transfer = FromListsToFavlist(cookies, listing_cache=ListingCache(), session_state=SessionState(),
+                                  progress=QuietProgress() if quiet else None, overflow=overflow, profile=profile,
+                                  page_size=page_size, create_folders=create_folders)
+    results = transfer.transfer_collection_to_many_favorites(collection_url, fav_urls, force_refresh)
+    write_metrics(transfer, metrics_file, prometheus_file)
+    if transfer.profiler is not None:
+        transfer.profiler.finish()
+    success_count = sum(success for success, _ in results.values())
+    failed_count = sum(failed for _, failed in results.values())
     
     print("=" * 60)
     print("操作完成!")
+    if len(results) > 1:
+        for fav_id, (success, failed) in results.items():
+            print(f"收藏夹 {fav_id}: 成功 {success}, 失败 {failed}")
     if success_count > 0:
         print(f"成功转移 {success_count} 个视频到收藏夹")
     if failed_count > 0:
         print(f"有 {failed_count} 个视频转移失败")
+    print(f"请求统计已写入 {metrics_file}")
+    return bool(results) and failed_count == 0
 
 def show_cookies_status():
     """
@@ -380,5 +444,185 @@ def show_cookies_status():
         print("❌ 文件不存在")
         print("\n💡 使用选项3创建cookies文件")
 
+def run_batch(manifest, report_file=REPORT_FILE, workers=BATCH_WORKERS, force_refresh=False,
+              metrics_file=METRICS_FILE, prometheus_file=None, quiet=False, overflow=OVERFLOW_MODE, page_size=None,
+              create_folders=False):
+    """
+    非交互批量模式：按任务清单执行多个合集转收藏夹
+    :param metrics_file: 请求统计的JSON汇总文件
+    :param prometheus_file: 可选的Prometheus文本格式统计文件
+    :param quiet: 不逐个打印视频，只定期打印汇总
+    :param overflow: 收藏夹放不下时的处理，'stop'或'split'
+    :param page_size: 获取列表时每页的视频数量
+    :param create_folders: 按名称指定的收藏夹不存在时是否创建
+    """
+    cookies = read_cookies_from_file()
+    if not cookies:
+        print(f"❌ 无法从 {COOKIES_FILE} 读取cookies")
+        return False
+
+    try:
+        jobs = load_manifest(manifest)
+    except Exception as e:
+        print(f"❌ 读取任务清单失败: {str(e)}")
+        return False
+
+    print(f"从 {manifest} 读取到 {len(jobs)} 个任务")
+
+    transfer = FromListsToFavlist(cookies, listing_cache=ListingCache(), session_state=SessionState(),
+                                  progress=QuietProgress() if quiet else None, overflow=overflow,
+                                  page_size=page_size, create_folders=create_folders)
+    runner = BatchRunner(transfer, workers=workers, force_refresh=force_refresh)
+    batch = runner.run(jobs)
+    report = BatchRunner.write_report(batch, report_file)
+    write_metrics(transfer, metrics_file, prometheus_file)
+
+    print("=" * 60)
+    print("批量任务完成!")
+    print(f"成功 {report['success']}, 失败 {report['failed']}, "
+          f"已存在 {report['skipped']}, 重复 {report['duplicates']}, 出错任务 {report['errors']}")
+    print(f"结果报告已写入 {report_file}，请求统计已写入 {metrics_file}")
+    return report['errors'] == 0 and report['failed'] == 0
+
+def run_watch(manifest, state_file=WATCH_STATE_FILE, once=False, overflow=OVERFLOW_MODE, page_size=None,
+              create_folders=False, metrics_file=METRICS_FILE, prometheus_file=None):
+    """
+    监视模式：按任务清单订阅合集，持续把新上传的视频同步到收藏夹，始终只打印汇总
+    :param once: 每个订阅只轮询一次，适合由cron定时运行
+    :param create_folders: 按名称指定的收藏夹不存在时是否创建
+    :param metrics_file: 请求统计的JSON汇总文件
+    :param prometheus_file: 可选的Prometheus文本格式统计文件
+    """
+    cookies = read_cookies_from_file()
+    if not cookies:
+        print(f"❌ 无法从 {COOKIES_FILE} 读取cookies")
+        return False
+
+    try:
+        jobs = load_manifest(manifest)
+    except Exception as e:
+        print(f"❌ 读取任务清单失败: {str(e)}")
+        return False
+
+    transfer = FromListsToFavlist(cookies, listing_cache=ListingCache(), session_state=SessionState(),
+                                  progress=QuietProgress(), overflow=overflow, page_size=page_size,
+                                  create_folders=create_folders)
+    if not transfer.verify_login():
+        return False
+
+    daemon = WatchDaemon.from_jobs(transfer, jobs, state_file)
+    daemon.run(once=once)
+    write_metrics(transfer, metrics_file, prometheus_file)
+    print(f"订阅状态已写入 {state_file}，请求统计已写入 {metrics_file}")
+    return True
+
+def run_replay(path=DEAD_LETTER_FILE, cookie_file=COOKIES_FILE, metrics_file=METRICS_FILE, prometheus_file=None,
+               quiet=False):
+    """
+    重新添加死信文件中之前失败的视频，只重放cookies所属账号的死信
+    :param cookie_file: cookies文件，重放多账号模式中某个账号的死信时使用该账号的cookies文件
+    :param metrics_file: 请求统计的JSON汇总文件
+    :param prometheus_file: 可选的Prometheus文本格式统计文件
+    :param quiet: 不逐个打印视频，只定期打印汇总
+    """
+    cookies = read_cookies_from_file(cookie_file)
+    if not cookies:
+        print(f"❌ 无法从 {cookie_file} 读取cookies")
+        return False
+
+    # 会话状态文件只属于默认的cookies文件
+    session_state = SessionState() if cookie_file == COOKIES_FILE else None
+    transfer = FromListsToFavlist(cookies, session_state=session_state, dead_letter_file=path,
+                                  progress=QuietProgress() if quiet else None)
+    success, failed = transfer.replay_dead_letters()
+    write_metrics(transfer, metrics_file, prometheus_file)
+    return failed == 0
+
+def run_accounts(accounts_file, report_file=MULTI_REPORT_FILE, processes=ACCOUNT_PROCESSES,
+                 workers=BATCH_WORKERS, force_refresh=False, overflow=OVERFLOW_MODE, page_size=None,
+                 create_folders=False):
+    """
+    多账号模式：每个账号在单独的进程中执行自己的任务清单，所有账号共享出口IP的请求配额
+    :param accounts_file: 账号清单，每行包含cookies文件和任务清单
+    :param processes: 同时运行的账号数
+    :param create_folders: 按名称指定的收藏夹不存在时是否创建
+    """
+    try:
+        accounts = load_accounts(accounts_file)
+    except Exception as e:
+        print(f"❌ 读取账号清单失败: {str(e)}")
+        return False
+
+    print(f"从 {accounts_file} 读取到 {len(accounts)} 个账号")
+    client_options = {'create_folders': create_folders}
+    if page_size:
+        client_options['page_size'] = page_size
+    runner = MultiAccountRunner(accounts, processes=processes, workers=workers,
+                                force_refresh=force_refresh, overflow=overflow, client_options=client_options)
+    report = MultiAccountRunner.write_report(runner.run(), report_file)
+
+    print("=" * 60)
+    print("多账号任务完成!")
+    print(f"成功 {report['success']}, 失败 {report['failed']}, "
+          f"已存在 {report['skipped']}, 重复 {report['duplicates']}, 出错 {report['errors']}")
+    print(f"结果报告已写入 {report_file}，各账号的输出在 {runner.log_dir} 目录")
+    return report['errors'] == 0 and report['failed'] == 0
+
+def parse_args():
+    """
+    解析命令行参数，不带参数时进入交互菜单
+    """
+    parser = argparse.ArgumentParser(description="B站合集转收藏夹工具")
+    parser.add_argument('--collection', help="合集URL，与--fav一起使用时直接执行转移")
+    parser.add_argument('--fav', nargs='+', help="一个或多个收藏夹URL或名称，合集只获取一次并同时写入所有收藏夹；名称中有空格时用引号括起来")
+    parser.add_argument('--manifest', help="任务清单文件(JSON或CSV)，每个任务包含合集URL和收藏夹URL")
+    parser.add_argument('--watch', metavar='MANIFEST', help="监视模式：订阅清单中的合集，持续同步新上传的视频")
+    parser.add_argument('--watch-state', default=WATCH_STATE_FILE, help=f"监视模式的状态文件，默认 {WATCH_STATE_FILE}")
+    parser.add_argument('--once', action='store_true', help="监视模式中每个订阅只轮询一次后退出，适合cron")
+    parser.add_argument('--accounts', help="多账号清单文件(JSON或CSV)，每个账号包含cookies文件和任务清单")
+    parser.add_argument('--processes', type=int, default=ACCOUNT_PROCESSES, help="多账号模式中同时运行的账号数")
+    parser.add_argument('--replay', nargs='?', const=DEAD_LETTER_FILE, metavar='FILE',
+                        help=f"重新添加死信文件中之前失败的视频，默认 {DEAD_LETTER_FILE}")
+    parser.add_argument('--cookies', default=COOKIES_FILE,
+                        help=f"--replay使用的cookies文件，默认 {COOKIES_FILE}，只重放该账号的死信")
+    parser.add_argument('--report', help=f"结果报告文件，默认 {REPORT_FILE}，多账号模式默认 {MULTI_REPORT_FILE}")
+    parser.add_argument('--workers', type=int, default=BATCH_WORKERS, help="同时执行的任务数")
+    parser.add_argument('--refresh', action='store_true', help="忽略合集列表缓存，重新获取完整列表")
+    parser.add_argument('--metrics-json', default=METRICS_FILE, help=f"请求统计的JSON汇总文件，默认 {METRICS_FILE}")
+    parser.add_argument('--prometheus', help="同时以Prometheus文本格式写入请求统计")
+    parser.add_argument('--quiet', action='store_true', help="不逐个打印视频，只定期打印进度汇总（监视模式始终如此）")
+    parser.add_argument('--profile', action='store_true',
+                        help=f"对转移的每个阶段进行性能剖析，写入 {PROFILE_REPORT_FILE} 和 {PROFILE_STATS_FILE}")
+    parser.add_argument('--overflow', choices=[OVERFLOW_STOP, OVERFLOW_SPLIT], default=OVERFLOW_MODE,
+                        help="收藏夹放不下时: stop 不添加超出的视频，split 自动创建续建收藏夹")
+    parser.add_argument('--create', action='store_true',
+                        help="按名称指定的收藏夹不存在时创建，默认报错，避免名称输错时创建多余的收藏夹")
+    parser.add_argument('--page-size', type=int,
+                        help=f"获取列表时每页的视频数量，最大 {SEASON_MAX_PAGE_SIZE}，默认 {SEASON_PAGE_SIZE}")
+    return parser.parse_args()
+
 if __name__ == "__main__":
+    args = parse_args()
+    if args.collection and args.fav:
+        cookies = read_cookies_from_file()
+        if not cookies:
+            print(f"❌ 无法从 {COOKIES_FILE} 读取cookies")
+            raise SystemExit(1)
+        raise SystemExit(0 if run_transfer(cookies, args.collection, args.fav, args.refresh, args.overflow,
+                                        args.profile, args.page_size, args.create,
+                                        args.metrics_json, args.prometheus, args.quiet) else 1)
+    if args.watch:
+        raise SystemExit(0 if run_watch(args.watch, args.watch_state, args.once, args.overflow,
+                                        args.page_size, args.create, args.metrics_json, args.prometheus) else 1)
+    if args.replay:
+        raise SystemExit(0 if run_replay(args.replay, args.cookies, args.metrics_json, args.prometheus,
+                                         args.quiet) else 1)
+    if args.accounts:
+        raise SystemExit(0 if run_accounts(args.accounts, args.report or MULTI_REPORT_FILE, args.processes,
+                                           args.workers, args.refresh, args.overflow, args.page_size,
+                                           args.create) else 1)
+    if args.manifest:
+        raise SystemExit(0 if run_batch(args.manifest, args.report or REPORT_FILE, args.workers, args.refresh,
+                                        args.metrics_json, args.prometheus, args.quiet,
+                                        args.overflow, args.page_size, args.create) else 1)
     main()
\ No newline at end of file
@@ -0,0 +1,245 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+
+# 延迟直方图的桶上限（秒），与Prometheus的默认桶一致
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 默认的JSON汇总文件
+METRICS_FILE = "bilibili_metrics.json"
+
+
+class LatencyHistogram:
+    """
+    累积桶直方图
+    """
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += seconds
+        self.count += 1
+
+    def cumulative(self):
+        """
+        :return: [(桶上限, 累计数量)]，最后一个桶上限为'+Inf'
+        """
+        result = []
+        running = 0
+        for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), self.counts):
+            running += count
+            result.append((bound, running))
+        return result
+
+    def quantile(self, fraction):
+        """
+        用桶上限估算分位数
+        """
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        for bound, running in self.cumulative():
+            if running >= target:
+                return bound if bound != '+Inf' else LATENCY_BUCKETS[-1]
+        return LATENCY_BUCKETS[-1]
+
+
+class Metrics:
+    """
+    按接口和结果码统计请求次数、延迟和重试，并记录转移各阶段的耗时
+    """
+
+    def __init__(self, profiler=None):
+        """
+        :param profiler: PhaseProfiler，设置后每个阶段同时进行性能剖析
+        """
+        self.lock = threading.Lock()
+        self.profiler = profiler
+        self.requests = {}
+        self.latencies = {}
+        self.retries = {}
+        self.phases = {}
+        self.started = time.time()
+
+    def observe(self, endpoint, code, seconds):
+        """
+        记录一次请求
+        :param code: 接口返回的业务码，没有业务码时为HTTP状态码
+        """
+        with self.lock:
+            key = (endpoint, str(code))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            histogram = self.latencies.get(endpoint)
+            if histogram is None:
+                histogram = self.latencies[endpoint] = LatencyHistogram()
+            histogram.observe(seconds)
+
+    def retry(self, endpoint):
+        with self.lock:
+            self.retries[endpoint] = self.retries.get(endpoint, 0) + 1
+
+    def add_phase(self, name, seconds):
+        with self.lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name):
+        """
+        统计with块的耗时，同名阶段的耗时累加
+        """
+        start = time.perf_counter()
+        token = None
+        try:
+            if self.profiler is not None:
+                token = self.profiler.enter(name)
+            yield
+        finally:
+            if token is not None:
+                self.profiler.exit(token)
+            self.add_phase(name, time.perf_counter() - start)
+
+    def summary(self, rate_limiter=None):
+        """
+        :param rate_limiter: 提供限速等待时间的AdaptiveRateLimiter
+        :return: 可序列化为JSON的汇总
+        """
+        with self.lock:
+            endpoints = {}
+            for (endpoint, code), count in sorted(self.requests.items()):
+                entry = endpoints.setdefault(endpoint, {'requests': 0, 'codes': {}})
+                entry['requests'] += count
+                entry['codes'][code] = count
+            for endpoint, histogram in self.latencies.items():
+                entry = endpoints[endpoint]
+                entry['latency_avg_ms'] = round(histogram.total / histogram.count * 1000, 2)
+                entry['latency_p50_ms'] = round(histogram.quantile(0.5) * 1000, 2)
+                entry['latency_p95_ms'] = round(histogram.quantile(0.95) * 1000, 2)
+                entry['retries'] = self.retries.get(endpoint, 0)
+            phases = {name: round(seconds, 4) for name, seconds in self.phases.items()}
+
+        if rate_limiter is not None:
+            with rate_limiter.lock:
+                for endpoint, stats in rate_limiter.stats.items():
+                    entry = endpoints.setdefault(endpoint, {'requests': 0, 'codes': {}})
+                    entry['sleep_seconds'] = round(stats.wait_time + stats.throttle_time, 4)
+                    entry['throttled'] = stats.throttled
+
+        return {
+            'started': self.started,
+            'elapsed': round(time.time() - self.started, 4),
+            'requests': sum(entry['requests'] for entry in endpoints.values()),
+            'phases': phases,
+            'endpoints': endpoints,
+        }
+
+    def write_json(self, path=METRICS_FILE, rate_limiter=None):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(rate_limiter), f, ensure_ascii=False, indent=2)
+
+    def write_prometheus(self, path, rate_limiter=None):
+        """
+        以Prometheus文本格式写入，供node_exporter的textfile收集器读取
+        """
+        lines = [
+            '# HELP bilibili_requests_total Requests by endpoint and result code.',
+            '# TYPE bilibili_requests_total counter',
+        ]
+        with self.lock:
+            for (endpoint, code), count in sorted(self.requests.items()):
+                lines.append(f'bilibili_requests_total{{endpoint="{endpoint}",code="{code}"}} {count}')
+
+            lines += [
+                '# HELP bilibili_request_retries_total Requests retried after throttling.',
+                '# TYPE bilibili_request_retries_total counter',
+            ]
+            for endpoint, count in sorted(self.retries.items()):
+                lines.append(f'bilibili_request_retries_total{{endpoint="{endpoint}"}} {count}')
+
+            lines += [
+                '# HELP bilibili_request_duration_seconds Request latency by endpoint.',
+                '# TYPE bilibili_request_duration_seconds histogram',
+            ]
+            for endpoint, histogram in sorted(self.latencies.items()):
+                for bound, running in histogram.cumulative():
+                    lines.append(f'bilibili_request_duration_seconds_bucket'
+                                 f'{{endpoint="{endpoint}",le="{bound}"}} {running}')
+                lines.append(f'bilibili_request_duration_seconds_sum{{endpoint="{endpoint}"}} {histogram.total}')
+                lines.append(f'bilibili_request_duration_seconds_count{{endpoint="{endpoint}"}} {histogram.count}')
+
+            lines += [
+                '# HELP bilibili_phase_seconds Time spent in each transfer phase.',
+                '# TYPE bilibili_phase_seconds gauge',
+            ]
+            for name, seconds in sorted(self.phases.items()):
+                lines.append(f'bilibili_phase_seconds{{phase="{name}"}} {seconds}')
+
+        if rate_limiter is not None:
+            lines += [
+                '# HELP bilibili_rate_limit_sleep_seconds Time spent waiting in the rate limiter.',
+                '# TYPE bilibili_rate_limit_sleep_seconds counter',
+            ]
+            with rate_limiter.lock:
+                for endpoint, stats in sorted(rate_limiter.stats.items()):
+                    lines.append(f'bilibili_rate_limit_sleep_seconds{{endpoint="{endpoint}",reason="pacing"}} '
+                                 f'{stats.wait_time}')
+                    lines.append(f'bilibili_rate_limit_sleep_seconds{{endpoint="{endpoint}",reason="throttle"}} '
+                                 f'{stats.throttle_time}')
+
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+
+
+class PrintProgress:
+    """
+    逐个视频打印进度，与原来的输出相同
+    """
+
+    def found(self, video):
+        print(f"找到视频: {video['title']} (BV{video['bvid']})")
+
+    def added(self, i, total, video):
+        print(f"[{i}/{total}] 成功添加: {video['title']}")
+
+    def failed(self, i, total, video, message):
+        print(f"[{i}/{total}] 添加失败: {video['title']} - {message}")
+
+
+class QuietProgress:
+    """
+    低开销的进度输出：只计数，每隔every个视频打印一行汇总，失败的视频仍然逐个打印
+    """
+
+    def __init__(self, every=500):
+        self.every = every
+        self.lock = threading.Lock()
+        self.found_count = 0
+        self.done_count = 0
+
+    def found(self, video):
+        with self.lock:
+            self.found_count += 1
+            if self.found_count % self.every == 0:
+                print(f"已获取 {self.found_count} 个视频")
+
+    def added(self, i, total, video):
+        with self.lock:
+            self.done_count += 1
+            if self.done_count % self.every == 0:
+                print(f"已处理 {self.done_count} 个视频")
+
+    def failed(self, i, total, video, message):
+        with self.lock:
+            self.done_count += 1
+        print(f"[{i}/{total}] 添加失败: {video['title']} - {message}")
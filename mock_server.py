@@ -0,0 +1,313 @@
+"""
+本地模拟B站API服务器，用于离线测试和性能基准
+支持 nav、view、seasons_archives_list、home/seasons_series、series/archives、
+fav/resource/deal、fav/resource/batch-deal、fav/resource/ids、fav/folder/info、fav/folder/add
+和 fav/folder/created/list-all
+"""
+
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class MockConfig:
+    """
+    模拟服务器的配置
+    """
+
+    def __init__(self, season_size=100, series_size=100, uid=1, season_id=1000, series_id=2000,
+                 latency=0.0, jitter=0.0, max_page_size=100, error_rate=0.0,
+                 throttle_rate=0.0, throttle_code=-799, seed=None, fav_capacity=None,
+                 rotate_csrf=False):
+        """
+        :param season_size: 合集中的视频数量
+        :param series_size: 视频列表中的视频数量
+        :param latency: 每个请求的固定延迟（秒）
+        :param jitter: 在固定延迟上随机增加的最大延迟（秒）
+        :param max_page_size: 列表接口允许的最大每页数量，超过时按最大值返回
+        :param error_rate: 返回HTTP 500的概率
+        :param throttle_rate: 返回限流的概率
+        :param throttle_code: 限流时返回的业务码(-412/-799)，为429时返回HTTP 429
+        :param seed: 随机数种子
+        :param fav_capacity: 每个收藏夹最多容纳的视频数，为None时不限制
+        :param rotate_csrf: nav请求时下发新的bili_jct，之后的写入请求必须使用新的csrf
+        """
+        self.season_size = season_size
+        self.series_size = series_size
+        self.uid = uid
+        self.season_id = season_id
+        self.series_id = series_id
+        self.latency = latency
+        self.jitter = jitter
+        self.max_page_size = max_page_size
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.throttle_code = throttle_code
+        self.seed = seed
+        self.fav_capacity = fav_capacity
+        self.rotate_csrf = rotate_csrf
+
+
+def _archive(aid):
+    return {
+        'aid': aid,
+        'bvid': f"BV{aid:010d}",
+        'title': f"视频 {aid}",
+        'pic': f"https://i0.hdslb.com/bfs/archive/{aid}.jpg",
+        'duration': 60 + aid % 600,
+    }
+
+
+class MockBilibiliServer:
+    """
+    在后台线程中运行的模拟服务器
+    合集的aid为 1..season_size，视频列表的aid为 1_000_001..
+    """
+
+    def __init__(self, config=None, host='127.0.0.1', port=0):
+        self.config = config or MockConfig()
+        self.host = host
+        self.port = port
+        self.counts = Counter()
+        self.favorites = {}
+        self.folder_titles = {}
+        self.next_folder_id = 900001
+        self.csrf = None
+        self.lock = threading.Lock()
+        self.random = random.Random(self.config.seed)
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self._server.server_address[1]}"
+
+    def start(self):
+        self._server = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def reset(self):
+        """
+        清空请求计数和收藏夹内容
+        """
+        with self.lock:
+            self.counts.clear()
+            self.favorites.clear()
+            self.folder_titles.clear()
+
+    def _page(self, aids, page, page_size):
+        page_size = min(page_size, self.config.max_page_size)
+        start = (page - 1) * page_size
+        return [_archive(aid) for aid in aids[start:start + page_size]], page_size
+
+    def _fav_set(self, fav_id):
+        return self.favorites.setdefault(str(fav_id), set())
+
+    def _fits(self, targets, count):
+        capacity = self.config.fav_capacity
+        return capacity is None or all(len(target) + count <= capacity for target in targets)
+
+    def handle(self, method, path, params):
+        """
+        处理一个请求
+        :return: (HTTP状态码, JSON对象) 或 (HTTP状态码, JSON对象, 响应头)
+        """
+        config = self.config
+        endpoint = path.rsplit('/x/', 1)[-1]
+
+        with self.lock:
+            self.counts[endpoint] += 1
+            roll_error = self.random.random()
+            roll_throttle = self.random.random()
+            delay = config.latency + self.random.random() * config.jitter
+
+        if delay > 0:
+            time.sleep(delay)
+
+        if roll_error < config.error_rate:
+            return 500, {'code': -500, 'message': '服务器错误'}
+        if roll_throttle < config.throttle_rate:
+            if config.throttle_code == 429:
+                return 429, {'code': -429, 'message': 'Too Many Requests'}
+            return 200, {'code': config.throttle_code, 'message': '请求过于频繁'}
+
+        if endpoint == 'web-interface/nav':
+            body = {'code': 0, 'message': '0', 'data': {'isLogin': True, 'uname': 'mock', 'mid': config.uid}}
+            if config.rotate_csrf:
+                with self.lock:
+                    self.csrf = f"rotated{self.counts[endpoint]}"
+                return 200, body, {'Set-Cookie': f"bili_jct={self.csrf}; Path=/"}
+            return 200, body
+
+        if method == 'POST' and self.csrf is not None and params.get('csrf') != self.csrf:
+            return 200, {'code': -111, 'message': 'csrf校验失败'}
+
+        if endpoint == 'web-interface/view':
+            return 200, {'code': 0, 'data': _archive(int(params.get('aid', 0)))}
+
+        if endpoint == 'polymer/web-space/seasons_archives_list':
+            if str(params.get('season_id')) != str(config.season_id):
+                return 200, {'code': -404, 'message': '啥都木有'}
+            aids = list(range(1, config.season_size + 1))
+            if params.get('sort_reverse') in ('True', 'true', '1'):
+                aids.reverse()
+            page = int(params.get('page_num', 1))
+            archives, page_size = self._page(aids, page, int(params.get('page_size', 30)))
+            return 200, {'code': 0, 'data': {
+                'archives': archives,
+                'page': {'page_num': page, 'page_size': page_size, 'total': config.season_size},
+            }}
+
+        if endpoint == 'polymer/web-space/home/seasons_series':
+            season = {
+                'meta': {'season_id': config.season_id, 'total': config.season_size},
+                'archives': [_archive(aid) for aid in range(1, min(config.season_size, 10) + 1)],
+            }
+            page = int(params.get('page_num', 1))
+            return 200, {'code': 0, 'data': {'items_lists': {
+                'seasons_list': [season] if page == 1 else [],
+                'series_list': [],
+                'page': {'page_num': page, 'page_size': int(params.get('page_size', 10)), 'total': 1},
+            }}}
+
+        if endpoint == 'series/archives':
+            if str(params.get('series_id')) != str(config.series_id):
+                return 200, {'code': 0, 'data': {'archives': [], 'page': {'num': 1, 'size': 0, 'total': 0}}}
+            aids = list(range(1_000_001, 1_000_001 + config.series_size))
+            if params.get('sort', 'desc') == 'desc':
+                aids.reverse()
+            page = int(params.get('pn', 1))
+            archives, page_size = self._page(aids, page, int(params.get('ps', 30)))
+            return 200, {'code': 0, 'data': {
+                'archives': archives,
+                'page': {'num': page, 'size': page_size, 'total': config.series_size},
+            }}
+
+        if endpoint == 'v3/fav/resource/ids':
+            with self.lock:
+                aids = sorted(self._fav_set(params.get('media_id')))
+            return 200, {'code': 0, 'data': [
+                {'id': aid, 'type': 2, 'bv_id': _archive(aid)['bvid'], 'bvid': _archive(aid)['bvid']}
+                for aid in aids
+            ]}
+
+        if endpoint == 'v3/fav/resource/deal' and method == 'POST':
+            aid = int(params['rid'])
+            with self.lock:
+                targets = [self._fav_set(fav_id) for fav_id in params.get('add_media_ids', '').split(',') if fav_id]
+                if targets and all(aid in target for target in targets):
+                    return 200, {'code': 11201, 'message': '已经收藏过了'}
+                if not self._fits([target for target in targets if aid not in target], 1):
+                    return 200, {'code': 11007, 'message': '收藏夹已满'}
+                for target in targets:
+                    target.add(aid)
+            return 200, {'code': 0, 'message': '0'}
+
+        if endpoint == 'v3/fav/resource/batch-deal' and method == 'POST':
+            aids = [int(resource.split(':')[0]) for resource in params.get('resources', '').split(',') if resource]
+            with self.lock:
+                targets = [self._fav_set(fav_id) for fav_id in params.get('media_ids', '').split(',') if fav_id]
+                if not all(self._fits([target], len(set(aids) - target)) for target in targets):
+                    return 200, {'code': 11007, 'message': '收藏夹已满'}
+                for target in targets:
+                    target.update(aids)
+            return 200, {'code': 0, 'message': '0'}
+
+        if endpoint == 'v3/fav/folder/info':
+            fav_id = str(params.get('media_id'))
+            with self.lock:
+                count = len(self._fav_set(fav_id))
+                title = self.folder_titles.get(fav_id, f"收藏夹{fav_id}")
+            return 200, {'code': 0, 'data': {'id': int(fav_id), 'title': title, 'media_count': count}}
+
+        if endpoint == 'v3/fav/folder/created/list-all':
+            with self.lock:
+                folder_ids = sorted(set(self.folder_titles) | set(self.favorites), key=int)
+                folders = [{'id': int(fav_id), 'fid': int(fav_id) // 100, 'mid': int(params.get('up_mid', 0)),
+                            'title': self.folder_titles.get(fav_id, f"收藏夹{fav_id}"),
+                            'media_count': len(self.favorites.get(fav_id, ()))}
+                           for fav_id in folder_ids]
+            return 200, {'code': 0, 'data': {'count': len(folders), 'list': folders}}
+
+        if endpoint == 'v3/fav/folder/add' and method == 'POST':
+            with self.lock:
+                fav_id = str(self.next_folder_id)
+                self.next_folder_id += 1
+                self.folder_titles[fav_id] = params.get('title', '')
+                self._fav_set(fav_id)
+            return 200, {'code': 0, 'data': {'id': int(fav_id), 'title': params.get('title', '')}}
+
+        return 404, {'code': -404, 'message': '啥都木有'}
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _respond(self, method, params):
+                path = urlparse(self.path).path
+                status, body, *extra = server.handle(method, path, params)
+                payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                for name, value in (extra[0] if extra else {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                query = urlparse(self.path).query
+                self._respond('GET', {k: v[0] for k, v in parse_qs(query).items()})
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(length).decode('utf-8')
+                self._respond('POST', {k: v[0] for k, v in parse_qs(body).items()})
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="本地模拟B站API服务器")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--season-size', type=int, default=100)
+    parser.add_argument('--series-size', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    mock = MockBilibiliServer(MockConfig(
+        season_size=args.season_size, series_size=args.series_size,
+        latency=args.latency, jitter=args.jitter, throttle_rate=args.throttle_rate,
+    ), port=args.port).start()
+    print(f"模拟服务器运行在 {mock.base_url}，按Ctrl+C停止")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        mock.stop()
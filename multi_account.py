@@ -0,0 +1,319 @@
+import contextlib
+import csv
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.managers import BaseManager
+
+from FromListsToFavlist import FromListsToFavlist
+from batch_runner import BATCH_WORKERS, BatchRunner, load_manifest
+from folder_plan import OVERFLOW_MODE
+from listing_cache import ListingCache
+from metrics import QuietProgress
+from rate_limiter import (READ_BURST, READ_RATE, WRITE_BURST, WRITE_RATE, AdaptiveRateLimiter,
+                          TokenBucket)
+from session_state import SessionState
+
+
+# 同一出口IP的总配额：所有账号的请求加起来不超过这个速率
+IP_READ_RATE = READ_RATE
+IP_WRITE_RATE = WRITE_RATE
+
+# 同时运行的账号进程数
+ACCOUNT_PROCESSES = 4
+
+# 多账号汇总报告和每个账号的输出目录
+MULTI_REPORT_FILE = "multi_account_report.json"
+ACCOUNT_LOG_DIR = "account_logs"
+
+
+def load_accounts(path):
+    """
+    读取账号清单，支持JSON和CSV
+    JSON: [{"cookie_file": ..., "manifest": ..., "name": 可选}, ...] 或 [[cookies文件, 任务清单], ...]
+    CSV: 每行 cookies文件,任务清单[,名称]，可以带 cookie_file,manifest,name 表头
+    相对路径相对于账号清单所在目录
+    :return: [(名称, cookies文件, 任务清单)]，名称默认为cookies文件名
+    """
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        if path.lower().endswith('.json'):
+            entries = json.load(f)
+        else:
+            entries = [row for row in csv.reader(f) if row and not row[0].startswith('#')]
+            if entries and entries[0][0].strip() == 'cookie_file':
+                entries = entries[1:]
+
+    base = os.path.dirname(os.path.abspath(path))
+    accounts = []
+    names = set()
+    for entry in entries:
+        if isinstance(entry, dict):
+            cookie_file, manifest, name = entry['cookie_file'], entry['manifest'], entry.get('name')
+        else:
+            cookie_file, manifest = entry[0], entry[1]
+            name = entry[2] if len(entry) > 2 else None
+        cookie_file = os.path.join(base, cookie_file.strip())
+        manifest = os.path.join(base, manifest.strip())
+        name = (name or '').strip() or os.path.splitext(os.path.basename(cookie_file))[0]
+        name = re.sub(r'[^0-9A-Za-z_.-]', '_', name)
+        if name in names:
+            raise ValueError(f"账号名称重复: {name}")
+        names.add(name)
+        accounts.append((name, cookie_file, manifest))
+    return accounts
+
+
+class RateCoordinator:
+    """
+    运行在父进程中的请求许可分配器
+    全局令牌桶限制出口IP的总速率，被限流时所有账号一起降速和冷却；
+    每个账号另有一个令牌桶，速率为当前全局速率除以活跃账号数，保证各账号公平分配
+    所有方法只计算等待时间不睡眠，由工作进程自己等待
+    """
+
+    def __init__(self, read_rate=IP_READ_RATE, write_rate=IP_WRITE_RATE,
+                 read_burst=READ_BURST, write_burst=WRITE_BURST):
+        self.limiter = AdaptiveRateLimiter(read_rate, write_rate, read_burst, write_burst)
+        self.bursts = {'read': read_burst, 'write': write_burst}
+        # 账号名称 -> {'read': TokenBucket, 'write': TokenBucket}
+        self.accounts = {}
+        self.lock = threading.Lock()
+
+    def register(self, account):
+        with self.lock:
+            if account not in self.accounts:
+                self.accounts[account] = {
+                    kind: TokenBucket(self.limiter.max_rates[kind], self.bursts[kind])
+                    for kind in ('read', 'write')
+                }
+            self._rebalance()
+
+    def unregister(self, account):
+        """
+        账号运行结束，把它的份额分给其余账号
+        """
+        with self.lock:
+            self.accounts.pop(account, None)
+            self._rebalance()
+
+    def _rebalance(self):
+        count = max(1, len(self.accounts))
+        for kind in ('read', 'write'):
+            share = self.limiter.buckets[kind].rate / count
+            capacity = max(1.0, self.bursts[kind] / count)
+            for buckets in self.accounts.values():
+                bucket = buckets[kind]
+                if bucket.rate != share:
+                    bucket.set_rate(share)
+                bucket.capacity = capacity
+
+    def reserve(self, account, kind):
+        """
+        为account预约一个kind类型的请求
+        :return: 发送请求前需要等待的秒数
+        """
+        with self.lock:
+            buckets = self.accounts.get(account)
+        wait = self.limiter.reserve(kind, account)
+        if buckets is not None:
+            wait = max(wait, buckets[kind].reserve())
+        return wait
+
+    def on_success(self, kind):
+        rate = self.limiter.buckets[kind].rate
+        self.limiter.on_success(kind)
+        if self.limiter.buckets[kind].rate != rate:
+            with self.lock:
+                self._rebalance()
+
+    def on_throttle(self, account, kind):
+        """
+        任一账号被限流都说明出口IP被限流，全局降速后重新分配份额
+        """
+        self.limiter.on_throttle(kind, account)
+        with self.lock:
+            self._rebalance()
+
+    def summary(self):
+        """
+        :return: 各账号在全局配额中的请求次数和等待时间
+        """
+        with self.limiter.lock:
+            stats = {
+                account: {
+                    'requests': item.requests,
+                    'throttled': item.throttled,
+                    'wait_time': round(item.wait_time, 3),
+                    'throttle_time': round(item.throttle_time, 3),
+                }
+                for account, item in self.limiter.stats.items()
+            }
+        return {
+            'rates': {kind: round(bucket.rate, 3) for kind, bucket in self.limiter.buckets.items()},
+            'accounts': stats,
+        }
+
+
+class CoordinatorManager(BaseManager):
+    """
+    在父进程中托管RateCoordinator，工作进程通过代理对象调用
+    """
+
+
+CoordinatorManager.register('RateCoordinator', RateCoordinator)
+
+
+class CoordinatedRateLimiter(AdaptiveRateLimiter):
+    """
+    工作进程中使用的限速器
+    先按账号自己的限速器预约，再向父进程的RateCoordinator申请许可，等待两者中较长的时间
+    """
+
+    def __init__(self, coordinator, account, **kwargs):
+        """
+        :param coordinator: RateCoordinator的代理对象
+        :param account: 账号名称
+        """
+        super().__init__(**kwargs)
+        self.coordinator = coordinator
+        self.account = account
+
+    def reserve(self, kind, endpoint):
+        wait = super().reserve(kind, endpoint)
+        return max(wait, self.coordinator.reserve(self.account, kind))
+
+    def on_success(self, kind):
+        super().on_success(kind)
+        self.coordinator.on_success(kind)
+
+    def on_throttle(self, kind, endpoint):
+        super().on_throttle(kind, endpoint)
+        self.coordinator.on_throttle(self.account, kind)
+
+
+def run_account(account, cookie_file, manifest, coordinator, workers=BATCH_WORKERS, force_refresh=False,
+                overflow=OVERFLOW_MODE, log_dir=ACCOUNT_LOG_DIR, client_options=None):
+    """
+    在工作进程中运行一个账号的任务清单
+    每个账号使用独立的cookies、会话状态文件、死信文件和FromListsToFavlist实例，输出写入 log_dir/账号名称.log
+    :param client_options: 传给FromListsToFavlist的其他参数，例如api_base
+    :return: 该账号的结果汇总
+    """
+    # 延迟导入：main导入本模块
+    from main import read_cookies_from_file
+
+    result = {'account': account, 'cookie_file': cookie_file, 'manifest': manifest, 'error': None}
+    start = time.perf_counter()
+    os.makedirs(log_dir, exist_ok=True)
+    log_file = os.path.join(log_dir, f"{account}.log")
+    result['log_file'] = log_file
+
+    coordinator.register(account)
+    try:
+        with open(log_file, 'w', encoding='utf-8') as log, contextlib.redirect_stdout(log):
+            cookies = read_cookies_from_file(cookie_file)
+            if not cookies:
+                raise RuntimeError(f"无法从 {cookie_file} 读取cookies")
+            jobs = load_manifest(manifest)
+
+            directory = os.path.dirname(cookie_file) or '.'
+            session_file = os.path.join(directory, f"bilibili_session_{account}.json")
+            options = {'dead_letter_file': os.path.join(directory, f"bilibili_dead_letters_{account}.jsonl")}
+            options.update(client_options or {})
+            client = FromListsToFavlist(cookies, rate_limiter=CoordinatedRateLimiter(coordinator, account),
+                                        listing_cache=ListingCache(), session_state=SessionState(session_file),
+                                        progress=QuietProgress(), overflow=overflow, **options)
+            result['dead_letter_file'] = client.dead_letter_file
+            if not client.verify_login():
+                raise RuntimeError("登录验证失败")
+            batch = BatchRunner(client, workers=workers, force_refresh=force_refresh).run(jobs)
+            result.update(BatchRunner.summarize(batch))
+            result['metrics'] = client.metrics.summary(client.rate_limiter)
+    except Exception as e:
+        result['error'] = str(e)
+    finally:
+        coordinator.unregister(account)
+    result['elapsed'] = round(time.perf_counter() - start, 3)
+    return result
+
+
+class MultiAccountRunner:
+    """
+    多账号运行器
+    每个账号在单独的进程中运行，彼此的cookies、会话和连接互不影响；
+    所有进程通过父进程中的RateCoordinator共享出口IP的请求配额
+    """
+
+    def __init__(self, accounts, processes=ACCOUNT_PROCESSES, read_rate=IP_READ_RATE, write_rate=IP_WRITE_RATE,
+                 workers=BATCH_WORKERS, force_refresh=False, overflow=OVERFLOW_MODE, log_dir=ACCOUNT_LOG_DIR,
+                 client_options=None):
+        """
+        :param accounts: load_accounts返回的 [(名称, cookies文件, 任务清单)]
+        :param processes: 同时运行的账号数
+        :param read_rate: 出口IP的总读速率
+        :param write_rate: 出口IP的总写速率
+        :param workers: 每个账号同时执行的任务数
+        :param client_options: 传给每个账号的FromListsToFavlist的其他参数
+        """
+        self.accounts = accounts
+        self.processes = max(1, min(processes, len(accounts)))
+        self.read_rate = read_rate
+        self.write_rate = write_rate
+        self.workers = workers
+        self.force_refresh = force_refresh
+        self.overflow = overflow
+        self.log_dir = log_dir
+        self.client_options = client_options
+
+    def run(self):
+        """
+        :return: 汇总报告
+        """
+        start = time.perf_counter()
+        with CoordinatorManager() as manager:
+            coordinator = manager.RateCoordinator(self.read_rate, self.write_rate)
+            with ProcessPoolExecutor(max_workers=self.processes) as executor:
+                futures = [
+                    executor.submit(run_account, name, cookie_file, manifest, coordinator, self.workers,
+                                    self.force_refresh, self.overflow, self.log_dir, self.client_options)
+                    for name, cookie_file, manifest in self.accounts
+                ]
+                results = []
+                for (name, cookie_file, manifest), future in zip(self.accounts, futures):
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        # 工作进程异常退出
+                        result = {'account': name, 'cookie_file': cookie_file, 'manifest': manifest,
+                                  'error': f"进程异常: {str(e)}"}
+                    results.append(result)
+                    self._print_result(result)
+            coordination = coordinator.summary()
+
+        return {
+            'accounts': results,
+            'success': sum(result.get('success', 0) for result in results),
+            'failed': sum(result.get('failed', 0) for result in results),
+            'skipped': sum(result.get('skipped', 0) for result in results),
+            'duplicates': sum(result.get('duplicates', 0) for result in results),
+            'errors': sum(result.get('errors', 0) + (result['error'] is not None) for result in results),
+            'coordinator': coordination,
+            'elapsed': round(time.perf_counter() - start, 3),
+        }
+
+    @staticmethod
+    def _print_result(result):
+        if result['error'] is not None:
+            print(f"❌ 账号 {result['account']} 出错: {result['error']}")
+            return
+        print(f"账号 {result['account']}: 成功 {result['success']}, 失败 {result['failed']}, "
+              f"已存在 {result['skipped']}, 出错任务 {result['errors']}")
+
+    @staticmethod
+    def write_report(report, path=MULTI_REPORT_FILE):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        return report
@@ -0,0 +1,317 @@
+import cProfile
+import json
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+
+# 默认的逐阶段报告和pstats文件，pstats文件可以用snakeviz等工具查看
+PROFILE_REPORT_FILE = "bilibili_profile.json"
+PROFILE_STATS_FILE = "bilibili_profile.pstats"
+
+# Python 3.12起cProfile基于sys.monitoring，同一时刻整个进程只能启用一个剖析器，
+# 因此改为整个进程共用一个剖析器，函数级的结果合并在这个阶段中
+SHARED_PHASE = "total"
+
+# 报告中列出的耗时最多的函数数和内存增长最多的代码行数
+PROFILE_TOP = 15
+
+# 同一阶段两次tracemalloc快照之间的最短间隔（秒），写入阶段每批都会进入一次
+SNAPSHOT_INTERVAL = 1.0
+
+# 按cProfile中内置函数的自身耗时归类：(类别, 函数名)
+# sleep是限速和重试退避的主动等待；dns/connect/tls是建立连接；network是发送请求和等待服务器响应；
+# thread_wait是等待其他线程（列表预取、队列、连接池）
+TIME_CATEGORIES = (
+    ('sleep', '<built-in method time.sleep>'),
+    ('dns', '<built-in method _socket.getaddrinfo>'),
+    ('connect', "<method 'connect' of '_socket.socket' objects>"),
+    ('connect', "<method 'connect_ex' of '_socket.socket' objects>"),
+    ('tls', "<method 'do_handshake' of '_ssl._SSLSocket' objects>"),
+    ('network', "<method 'recv_into' of '_socket.socket' objects>"),
+    ('network', "<method 'recv' of '_socket.socket' objects>"),
+    ('network', "<method 'sendall' of '_socket.socket' objects>"),
+    ('network', "<method 'send' of '_socket.socket' objects>"),
+    ('network', "<method 'read' of '_ssl._SSLSocket' objects>"),
+    ('network', "<method 'write' of '_ssl._SSLSocket' objects>"),
+    ('thread_wait', "<method 'acquire' of '_thread.lock' objects>"),
+    ('thread_wait', "<method 'acquire' of '_thread.RLock' objects>"),
+)
+WAIT_CATEGORIES = ('sleep', 'dns', 'connect', 'tls', 'network', 'thread_wait')
+
+
+class PhaseProfile:
+    """
+    一个阶段在所有线程中的累计数据
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.entries = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        # 线程ID -> cProfile.Profile，同一个Profile不能在多个线程中同时启用
+        self.profiles = {}
+        self.memory_delta = 0
+        self.first_snapshot = None
+        self.last_snapshot = None
+        self.last_snapshot_at = 0.0
+
+    def stats(self):
+        """
+        :return: 合并各线程结果的pstats.Stats，没有数据时返回None
+        """
+        stats = None
+        for profile in list(self.profiles.values()):
+            try:
+                if stats is None:
+                    stats = pstats.Stats(profile)
+                else:
+                    stats.add(profile)
+            except TypeError:
+                # 没有成功启用过的Profile没有任何记录，pstats无法读取
+                continue
+        return stats
+
+
+class PhaseProfiler:
+    """
+    逐阶段的性能剖析：每个阶段用cProfile记录函数耗时，用tracemalloc记录内存增长，
+    并按内置函数的自身耗时把墙钟时间拆分为主动等待、建立连接、网络I/O、线程等待和CPU时间
+    只剖析进入阶段的线程；线程池中的工作用wrap包装后计入同一阶段，此时阶段的墙钟时间为各线程时间之和
+    Python 3.12及以上整个进程共用一个cProfile，函数级结果合并在total阶段，各阶段只记录时间和内存；
+    cProfile无法启用时（例如已有其他剖析工具）只记录时间和内存
+    """
+
+    def __init__(self, trace_memory=True):
+        """
+        :param trace_memory: 是否启动tracemalloc，开启后内存分配会明显变慢
+        """
+        self.phases = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.trace_memory = trace_memory
+        self._started_tracing = False
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self.started = time.perf_counter()
+        self.cpu_started = time.process_time()
+        self.cprofile_enabled = True
+        self.shared_profile = None
+        if sys.version_info >= (3, 12):
+            self.shared_profile = self._enable(cProfile.Profile())
+
+    def _enable(self, profile):
+        """
+        启用profile，失败时提示一次并停用函数级剖析
+        :return: 启用成功时返回profile，否则返回None
+        """
+        try:
+            profile.enable()
+            return profile
+        except ValueError as e:
+            with self.lock:
+                if self.cprofile_enabled:
+                    self.cprofile_enabled = False
+                    print(f"无法启用cProfile（{e}），只记录各阶段的时间和内存")
+            return None
+
+    def _phase(self, name):
+        with self.lock:
+            phase = self.phases.get(name)
+            if phase is None:
+                phase = self.phases[name] = PhaseProfile(name)
+            return phase
+
+    def _snapshot(self, phase, force=False):
+        now = time.monotonic()
+        if not tracemalloc.is_tracing() or (not force and now - phase.last_snapshot_at < SNAPSHOT_INTERVAL):
+            return None
+        phase.last_snapshot_at = now
+        return tracemalloc.take_snapshot()
+
+    def enter(self, name):
+        """
+        开始剖析当前线程中的一段阶段
+        :return: 传给exit的令牌，当前线程已在剖析其他阶段（嵌套）时返回None
+        """
+        if getattr(self.local, 'active', None) is not None:
+            return None
+        phase = self._phase(name)
+        thread_id = threading.get_ident()
+        with self.lock:
+            profile = None
+            if self.cprofile_enabled and self.shared_profile is None:
+                profile = phase.profiles.get(thread_id) or cProfile.Profile()
+            if phase.first_snapshot is None and self.trace_memory:
+                phase.first_snapshot = self._snapshot(phase, force=True)
+        memory = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+        self.local.active = name
+        if profile is not None:
+            profile = self._enable(profile)
+        if profile is not None:
+            with self.lock:
+                phase.profiles[thread_id] = profile
+        return (phase, profile, time.perf_counter(), time.thread_time(), memory)
+
+    def exit(self, token):
+        if token is None:
+            return
+        phase, profile, wall_start, cpu_start, memory_start = token
+        if profile is not None:
+            profile.disable()
+        self.local.active = None
+        wall = time.perf_counter() - wall_start
+        cpu = time.thread_time() - cpu_start
+        memory = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+        with self.lock:
+            phase.entries += 1
+            phase.wall += wall
+            phase.cpu += cpu
+            phase.memory_delta += memory - memory_start
+            if self.trace_memory:
+                snapshot = self._snapshot(phase, force=phase.last_snapshot is None)
+                if snapshot is not None:
+                    phase.last_snapshot = snapshot
+
+    def wrap(self, name, func):
+        """
+        包装在线程池中执行的函数，使其耗时计入name阶段
+        """
+        def profiled(*args, **kwargs):
+            token = self.enter(name)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.exit(token)
+        return profiled
+
+    def phase_report(self, phase, top=PROFILE_TOP):
+        """
+        :return: 一个阶段的报告
+        """
+        stats = phase.stats()
+        breakdown = dict.fromkeys(WAIT_CATEGORIES, 0.0)
+        json_time = 0.0
+        functions = []
+        if stats is not None:
+            categories = {function: category for category, function in TIME_CATEGORIES}
+            for (filename, line, function), (_, calls, tottime, cumtime, _) in stats.stats.items():
+                category = categories.get(function) if filename == '~' else None
+                if category is not None:
+                    breakdown[category] += tottime
+                elif function == 'loads' and filename.replace('\\', '/').endswith('json/__init__.py'):
+                    json_time += cumtime
+            ranked = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+            for (filename, line, function), (_, calls, tottime, cumtime, _) in ranked[:top]:
+                functions.append({
+                    'function': pstats.func_std_string((filename, line, function)),
+                    'calls': calls,
+                    'tottime': round(tottime, 4),
+                    'cumtime': round(cumtime, 4),
+                })
+
+        waits = sum(breakdown.values())
+        # 剖析器自身的开销计入cpu；其余未归类的时间（例如GIL等待）计入other
+        other = max(0.0, phase.wall - phase.cpu - waits)
+        allocations = []
+        if phase.first_snapshot is not None and phase.last_snapshot is not None:
+            for diff in phase.last_snapshot.compare_to(phase.first_snapshot, 'lineno')[:top]:
+                frame = diff.traceback[0]
+                allocations.append({
+                    'line': f"{frame.filename}:{frame.lineno}",
+                    'size_diff': diff.size_diff,
+                    'count_diff': diff.count_diff,
+                })
+
+        return {
+            'entries': phase.entries,
+            'wall': round(phase.wall, 4),
+            'cpu': round(phase.cpu, 4),
+            **{category: round(seconds, 4) for category, seconds in breakdown.items()},
+            'other': round(other, 4),
+            'json': round(json_time, 4),
+            'memory_delta': phase.memory_delta,
+            'top_functions': functions,
+            'top_allocations': allocations,
+        }
+
+    def _all_phases(self):
+        """
+        :return: 所有阶段，共用剖析器时最后加上汇总整个进程的total阶段
+        """
+        with self.lock:
+            phases = list(self.phases.values())
+        if self.shared_profile is not None:
+            self.shared_profile.disable()
+            total = PhaseProfile(SHARED_PHASE)
+            total.entries = 1
+            total.wall = time.perf_counter() - self.started
+            total.cpu = time.process_time() - self.cpu_started
+            total.profiles[0] = self.shared_profile
+            phases.append(total)
+        return phases
+
+    def report(self, top=PROFILE_TOP):
+        """
+        :return: 所有阶段的报告，可序列化为JSON
+        """
+        phases = self._all_phases()
+        peak = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else None
+        return {
+            'elapsed': round(time.perf_counter() - self.started, 4),
+            'memory_peak': peak,
+            'phases': {phase.name: self.phase_report(phase, top) for phase in phases},
+        }
+
+    def print_report(self, report):
+        print("性能剖析（秒）:")
+        print(f"  {'阶段':<8}{'墙钟':>9}{'CPU':>9}{'主动等待':>9}{'DNS':>8}{'连接':>8}{'TLS':>8}"
+              f"{'网络':>9}{'线程等待':>9}{'其他':>8}{'JSON':>8}{'内存增长':>12}")
+        for name, phase in report['phases'].items():
+            print(f"  {name:<10}{phase['wall']:>9.3f}{phase['cpu']:>9.3f}{phase['sleep']:>11.3f}"
+                  f"{phase['dns']:>9.3f}{phase['connect']:>9.3f}{phase['tls']:>9.3f}{phase['network']:>9.3f}"
+                  f"{phase['thread_wait']:>11.3f}{phase['other']:>9.3f}{phase['json']:>9.3f}"
+                  f"{phase['memory_delta'] / 1024:>12.1f}K")
+        print("  多个线程参与的阶段（例如list）中各项时间为所有线程之和")
+        if self.shared_profile is not None:
+            print(f"  Python 3.12+ 只能启用一个cProfile，等待时间的拆分和耗时最多的函数合并在{SHARED_PHASE}阶段")
+        if report['memory_peak'] is not None:
+            print(f"  内存峰值: {report['memory_peak'] / 1024 / 1024:.1f} MB")
+
+    def dump_stats(self, path=PROFILE_STATS_FILE):
+        """
+        把所有阶段合并写入一个pstats文件，每个阶段另写一个 路径.阶段名 文件
+        """
+        phases = self._all_phases()
+        combined = None
+        for phase in phases:
+            stats = phase.stats()
+            if stats is None:
+                continue
+            stats.dump_stats(f"{path}.{phase.name}")
+            if combined is None:
+                combined = pstats.Stats(f"{path}.{phase.name}")
+            else:
+                combined.add(stats)
+        if combined is not None:
+            combined.dump_stats(path)
+
+    def finish(self, report_file=PROFILE_REPORT_FILE, stats_file=PROFILE_STATS_FILE):
+        """
+        停止tracemalloc，打印并写入报告和pstats文件
+        :return: 报告
+        """
+        report = self.report()
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        self.print_report(report)
+        with open(report_file, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        self.dump_stats(stats_file)
+        print(f"剖析报告已写入 {report_file}，pstats文件已写入 {stats_file}")
+        return report
@@ -0,0 +1,238 @@
+import json
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+
+from transport import Transport
+
+
+# 读写请求的默认速率（每秒请求数）和突发容量
+READ_RATE = 5.0
+WRITE_RATE = 2.0
+READ_BURST = 5
+WRITE_BURST = 2
+
+# 被限流时速率乘以该系数，并额外冷却 BACKOFF_STEP * 连续限流次数 秒
+BACKOFF_FACTOR = 0.5
+BACKOFF_STEP = 2.0
+MIN_RATE = 0.2
+
+# 每次成功请求后速率恢复的比例（相对于初始速率）
+RECOVER_RATIO = 0.05
+
+# B站风控返回的业务码和HTTP状态码
+THROTTLE_CODES = (-412, -799)
+THROTTLE_STATUS = (412, 429)
+
+# 被限流后同一请求的最大重试次数
+MAX_THROTTLE_RETRIES = 3
+
+
+class TokenBucket:
+    """
+    线程安全的令牌桶，令牌不足时预约未来的令牌并返回需要等待的时间
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        """
+        取出一个令牌
+        :return: 调用方需要等待的秒数
+        """
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def set_rate(self, rate):
+        with self.lock:
+            self._refill(time.monotonic())
+            self.rate = rate
+
+
+class EndpointStats:
+    """
+    单个接口的请求统计
+    """
+    __slots__ = ('requests', 'throttled', 'wait_time', 'throttle_time')
+
+    def __init__(self):
+        self.requests = 0
+        self.throttled = 0
+        # 正常限速等待的时间和被限流后冷却等待的时间
+        self.wait_time = 0.0
+        self.throttle_time = 0.0
+
+
+class AdaptiveRateLimiter:
+    """
+    读写分离的自适应限速器
+    被限流时按比例降低速率并累加冷却时间，请求成功后逐步恢复速率
+    多个FromListsToFavlist实例可以共享同一个限速器
+    """
+
+    def __init__(self, read_rate=READ_RATE, write_rate=WRITE_RATE,
+                 read_burst=READ_BURST, write_burst=WRITE_BURST):
+        self.max_rates = {'read': read_rate, 'write': write_rate}
+        self.buckets = {
+            'read': TokenBucket(read_rate, read_burst),
+            'write': TokenBucket(write_rate, write_burst),
+        }
+        self.cooldown_until = {'read': 0.0, 'write': 0.0}
+        self.consecutive_throttles = {'read': 0, 'write': 0}
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    def _stats_for(self, endpoint):
+        stats = self.stats.get(endpoint)
+        if stats is None:
+            stats = self.stats.setdefault(endpoint, EndpointStats())
+        return stats
+
+    def reserve(self, kind, endpoint):
+        """
+        预约一个kind类型('read'/'write')的请求
+        :return: 发送请求前需要等待的秒数
+        """
+        wait = self.buckets[kind].reserve()
+        with self.lock:
+            cooldown = self.cooldown_until[kind] - time.monotonic()
+            stats = self._stats_for(endpoint)
+            stats.requests += 1
+            if cooldown > wait:
+                wait = cooldown
+                stats.throttle_time += wait
+            elif wait > 0:
+                stats.wait_time += wait
+        return wait
+
+    def acquire(self, kind, endpoint):
+        """
+        等待直到允许发送一个kind类型('read'/'write')的请求
+        """
+        wait = self.reserve(kind, endpoint)
+        if wait > 0:
+            time.sleep(wait)
+
+    def on_success(self, kind):
+        """
+        请求成功，逐步恢复速率
+        """
+        bucket = self.buckets[kind]
+        max_rate = self.max_rates[kind]
+        with self.lock:
+            self.consecutive_throttles[kind] = 0
+            if bucket.rate < max_rate:
+                bucket.set_rate(min(max_rate, bucket.rate + max_rate * RECOVER_RATIO))
+
+    def on_throttle(self, kind, endpoint):
+        """
+        请求被限流，降低速率并进入冷却
+        """
+        bucket = self.buckets[kind]
+        with self.lock:
+            self.consecutive_throttles[kind] += 1
+            self._stats_for(endpoint).throttled += 1
+            bucket.set_rate(max(MIN_RATE, bucket.rate * BACKOFF_FACTOR))
+            cooldown = BACKOFF_STEP * self.consecutive_throttles[kind]
+            self.cooldown_until[kind] = max(self.cooldown_until[kind], time.monotonic() + cooldown)
+
+    def report(self):
+        """
+        打印各接口的请求次数、被限流次数和等待时间
+        """
+        with self.lock:
+            items = sorted(self.stats.items())
+        if not items:
+            return
+        print("接口限速统计:")
+        for endpoint, stats in items:
+            print(f"  {endpoint}: 请求 {stats.requests} 次, 被限流 {stats.throttled} 次, "
+                  f"限速等待 {stats.wait_time:.2f} 秒, 限流冷却 {stats.throttle_time:.2f} 秒")
+
+
+def response_code(response):
+    """
+    读取JSON响应中的业务码
+    :return: 业务码，不是JSON或没有业务码时返回None
+    """
+    if 'json' not in response.headers.get('Content-Type', ''):
+        return None
+    try:
+        return json.loads(response.content).get('code')
+    except (ValueError, AttributeError):
+        return None
+
+
+def is_throttled(response, code=None):
+    """
+    判断响应是否为风控/限流
+    :param code: 已经读取的业务码，为None时从响应中读取
+    """
+    if response.status_code in THROTTLE_STATUS:
+        return True
+    if code is None:
+        code = response_code(response)
+    return code in THROTTLE_CODES
+
+
+class RateLimitedSession(requests.Session):
+    """
+    所有请求都经过限速器的Session
+    GET计入读配额，其余方法计入写配额；被限流的请求在冷却后重试
+    设置了metrics时记录每次请求的结果码、延迟和重试
+    连接池、超时、GET重试和压缩由transport配置，没有指定timeout的请求使用transport的超时
+    """
+
+    def __init__(self, rate_limiter, metrics=None, transport=None):
+        super().__init__()
+        self.rate_limiter = rate_limiter
+        self.metrics = metrics
+        self.timeout = None
+        self.transport = transport or Transport()
+        self.transport.mount(self)
+
+    def request(self, method, url, *args, **kwargs):
+        kind = 'read' if method.upper() == 'GET' else 'write'
+        endpoint = urlparse(url).path
+        if self.timeout is not None:
+            kwargs.setdefault('timeout', self.timeout)
+
+        for attempt in range(MAX_THROTTLE_RETRIES + 1):
+            if attempt and self.metrics is not None:
+                self.metrics.retry(endpoint)
+            self.rate_limiter.acquire(kind, endpoint)
+
+            start = time.perf_counter()
+            try:
+                response = super().request(method, url, *args, **kwargs)
+            except Exception:
+                if self.metrics is not None:
+                    self.metrics.observe(endpoint, 'error', time.perf_counter() - start)
+                raise
+
+            code = response_code(response)
+            if self.metrics is not None:
+                self.metrics.observe(endpoint, response.status_code if code is None else code,
+                                     time.perf_counter() - start)
+
+            if not is_throttled(response, code):
+                self.rate_limiter.on_success(kind)
+                return response
+            self.rate_limiter.on_throttle(kind, endpoint)
+
+        return response
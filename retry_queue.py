@@ -0,0 +1,216 @@
+import json
+import os
+import random
+import threading
+import time
+
+from rate_limiter import THROTTLE_CODES, THROTTLE_STATUS
+
+
+# 暂时失败的业务码和HTTP状态码：限流和服务器错误，稍后重试可能成功
+# 网络错误没有结果码，同样视为暂时失败
+TRANSIENT_CODES = frozenset(THROTTLE_CODES + THROTTLE_STATUS + (-500, -502, -503, -504, 500, 502, 503, 504))
+
+# 常见的永久失败：视频已删除或不可见、收藏夹已满、登录失效等，本次运行中不再重试
+# 不在TRANSIENT_CODES中的结果码都按永久失败处理
+PERMANENT_CODES = {
+    -101: '账号未登录',
+    -111: 'csrf校验失败',
+    -403: '权限不足',
+    -404: '视频不存在',
+    11007: '收藏夹已满',
+    11010: '内容不存在',
+    62002: '稿件不可见',
+    62004: '稿件审核中',
+    62012: '稿件仅UP主自己可见',
+}
+
+# 重试队列的轮数、每轮之前的等待时间（指数退避）和总时限（秒）
+RETRY_ROUNDS = 4
+RETRY_BASE_DELAY = 2.0
+RETRY_MAX_DELAY = 60.0
+RETRY_DEADLINE = 5 * 60
+
+# 最终仍然失败的视频，每行一个JSON，可以用 --replay 重新添加
+DEAD_LETTER_FILE = "bilibili_dead_letters.jsonl"
+
+
+def is_transient(code):
+    """
+    :param code: 业务码或HTTP状态码，网络错误时为None
+    :return: 是否为稍后重试可能成功的暂时失败
+    """
+    return code is None or code in TRANSIENT_CODES
+
+
+class RetryItem:
+    """
+    等待重试的一个视频
+    """
+    __slots__ = ('fav_id', 'video', 'code', 'message', 'record', 'position')
+
+    def __init__(self, fav_id, video, code, message, record, position=None):
+        self.fav_id = fav_id
+        self.video = video
+        self.code = code
+        self.message = message
+        self.record = record
+        self.position = position
+
+    def to_dict(self, permanent, mid=None):
+        return {
+            'mid': mid,
+            'fav_id': self.fav_id,
+            'aid': self.video['aid'],
+            'bvid': self.video.get('bvid'),
+            'title': self.video.get('title'),
+            'code': self.code,
+            'message': self.message,
+            'permanent': permanent,
+            'time': round(time.time(), 3),
+        }
+
+
+class RetryQueue:
+    """
+    添加收藏失败的视频按结果码分类：
+    暂时失败的放入队列，在写入结束后按指数退避分轮重试，直到成功、变为永久失败或超过时限；
+    永久失败和最终仍然失败的视频记为失败，并保存为死信，以后可以直接重放
+    视频的成功/失败在最终确定后才通过写入时的record回调记录，失败也在最终确定后才显示
+    """
+
+    def __init__(self, rounds=RETRY_ROUNDS, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY,
+                 deadline=RETRY_DEADLINE, mid=None, progress=None):
+        """
+        :param rounds: 最多重试的轮数
+        :param base_delay: 第一轮重试前的等待时间（秒），之后每轮加倍
+        :param max_delay: 每轮等待时间的上限（秒）
+        :param deadline: 从开始重试算起的总时限（秒）
+        :param mid: 写入的账号UID，记录在每条死信中，重放时只重放同一账号的死信
+        :param progress: 显示最终失败的视频的进度输出，为None时不显示
+        """
+        self.rounds = rounds
+        self.mid = mid
+        self.progress = progress
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.items = []
+        self.dead_letters = []
+        self.recovered = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        with self.lock:
+            return len(self.items)
+
+    def fail(self, fav_id, video, code, message, record, position=None):
+        """
+        处理一个添加失败的视频
+        :param fav_id: 写入的收藏夹ID，多个收藏夹时为逗号分隔的ID
+        :param record: 写入时的record(video, 是否成功)回调
+        :param position: 显示进度用的 (序号, 总数)
+        """
+        item = RetryItem(fav_id, video, code, message or PERMANENT_CODES.get(code, ''), record, position)
+        if is_transient(code):
+            with self.lock:
+                self.items.append(item)
+            return
+        self._give_up(item, permanent=True)
+
+    def _give_up(self, item, permanent):
+        with self.lock:
+            self.dead_letters.append(item.to_dict(permanent, self.mid))
+        if self.progress is not None:
+            i, total = item.position or ('?', '?')
+            self.progress.failed(i, total, item.video, item.message)
+        item.record(item.video, False)
+
+    def drain(self, client, batch=True):
+        """
+        分轮重试队列中的视频，结束后队列中剩余的视频记为失败
+        :param client: FromListsToFavlist实例
+        :param batch: 是否先尝试batch-deal接口
+        :return: 重试成功的视频数
+        """
+        start = time.monotonic()
+        for attempt in range(self.rounds):
+            with self.lock:
+                items, self.items = self.items, []
+            if not items:
+                break
+
+            delay = min(self.max_delay, self.base_delay * 2 ** attempt) + random.uniform(0, 1)
+            if time.monotonic() - start + delay > self.deadline:
+                with self.lock:
+                    self.items = items + self.items
+                print(f"重试超过时限，剩余 {len(items)} 个视频不再重试")
+                break
+            print(f"{len(items)} 个视频暂时添加失败，{delay:.1f} 秒后进行第 {attempt + 1} 轮重试...")
+            time.sleep(delay)
+
+            # 写入相同收藏夹、使用相同回调的视频合并重试
+            with self.lock:
+                given_up = len(self.dead_letters)
+            groups = {}
+            for item in items:
+                groups.setdefault((item.fav_id, id(item.record)), []).append(item)
+            for group in groups.values():
+                fav_id, record = group[0].fav_id, group[0].record
+                videos = [item.video for item in group]
+                chunk_size = client.batch_size if batch and client.batch_size > 1 else 1
+                for offset in range(0, len(videos), chunk_size):
+                    client.write_chunk(fav_id, videos[offset:offset + chunk_size], offset, len(videos),
+                                        record, batch and chunk_size > 1, self)
+
+            # 本轮没有再次放入队列、也没有变为永久失败的视频重试成功
+            with self.lock:
+                self.recovered += len(items) - len(self.items) - (len(self.dead_letters) - given_up)
+
+        with self.lock:
+            items, self.items = self.items, []
+        for item in items:
+            self._give_up(item, permanent=False)
+        if self.recovered:
+            print(f"重试成功 {self.recovered} 个视频")
+        return self.recovered
+
+    def write_dead_letters(self, path=DEAD_LETTER_FILE):
+        """
+        把死信追加到文件
+        :return: 写入的条数
+        """
+        with self.lock:
+            dead_letters, self.dead_letters = self.dead_letters, []
+        return append_dead_letters(dead_letters, path)
+
+
+def append_dead_letters(entries, path=DEAD_LETTER_FILE):
+    """
+    把死信追加到文件
+    :return: 写入的条数
+    """
+    if not entries:
+        return 0
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(''.join(json.dumps(entry, ensure_ascii=False) + '\n' for entry in entries))
+    return len(entries)
+
+
+def load_dead_letters(path=DEAD_LETTER_FILE):
+    """
+    读取死信文件，同一收藏夹中的同一视频只保留最后一条
+    :return: 死信列表
+    """
+    entries = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            entries[(str(entry['fav_id']), entry['aid'])] = entry
+    return list(entries.values())
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+# 会话状态文件：保存cookie jar和登录验证结果
+SESSION_FILE = "bilibili_session.json"
+
+# 登录验证结果的有效期（秒），有效期内跳过nav请求
+NAV_TTL = 30 * 60
+
+
+def cookies_fingerprint(cookies):
+    """
+    :return: cookies字符串的指纹，用于判断cookies文件是否被用户更新过
+    """
+    normalized = ';'.join(sorted(item.strip() for item in (cookies or '').split(';') if item.strip()))
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+
+class SessionState:
+    """
+    跨运行保存的会话状态
+    保存服务器轮换后的cookies和最近一次登录验证的结果；
+    cookies文件被用户更新后，旧的会话状态作废
+    """
+
+    def __init__(self, path=SESSION_FILE, nav_ttl=NAV_TTL):
+        self.path = path
+        self.nav_ttl = nav_ttl
+        self.lock = threading.Lock()
+        self.fingerprint = None
+        self.cookies = []
+        self.nav = None
+        self.nav_checked_at = 0.0
+        self._saved_cookies = None
+
+    def load(self, source_cookies):
+        """
+        读取状态文件，与source_cookies不是同一份cookies时丢弃
+        :param source_cookies: 从cookies文件读取的cookies字符串
+        :return: 是否读取到可用的状态
+        """
+        self.fingerprint = cookies_fingerprint(source_cookies)
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"读取会话状态失败，将重新验证: {str(e)}")
+            return False
+
+        if state.get('fingerprint') != self.fingerprint:
+            return False
+        self.cookies = state.get('cookies', [])
+        self.nav = state.get('nav')
+        self.nav_checked_at = state.get('nav_checked_at', 0.0)
+        self._saved_cookies = self.cookies
+        return True
+
+    def restore(self, session):
+        """
+        把保存的cookies放回session，替换从cookies文件读取的同名cookie
+        """
+        for cookie in self.cookies:
+            for old in list(session.cookies):
+                if old.name == cookie['name']:
+                    session.cookies.clear(old.domain, old.path, old.name)
+            session.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain', ''),
+                                path=cookie.get('path', '/'), expires=cookie.get('expires'),
+                                secure=cookie.get('secure', False))
+
+    def cached_nav(self):
+        """
+        :return: 有效期内的登录验证结果，没有或已过期时返回None
+        """
+        if self.nav is not None and time.time() - self.nav_checked_at < self.nav_ttl:
+            return self.nav
+        return None
+
+    def record_nav(self, nav):
+        self.nav = nav
+        self.nav_checked_at = time.time()
+
+    def invalidate_nav(self):
+        self.nav = None
+        self.nav_checked_at = 0.0
+
+    @staticmethod
+    def snapshot(session):
+        return sorted(
+            ({'name': cookie.name, 'value': cookie.value, 'domain': cookie.domain, 'path': cookie.path,
+              'expires': cookie.expires, 'secure': bool(cookie.secure)} for cookie in session.cookies),
+            key=lambda cookie: (cookie['name'], cookie['domain'], cookie['path'])
+        )
+
+    def changed(self, session):
+        """
+        :return: session中的cookies与上次保存时是否不同
+        """
+        return self.snapshot(session) != self._saved_cookies
+
+    def save(self, session):
+        """
+        原子地写入当前cookies和登录验证结果：先写临时文件再替换
+        """
+        with self.lock:
+            self.cookies = self.snapshot(session)
+            state = {
+                'fingerprint': self.fingerprint,
+                'cookies': self.cookies,
+                'nav': self.nav,
+                'nav_checked_at': self.nav_checked_at,
+                'saved_at': time.time(),
+            }
+            temp_file = f"{self.path}.tmp"
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_file, self.path)
+            self._saved_cookies = self.cookies
@@ -0,0 +1,55 @@
+"""
+批量写入的请求数测试：在本地模拟服务器上比较batch-deal和逐个deal的写入请求数
+运行: python -m pytest -q test_batch_deal.py
+"""
+
+from FromListsToFavlist import FromListsToFavlist
+from metrics import QuietProgress
+from mock_server import MockBilibiliServer, MockConfig
+from rate_limiter import AdaptiveRateLimiter
+from video_record import VideoRecord
+
+
+COOKIES = 'SESSDATA=test; DedeUserID=1; bili_jct=test'
+VIDEO_COUNT = 600
+FAV_ID = '5'
+
+
+def _client(server, tmp_path, batch_size):
+    return FromListsToFavlist(
+        COOKIES, api_base=server.base_url, batch_size=batch_size,
+        rate_limiter=AdaptiveRateLimiter(read_rate=1000, write_rate=1000, read_burst=100, write_burst=100),
+        progress=QuietProgress(), dead_letter_file=str(tmp_path / 'dead_letters.jsonl'),
+    )
+
+
+def _videos():
+    return [VideoRecord(aid, f"BV{aid:010d}", f"视频 {aid}") for aid in range(1, VIDEO_COUNT + 1)]
+
+
+def test_batch_deal_reduces_write_requests(tmp_path):
+    with MockBilibiliServer(MockConfig()) as server:
+        success, failed = _client(server, tmp_path, batch_size=1).add_to_favorites(FAV_ID, _videos())
+        assert (success, failed) == (VIDEO_COUNT, 0)
+        single_requests = server.counts['v3/fav/resource/deal']
+
+        server.reset()
+        success, failed = _client(server, tmp_path, batch_size=50).add_to_favorites(FAV_ID, _videos())
+        assert (success, failed) == (VIDEO_COUNT, 0)
+        batch_requests = server.counts['v3/fav/resource/batch-deal']
+        assert server.counts['v3/fav/resource/deal'] == 0
+        assert server.favorites[FAV_ID] == set(range(1, VIDEO_COUNT + 1))
+
+    assert single_requests == VIDEO_COUNT
+    assert batch_requests == VIDEO_COUNT // 50
+    assert batch_requests * 10 <= single_requests
+
+
+def test_rejected_chunk_falls_back_to_single_writes(tmp_path):
+    # 收藏夹只能再放下一部分视频时batch-deal被拒绝，逐个添加后每个视频的结果仍然准确
+    with MockBilibiliServer(MockConfig(fav_capacity=30)) as server:
+        client = _client(server, tmp_path, batch_size=50)
+        success, failed = client.add_to_favorites(FAV_ID, _videos()[:50])
+        assert (success, failed) == (30, 20)
+        assert server.counts['v3/fav/resource/batch-deal'] == 1
+        assert server.counts['v3/fav/resource/deal'] == 50
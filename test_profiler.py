@@ -0,0 +1,65 @@
+"""
+性能剖析的降级测试：cProfile无法启用时（Python 3.12+上已有其他剖析工具）转移仍然完成，只记录时间和内存
+运行: python -m pytest -q test_profiler.py
+"""
+
+import cProfile
+
+import profiler
+from FromListsToFavlist import FromListsToFavlist
+from listing_cache import ListingCache
+from metrics import QuietProgress
+from mock_server import MockBilibiliServer, MockConfig
+from rate_limiter import AdaptiveRateLimiter
+
+
+COOKIES = 'SESSDATA=test; DedeUserID=1; bili_jct=test'
+COLLECTION_URL = 'https://space.bilibili.com/1/channel/collectiondetail?sid=1000'
+FAV_URL = 'https://space.bilibili.com/1/favlist?fid=5'
+
+
+class BusyProfile(cProfile.Profile):
+    def enable(self, *args, **kwargs):
+        raise ValueError("Another profiling tool is already active")
+
+
+def _transfer(server, tmp_path):
+    transfer = FromListsToFavlist(
+        COOKIES, api_base=server.base_url, profile=True,
+        rate_limiter=AdaptiveRateLimiter(read_rate=1000, write_rate=1000, read_burst=100, write_burst=100),
+        listing_cache=ListingCache(str(tmp_path / 'cache.db')), journal_dir=str(tmp_path / 'journals'),
+        progress=QuietProgress(), dead_letter_file=str(tmp_path / 'dead_letters.jsonl'),
+    )
+    transfer.transfer_collection_to_favorites(COLLECTION_URL, FAV_URL)
+    return transfer
+
+
+def _finish(transfer, tmp_path):
+    return transfer.profiler.finish(str(tmp_path / 'profile.json'), str(tmp_path / 'profile.pstats'))
+
+
+def test_transfer_completes_when_cprofile_cannot_enable(tmp_path, monkeypatch):
+    monkeypatch.setattr(cProfile, 'Profile', BusyProfile)
+    with MockBilibiliServer(MockConfig()) as server:
+        transfer = _transfer(server, tmp_path)
+        assert len(server.favorites['5']) == 100
+
+    report = _finish(transfer, tmp_path)
+    assert not transfer.profiler.cprofile_enabled
+    assert report['phases']['write']['entries'] > 0
+    assert report['phases']['write']['wall'] > 0
+    assert report['phases']['write']['top_functions'] == []
+    assert not (tmp_path / 'profile.pstats').exists()
+
+
+def test_shared_profiler_on_python_312(tmp_path, monkeypatch):
+    # 模拟Python 3.12+：整个进程共用一个剖析器，函数级结果合并在total阶段
+    monkeypatch.setattr(profiler.sys, 'version_info', (3, 12))
+    with MockBilibiliServer(MockConfig()) as server:
+        transfer = _transfer(server, tmp_path)
+        assert len(server.favorites['5']) == 100
+
+    report = _finish(transfer, tmp_path)
+    assert report['phases']['write']['top_functions'] == []
+    assert report['phases'][profiler.SHARED_PHASE]['top_functions']
+    assert (tmp_path / 'profile.pstats').exists()
@@ -0,0 +1,56 @@
+"""
+BV号与aid换算和ID列表解析的测试，换算结果与B站公开的对照一致
+运行: python -m pytest -q test_video_ids.py
+"""
+
+from video_ids import av2bv, bv2av, iter_id_pages, iter_line_videos
+
+
+# 公开的aid与BV号对照，包括超过2^32的新aid
+KNOWN_PAIRS = (
+    (170001, 'BV17x411w7KC'),
+    (455017605, 'BV1Q541167Qg'),
+    (882584971, 'BV1mK4y1C7Bz'),
+    (111298867365120, 'BV1L9Uoa9EUx'),
+)
+
+MIXED_LINES = [
+    '# 注释行中的BV17x411w7KC会被忽略\n',
+    'https://www.bilibili.com/video/BV1Q541167Qg?p=1\n',
+    'av170001\n',
+    '  AV882584971  \n',
+    'https://www.bilibili.com/video/av455017605\n',
+    'https://m.bilibili.com/video/?aid=111298867365120\n',
+    'BV17x411w7KC BV1mK4y1C7Bz\n',
+    'bav123 没有ID的行\n',
+    '\n',
+]
+
+
+def test_av2bv_matches_known_pairs():
+    for aid, bvid in KNOWN_PAIRS:
+        assert av2bv(aid) == bvid
+
+
+def test_bv2av_matches_known_pairs():
+    for aid, bvid in KNOWN_PAIRS:
+        assert bv2av(bvid) == aid
+
+
+def test_round_trip():
+    for aid in (1, 2, 99999, 2 ** 32 + 7, 2 ** 50 - 1):
+        assert bv2av(av2bv(aid)) == aid
+
+
+def test_iter_line_videos_parses_mixed_list():
+    videos = list(iter_line_videos(MIXED_LINES))
+    # 按首次出现的顺序去重，av号和BV号指向同一个视频时只返回一次
+    assert [video.aid for video in videos] == [455017605, 170001, 882584971, 111298867365120]
+    assert [video.bvid for video in videos] == ['BV1Q541167Qg', 'BV17x411w7KC', 'BV1mK4y1C7Bz', 'BV1L9Uoa9EUx']
+
+
+def test_iter_id_pages_reads_file(tmp_path):
+    source = tmp_path / 'ids.txt'
+    source.write_text(''.join(MIXED_LINES), encoding='utf-8-sig')
+    pages = list(iter_id_pages(str(source), page_size=3))
+    assert [len(page) for page in pages] == [3, 1]
@@ -0,0 +1,126 @@
+import json
+import os
+import time
+
+
+# 默认日志目录
+JOURNAL_DIR = "bilibili_journals"
+
+# 累计多少条记录或多少秒后执行一次fsync
+FSYNC_EVERY = 50
+FSYNC_INTERVAL = 2.0
+
+
+class TransferJournal:
+    """
+    追加写入的转移日志，每个 (来源, 目标收藏夹) 一个文件
+    每行一个JSON：{"aid": ..., "ok": ...} 记录单个视频的结果，
+    {"attempt": ...} 标记一次运行的开始，{"done": true} 标记转移完成
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.outcomes = {}
+        self.attempts = 0
+        self.done = False
+        self._file = None
+        self._pending = 0
+        self._last_sync = 0.0
+
+    @classmethod
+    def for_transfer(cls, uid, source_id, fav_id, journal_dir=JOURNAL_DIR):
+        """
+        创建指定来源和收藏夹对应的日志
+        """
+        return cls(os.path.join(journal_dir, f"{uid}_{source_id}_{fav_id}.jsonl"))
+
+    def load(self):
+        """
+        读取已有日志，文件不存在时保持为空
+        :return: 是否存在未完成的转移
+        """
+        self.outcomes = {}
+        self.attempts = 0
+        self.done = False
+        if not os.path.exists(self.path):
+            return False
+
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # 进程被中断时最后一行可能不完整
+                    continue
+                if 'aid' in entry:
+                    self.outcomes[entry['aid']] = entry['ok']
+                elif 'attempt' in entry:
+                    self.attempts += 1
+                elif entry.get('done'):
+                    self.done = True
+
+        return not self.done and self.attempts > 0
+
+    def succeeded(self, aid):
+        """
+        :return: 日志中该视频是否已添加成功，之前失败的视频继续时重新添加
+        """
+        return self.outcomes.get(aid) is True
+
+    def counts(self):
+        """
+        :return: 日志中已记录的 (成功数, 失败数)
+        """
+        success = sum(1 for ok in self.outcomes.values() if ok)
+        return success, len(self.outcomes) - success
+
+    def start(self, resume):
+        """
+        开始一次运行
+        :param resume: 为False时清空旧日志重新开始
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if not resume:
+            self.outcomes = {}
+            self.attempts = 0
+            self.done = False
+        self._file = open(self.path, 'a' if resume else 'w', encoding='utf-8')
+        self.attempts += 1
+        self._write({'attempt': self.attempts, 'time': time.time()})
+        self._sync()
+
+    def record(self, aid, ok):
+        """
+        记录单个视频的结果，按批次fsync
+        """
+        self.outcomes[aid] = ok
+        self._write({'aid': aid, 'ok': ok})
+        self._pending += 1
+        if self._pending >= FSYNC_EVERY or time.monotonic() - self._last_sync >= FSYNC_INTERVAL:
+            self._sync()
+
+    def finish(self):
+        """
+        标记转移完成
+        """
+        self._write({'done': True})
+        self.done = True
+        self.close()
+
+    def close(self):
+        if self._file is None:
+            return
+        self._sync()
+        self._file.close()
+        self._file = None
+
+    def _write(self, entry):
+        self._file.write(json.dumps(entry) + '\n')
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
@@ -0,0 +1,124 @@
+import random
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import brotli  # noqa: F401
+    HAS_BROTLI = True
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        HAS_BROTLI = True
+    except ImportError:
+        HAS_BROTLI = False
+
+
+# 每个主机保留的连接池数量和每个连接池的最大连接数
+# 最大连接数应不小于共享同一个session的线程数
+POOL_CONNECTIONS = 4
+POOL_MAXSIZE = 16
+
+# 连接超时和读取超时（秒）
+CONNECT_TIMEOUT = 5.0
+READ_TIMEOUT = 30.0
+
+# GET请求遇到连接错误或以下状态码时的重试次数，POST等写入请求任何错误都不重试
+# 412/429属于限流，由RateLimitedSession冷却后重试，不在这里重试
+GET_RETRIES = 3
+RETRY_STATUS = (500, 502, 503, 504)
+RETRY_BACKOFF = 0.5
+RETRY_JITTER = 0.5
+
+
+class JitterRetry(Retry):
+    """
+    在指数退避时间上增加随机抖动，避免多个线程同时重试
+    """
+
+    def __init__(self, *args, jitter=RETRY_JITTER, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.jitter = jitter
+
+    def new(self, **kwargs):
+        retry = super().new(**kwargs)
+        retry.jitter = self.jitter
+        return retry
+
+    def get_backoff_time(self):
+        backoff = super().get_backoff_time()
+        if backoff <= 0:
+            return backoff
+        return backoff + random.uniform(0, self.jitter)
+
+    def increment(self, method=None, url=None, *args, **kwargs):
+        # urllib3的allowed_methods只限制读取错误和状态码重试，连接错误仍会重试任意方法
+        # POST等写入请求在这里直接用尽重试次数，失败交给上层的重试队列
+        if method is not None and self.allowed_methods and method.upper() not in self.allowed_methods:
+            exhausted = self.new(total=0, connect=0, read=0, status=0, other=0)
+            return Retry.increment(exhausted, method, url, *args, **kwargs)
+        return super().increment(method, url, *args, **kwargs)
+
+
+class Transport:
+    """
+    session的传输层配置：连接池、超时、GET重试和压缩
+    一个Transport可以配置多个session；配置后的session可以在多个线程之间共享，
+    连接池满时线程等待空闲连接，而不是创建用完即丢的新连接
+    """
+
+    def __init__(self, pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE,
+                 connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 retries=GET_RETRIES, backoff=RETRY_BACKOFF, jitter=RETRY_JITTER, compression=True):
+        """
+        :param pool_connections: 保留连接池的主机数量
+        :param pool_maxsize: 每个主机的最大连接数
+        :param connect_timeout: 连接超时（秒）
+        :param read_timeout: 读取超时（秒）
+        :param retries: GET请求的重试次数，POST等非幂等请求不重试
+        :param backoff: 重试的指数退避基数（秒）
+        :param jitter: 在退避时间上增加的最大随机抖动（秒）
+        :param compression: 是否声明支持gzip，安装了brotli时同时声明br
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.jitter = jitter
+        self.compression = compression
+
+    def retry_policy(self):
+        return JitterRetry(
+            total=self.retries,
+            connect=self.retries,
+            read=self.retries,
+            status=self.retries,
+            allowed_methods=frozenset(['GET']),
+            status_forcelist=RETRY_STATUS,
+            backoff_factor=self.backoff,
+            raise_on_status=False,
+            respect_retry_after_header=True,
+            jitter=self.jitter,
+        )
+
+    def accept_encoding(self):
+        if not self.compression:
+            return 'identity'
+        return 'gzip, deflate, br' if HAS_BROTLI else 'gzip, deflate'
+
+    def mount(self, session):
+        """
+        为session挂载连接池和重试策略，并设置默认超时和Accept-Encoding
+        """
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            max_retries=self.retry_policy(),
+            pool_block=True,
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers['Accept-Encoding'] = self.accept_encoding()
+        session.timeout = self.timeout
+        return session
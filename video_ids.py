@@ -0,0 +1,128 @@
+"""
+从文本中读取BV号/av号作为来源
+BV号在本地换算为aid，不需要为每个视频请求view接口
+"""
+
+import hashlib
+import os
+import re
+import sys
+
+from video_record import VideoRecord
+
+
+# BV号与aid互相换算的参数
+XOR_CODE = 23442827791579
+MASK_CODE = 2251799813685247
+MAX_AID = 1 << 51
+BASE = 58
+ALPHABET = "FcwAPNKTMug3GV5Lj7EJnHpWsx4tb8haYeviqBz6rkCy12mUSDQX9RdoZf"
+DECODE_MAP = {char: index for index, char in enumerate(ALPHABET)}
+BV_PREFIX = "BV1"
+BV_LENGTH = 12
+
+# BV号中各位数字的位置，按从高位到低位的顺序（即交换第3/9位和第4/7位之后的顺序）
+BV_DIGIT_ORDER = (9, 7, 5, 6, 4, 8, 3, 10, 11)
+
+# 文本中的BV号、av号和视频链接中的aid参数
+# 先用子串判断一行中是否可能有ID再执行正则，长链接列表的解析速度提高数倍
+BV_PATTERN = re.compile(r'BV1[1-9A-HJ-NP-Za-km-z]{9}')
+AV_PATTERN = re.compile(r'(?<![0-9A-Za-z])(?:av|AV|aid=)(\d+)')
+
+# 来源ID列表使用的用户ID，用于区分转移日志
+ID_LIST_UID = "ids"
+
+# 流式转移时每页的视频数
+ID_PAGE_SIZE = 500
+
+
+def av2bv(aid):
+    """
+    aid换算为BV号
+    """
+    chars = list(BV_PREFIX + '0' * (BV_LENGTH - len(BV_PREFIX)))
+    index = BV_LENGTH - 1
+    value = (MAX_AID | aid) ^ XOR_CODE
+    while value > 0:
+        chars[index] = ALPHABET[value % BASE]
+        value //= BASE
+        index -= 1
+    chars[3], chars[9] = chars[9], chars[3]
+    chars[4], chars[7] = chars[7], chars[4]
+    return ''.join(chars)
+
+
+def bv2av(bvid):
+    """
+    BV号换算为aid
+    """
+    value = 0
+    for index in BV_DIGIT_ORDER:
+        value = value * BASE + DECODE_MAP[bvid[index]]
+    return (value & MASK_CODE) ^ XOR_CODE
+
+
+def is_id_source(source):
+    """
+    :return: source是否为ID列表文件或'-'(标准输入)
+    """
+    return source == '-' or os.path.isfile(source)
+
+
+def id_source_key(source):
+    """
+    :return: ID列表来源的标识，同一个文件多次运行时使用同一个转移日志
+    """
+    if source == '-':
+        return 'stdin'
+    name = re.sub(r'[^0-9A-Za-z_-]', '_', os.path.splitext(os.path.basename(source))[0])
+    digest = hashlib.sha1(os.path.abspath(source).encode('utf-8')).hexdigest()[:8]
+    return f"{name}_{digest}"
+
+
+def iter_line_videos(lines):
+    """
+    逐行解析BV号、av号或视频链接，一行可以包含多个ID，同一个视频只返回一次
+    """
+    seen = set()
+    for line in lines:
+        if line.lstrip().startswith('#'):
+            continue
+        if 'BV1' in line:
+            for bvid in BV_PATTERN.findall(line):
+                aid = bv2av(bvid)
+                if aid not in seen:
+                    seen.add(aid)
+                    yield VideoRecord(aid, bvid, bvid)
+        if 'av' in line or 'AV' in line or 'aid=' in line:
+            for match in AV_PATTERN.findall(line):
+                aid = int(match)
+                if aid not in seen:
+                    seen.add(aid)
+                    bvid = av2bv(aid)
+                    yield VideoRecord(aid, bvid, bvid)
+
+
+def iter_id_pages(source, page_size=ID_PAGE_SIZE):
+    """
+    从文件或标准输入流式读取ID，每次yield一页视频
+    :param source: 文件路径，'-'表示标准输入
+    """
+    if source == '-':
+        lines = sys.stdin
+        close = None
+    else:
+        lines = close = open(source, 'r', encoding='utf-8-sig')
+
+    try:
+        page = []
+        for video in iter_line_videos(lines):
+            page.append(video)
+            if len(page) >= page_size:
+                yield page
+                page = []
+        if page:
+            yield page
+    finally:
+        if close is not None:
+            close.close()
@@ -0,0 +1,54 @@
+"""
+列表中一个视频的紧凑记录
+大合集一次会持有上万个视频，用__slots__代替每个视频一个dict，
+封面地址(pic)默认不保留，需要时通过FromListsToFavlist.fetch_pic获取
+"""
+
+
+# 默认是否在列表中保留封面地址
+KEEP_PIC = False
+
+
+class VideoRecord:
+    """
+    一个视频的aid、bvid、标题和时长
+    支持video['aid']和video.get('pic')形式的访问，与原来的dict兼容
+    """
+    __slots__ = ('aid', 'bvid', 'title', 'duration', 'pic')
+
+    def __init__(self, aid, bvid, title, duration=0, pic=None):
+        self.aid = aid
+        self.bvid = bvid
+        self.title = title
+        self.duration = duration
+        self.pic = pic
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        value = getattr(self, key, None)
+        return default if value is None else value
+
+    def to_dict(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    def __repr__(self):
+        return f"VideoRecord(aid={self.aid!r}, bvid={self.bvid!r}, title={self.title!r})"
+
+
+def video_from_archive(video, keep_pic=KEEP_PIC):
+    """
+    从接口返回的archive中提取需要保存的视频信息
+    :param keep_pic: 是否保留封面地址
+    """
+    return VideoRecord(
+        video['aid'],
+        video['bvid'],
+        video['title'],
+        video.get('duration', 0),
+        video.get('pic') if keep_pic else None,
+    )
@@ -0,0 +1,351 @@
+import heapq
+import json
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from FromListsToFavlist import ENDPOINT_KINDS
+from video_record import video_from_archive
+
+
+# 订阅状态文件
+WATCH_STATE_FILE = "bilibili_watch.json"
+
+# 轮询间隔（秒）：新订阅从DEFAULT_INTERVAL开始，有更新时缩短，无更新时延长
+DEFAULT_INTERVAL = 30 * 60
+MIN_INTERVAL = 5 * 60
+MAX_INTERVAL = 12 * 60 * 60
+INTERVAL_SHRINK = 0.5
+INTERVAL_GROWTH = 1.5
+
+# 轮询最多占用读配额的比例，其余留给写入前的检查和其他任务
+POLL_BUDGET_SHARE = 0.5
+
+# 每个来源记住最新的若干个aid，最新的视频被删除时仍能找到已知位置
+KNOWN_AIDS_KEPT = 50
+
+# 一次轮询最多获取的页数，超过时说明更新太多或已知视频都被删除，改为完整转移
+MAX_POLL_PAGES = 5
+
+# 同时进行的轮询数
+POLL_WORKERS = 4
+
+
+class Subscription:
+    """
+    一个 (合集, 收藏夹) 订阅及其轮询状态
+    """
+
+    def __init__(self, collection_url, fav_url, interval=DEFAULT_INTERVAL, known_aids=None,
+                 next_poll=0.0, polls=0, changes=0, added=0):
+        self.collection_url = collection_url
+        self.fav_url = fav_url
+        self.interval = interval
+        # 最新在前
+        self.known_aids = list(known_aids or [])
+        self.next_poll = next_poll
+        self.polls = polls
+        self.changes = changes
+        self.added = added
+        self.uid = None
+        self.source_id = None
+        self.fav_id = None
+        self.url_kind = None
+        # 新视频已放入写入队列、还没有写完，写完后才记为已知
+        self.pending_write = False
+
+    @property
+    def key(self):
+        return f"{self.collection_url} -> {self.fav_url}"
+
+    def to_dict(self):
+        return {
+            'collection_url': self.collection_url,
+            'fav_url': self.fav_url,
+            'interval': round(self.interval, 1),
+            'known_aids': self.known_aids,
+            'next_poll': round(self.next_poll, 1),
+            'polls': self.polls,
+            'changes': self.changes,
+            'added': self.added,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['collection_url'], data['fav_url'], data.get('interval', DEFAULT_INTERVAL),
+                   data.get('known_aids'), data.get('next_poll', 0.0), data.get('polls', 0),
+                   data.get('changes', 0), data.get('added', 0))
+
+
+class WatchDaemon:
+    """
+    长期运行的增量同步
+    调度器按每个订阅的下次轮询时间依次轮询：只获取最新一页，遇到已知的aid即停止，
+    新视频放入写入队列，由单独的写入线程添加到收藏夹
+    所有订阅共享同一个客户端的限速器，轮询间隔的下限保证轮询总速率不超过读配额的POLL_BUDGET_SHARE
+    """
+
+    def __init__(self, client, subscriptions, state_file=WATCH_STATE_FILE, workers=POLL_WORKERS):
+        """
+        :param client: FromListsToFavlist实例
+        :param subscriptions: Subscription列表
+        :param state_file: 保存轮询状态的JSON文件
+        :param workers: 同时进行的轮询数
+        """
+        self.client = client
+        self.subscriptions = subscriptions
+        self.state_file = state_file
+        self.workers = workers
+        self.writes = queue.Queue()
+        self.stop_event = threading.Event()
+        self.state_lock = threading.Lock()
+
+    @classmethod
+    def from_jobs(cls, client, jobs, state_file=WATCH_STATE_FILE, workers=POLL_WORKERS):
+        """
+        根据 (合集URL, 收藏夹URL) 列表创建，已有的订阅沿用状态文件中的轮询状态
+        新订阅的首次轮询时间随机分散，避免同时启动
+        """
+        saved = {}
+        if os.path.exists(state_file):
+            with open(state_file, 'r', encoding='utf-8') as f:
+                for data in json.load(f).get('subscriptions', []):
+                    subscription = Subscription.from_dict(data)
+                    saved[subscription.key] = subscription
+
+        now = time.time()
+        subscriptions = []
+        for collection_url, fav_url in jobs:
+            subscription = saved.get(f"{collection_url} -> {fav_url}")
+            if subscription is None:
+                subscription = Subscription(collection_url, fav_url,
+                                            next_poll=now + random.uniform(0, len(jobs) / cls._poll_rate(client)))
+            subscriptions.append(subscription)
+        return cls(client, subscriptions, state_file, workers)
+
+    @staticmethod
+    def _poll_rate(client):
+        """
+        :return: 轮询允许使用的请求速率（每秒）
+        """
+        return max(client.rate_limiter.max_rates['read'] * POLL_BUDGET_SHARE, 0.01)
+
+    def min_interval(self):
+        """
+        轮询间隔的下限：订阅数量较多时加大，保证所有订阅的轮询总速率不超过配额
+        """
+        return max(MIN_INTERVAL, len(self.subscriptions) / self._poll_rate(self.client))
+
+    def save_state(self):
+        """
+        原子地写入轮询状态
+        """
+        with self.state_lock:
+            state = {'subscriptions': [subscription.to_dict() for subscription in self.subscriptions]}
+            temp_file = f"{self.state_file}.tmp"
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False, indent=2)
+            os.replace(temp_file, self.state_file)
+        self.client.save_session_state()
+
+    def _resolve(self, subscription):
+        client = self.client
+        if subscription.uid is None:
+            subscription.uid, subscription.source_id = client.extract_season_info(subscription.collection_url)
+            subscription.fav_id = client.extract_fav_info(subscription.fav_url)
+            subscription.url_kind = client.classify_source_url(subscription.collection_url)
+
+    def _source_kind(self, subscription):
+        endpoint = self.client.source_endpoints(subscription.uid, subscription.source_id, subscription.url_kind)[0]
+        return ENDPOINT_KINDS[endpoint]
+
+    def _fetch_newest_page(self, subscription, kind, page):
+        client = self.client
+        if kind == 'season':
+            data = client._fetch_season_page(subscription.uid, subscription.source_id, page,
+                                             client.season_page_size, reverse=True)
+            return data, client.season_page_size
+        data = client._fetch_series_page(subscription.uid, subscription.source_id, page,
+                                         client.series_page_size, sort='desc')
+        return data, client.series_page_size
+
+    def poll_newest(self, subscription, max_pages=MAX_POLL_PAGES):
+        """
+        按最新在前的顺序获取，遇到已知的aid即停止
+        :param max_pages: 最多获取的页数
+        :return: (新视频列表（最新在前）, 最新一页的aid列表)，
+                 超过max_pages页仍未遇到已知视频时返回 (None, 最新一页的aid列表)
+        """
+        kind = self._source_kind(subscription)
+        known = set(subscription.known_aids)
+        new_videos = []
+        newest_aids = None
+
+        for page in range(1, max_pages + 1):
+            data, page_size = self._fetch_newest_page(subscription, kind, page)
+            if data['code'] != 0 or not data.get('data'):
+                raise RuntimeError(data.get('message', '未知错误'))
+
+            archives = data['data'].get('archives') or []
+            if newest_aids is None:
+                newest_aids = [video['aid'] for video in archives]
+                # 服务器可能限制每页数量，按它实际使用的数量判断列表是否到末尾
+                page_info = data['data'].get('page') or {}
+                served = self.client._served_page_size(page_info.get('page_size') or page_info.get('size'),
+                                                       page_info.get('total'), archives, page_size)
+
+            for video in archives:
+                if video['aid'] in known:
+                    return new_videos, newest_aids
+                new_videos.append(video_from_archive(video, self.client.keep_pic))
+
+            if len(archives) < served:
+                # 列表已到末尾：没有已知视频时全部都是新视频
+                return new_videos, newest_aids
+
+        return None, newest_aids or []
+
+    def poll(self, subscription):
+        """
+        轮询一个订阅，调整轮询间隔并把新视频放入写入队列
+        新视频写入完成后才加入已知视频，上一次的新视频还在等待写入时跳过本次轮询
+        """
+        now = time.time()
+        if subscription.pending_write:
+            print(f"{subscription.key} 上次发现的新视频还在写入，跳过本次轮询")
+            subscription.next_poll = now + subscription.interval * random.uniform(0.9, 1.1)
+            return
+        try:
+            self._resolve(subscription)
+            if not subscription.known_aids:
+                # 首次轮询：完整转移一次，之后只获取新增的视频
+                print(f"首次同步 {subscription.key}")
+                newest_aids, changed = self._full_transfer(subscription)
+            else:
+                new_videos, newest_aids = self.poll_newest(subscription)
+                if new_videos is None:
+                    print(f"{subscription.key} 新增视频过多，改为完整转移")
+                    newest_aids, changed = self._full_transfer(subscription)
+                else:
+                    changed = bool(new_videos)
+                    if new_videos:
+                        print(f"{subscription.key} 发现 {len(new_videos)} 个新视频")
+                        # 按发布顺序写入，写入完成后由写入线程记为已知
+                        subscription.pending_write = True
+                        self.writes.put((subscription, new_videos[::-1], newest_aids))
+                        newest_aids = None
+
+            self._remember(subscription, newest_aids)
+        except Exception as e:
+            print(f"轮询 {subscription.key} 失败: {str(e)}")
+            changed = False
+
+        subscription.polls += 1
+        if changed:
+            subscription.changes += 1
+            subscription.interval *= INTERVAL_SHRINK
+        else:
+            subscription.interval *= INTERVAL_GROWTH
+        subscription.interval = min(MAX_INTERVAL, max(self.min_interval(), subscription.interval))
+        subscription.next_poll = now + subscription.interval * random.uniform(0.9, 1.1)
+
+    @staticmethod
+    def _remember(subscription, newest_aids):
+        """
+        把最新一页的aid加入已知视频，为None时不更新
+        """
+        if newest_aids is not None:
+            subscription.known_aids = (newest_aids + [aid for aid in subscription.known_aids
+                                                      if aid not in newest_aids])[:KNOWN_AIDS_KEPT]
+
+    def _full_transfer(self, subscription):
+        """
+        完整转移一次
+        只有转移完成（获取到完整的列表并且转移日志标记为完成）后才返回最新一页的aid；
+        登录失败、出错或列表不完整时返回None，不更新已知视频，下次轮询重新完整转移
+        :return: (最新一页的aid列表或None, 是否有变化)
+        """
+        status = {}
+        success, failed = self.client.transfer_collection_to_favorites(
+            subscription.collection_url, subscription.fav_url, status=status)
+        subscription.added += success
+        if not status.get('complete'):
+            print(f"{subscription.key} 完整转移未完成，下次轮询重试")
+            return None, False
+        _, newest_aids = self.poll_newest(subscription, max_pages=1)
+        return newest_aids, True
+
+    def _write_loop(self):
+        while True:
+            item = self.writes.get()
+            if item is None:
+                return
+            subscription, videos, newest_aids = item
+            try:
+                plan = self.client.plan_folder(subscription.fav_id)
+                success, failed = self.client.add_to_favorites(subscription.fav_id, videos, plan=plan)
+                subscription.added += success
+                # 最终失败的视频已写入死信文件，可以用 --replay 重新添加
+                self._remember(subscription, newest_aids)
+            except Exception as e:
+                print(f"写入 {subscription.key} 失败: {str(e)}，下次轮询重新获取这些视频")
+            finally:
+                subscription.pending_write = False
+            self.save_state()
+
+    def run(self, once=False):
+        """
+        运行调度循环，直到stop()或KeyboardInterrupt
+        :param once: 每个订阅只轮询一次后返回
+        """
+        writer = threading.Thread(target=self._write_loop, daemon=True)
+        writer.start()
+
+        heap = [(subscription.next_poll, i) for i, subscription in enumerate(self.subscriptions)]
+        heapq.heapify(heap)
+        in_flight = set()
+        lock = threading.Lock()
+        done = threading.Condition(lock)
+
+        def run_poll(i):
+            try:
+                self.poll(self.subscriptions[i])
+                self.save_state()
+            finally:
+                with done:
+                    in_flight.discard(i)
+                    if not once:
+                        heapq.heappush(heap, (self.subscriptions[i].next_poll, i))
+                    done.notify_all()
+
+        print(f"开始监视 {len(self.subscriptions)} 个订阅，最短轮询间隔 {int(self.min_interval())} 秒")
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                while not self.stop_event.is_set():
+                    with done:
+                        if once and not heap and not in_flight:
+                            break
+                        if not heap or len(in_flight) >= self.workers:
+                            done.wait(1.0)
+                            continue
+                        next_poll, i = heap[0]
+                        delay = next_poll - time.time() if not once else 0
+                        if delay > 0:
+                            done.wait(min(delay, 1.0))
+                            continue
+                        heapq.heappop(heap)
+                        in_flight.add(i)
+                    executor.submit(run_poll, i)
+        except KeyboardInterrupt:
+            print("\n停止监视...")
+            self.stop_event.set()
+        finally:
+            self.writes.put(None)
+            writer.join()
+            self.save_state()
+
+    def stop(self):
+        self.stop_event.set()